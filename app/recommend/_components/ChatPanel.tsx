@@ -2,6 +2,7 @@
 
 import React, { useEffect, useRef, useState } from "react";
 import { API_BASE } from "@/constants";
+import { getSessionId } from "@/utils";
 import type { ChatRecommendation } from "../page";
 import type { Theme } from "../_types/theme";
 
@@ -36,6 +37,86 @@ function fmtIDR(v?: number | null) {
   }).format(v);
 }
 
+// Mode state di server: client hanya kirim session_id + state_version, server
+// balas state_diff. Sesi tidak dikenal server (kedaluwarsa / worker lain) ->
+// 409 session_unknown -> kirim ulang sekali dengan state lokal sebagai seed.
+const SERVER_STATE = process.env.NEXT_PUBLIC_CHAT_SERVER_STATE === "1";
+
+type ServerSession = { id: string; version: number | null };
+
+function chatBody(
+  message: string,
+  state: ConversationState | null,
+  server: ServerSession,
+  seed = false
+) {
+  if (!SERVER_STATE) return { message, state, session_id: getSessionId() };
+  return {
+    message,
+    session_id: server.id || getSessionId(),
+    server_state: true,
+    state_version: server.version,
+    ...(seed ? { state } : {}),
+  };
+}
+
+async function isSessionUnknown(res: Response): Promise<boolean> {
+  if (res.status !== 409) return false;
+  try {
+    const j = await res.json();
+    return j?.detail?.code === "session_unknown";
+  } catch {
+    return false;
+  }
+}
+
+function nextState(prev: ConversationState, json: any): ConversationState {
+  if (json?.state) return json.state;
+  if (json?.state_diff) return { ...prev, ...json.state_diff };
+  return prev;
+}
+
+/**
+ * Baca respons SSE /chat/stream: event `token` ({ t }) diteruskan ke onToken
+ * saat tiba, event `final` berisi respons lengkap yang sama dengan /chat.
+ */
+async function readChatStream(
+  res: Response,
+  onToken: (t: string) => void
+): Promise<any> {
+  const reader = res.body!.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  let final: any = null;
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+
+    let sep: number;
+    while ((sep = buf.indexOf("\n\n")) >= 0) {
+      const frame = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+
+      const json = JSON.parse(data);
+      if (event === "token") onToken(json.t ?? "");
+      else if (event === "final") final = json;
+    }
+  }
+
+  if (!final) throw new Error("stream terputus");
+  return final;
+}
+
 const loadingTexts = [
   "Mencocokkan kebutuhan Anda...",
   "Menyaring mobil terbaik...",
@@ -67,11 +148,14 @@ export default function ChatPanel({
   });
 
   const listRef = useRef<HTMLDivElement | null>(null);
+  // session_id + versi state terakhir dari server (mode SERVER_STATE)
+  const serverRef = useRef<ServerSession>({ id: "", version: null });
 
   /* ---------- LOAD STORAGE ---------- */
   useEffect(() => {
     const savedMsgs = localStorage.getItem("vroom_msgs");
     const savedState = localStorage.getItem("vroom_state");
+    const savedVersion = localStorage.getItem("vroom_state_version");
 
     if (savedMsgs) {
       setMessages(JSON.parse(savedMsgs));
@@ -89,6 +173,9 @@ export default function ChatPanel({
     if (savedState) {
       setChatState(JSON.parse(savedState));
     }
+    if (savedVersion) {
+      serverRef.current.version = Number(savedVersion) || null;
+    }
   }, []);
 
   /* ---------- SAVE STORAGE ---------- */
@@ -118,6 +205,16 @@ export default function ChatPanel({
 
   /* ================== SEND ================== */
 
+  // simpan session_id + state_version balasan server untuk giliran berikutnya
+  const rememberServerSession = (json: any) => {
+    if (!SERVER_STATE) return;
+    if (json?.session_id) serverRef.current.id = json.session_id;
+    if (typeof json?.state_version === "number") {
+      serverRef.current.version = json.state_version;
+      localStorage.setItem("vroom_state_version", String(json.state_version));
+    }
+  };
+
   const handleSend = async (text?: string) => {
     const final = (text ?? input).trim();
     if (!final || isSending) return;
@@ -130,15 +227,37 @@ export default function ChatPanel({
     );
 
     try {
-      const res = await fetch(`${API_BASE}/chat`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: final, state: chatState }),
-      });
+      const post = (seed: boolean) =>
+        fetch(`${API_BASE}/chat/stream`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(chatBody(final, chatState, serverRef.current, seed)),
+        });
+
+      let res = await post(false);
+      if (SERVER_STATE && (await isSessionUnknown(res))) {
+        // server kehilangan sesi ini: satu kali kirim ulang dengan state lokal
+        res = await post(true);
+      }
 
       if (!res.ok) throw new Error("API Error");
 
-      const json = await res.json();
+      // mode analyst: token langsung tampil di satu bubble bot yang terus bertambah
+      let streamed = false;
+      const json = await readChatStream(res, (t) => {
+        if (!streamed) {
+          streamed = true;
+          setIsSending(false);
+          setMessages((p) => [...p, { from: "bot", text: t }]);
+        } else {
+          setMessages((p) => {
+            const last = p[p.length - 1];
+            return [...p.slice(0, -1), { ...last, text: last.text + t }];
+          });
+        }
+      });
+
+      rememberServerSession(json);
 
       /* ===== CLEAR / RESET VIA CHAT ===== */
       const cmd = final.toLowerCase();
@@ -153,16 +272,21 @@ export default function ChatPanel({
 
         setMessages([{ from: "bot", text: json.reply }]);
 
-        if (json.state) setChatState(json.state);
+        setChatState((p) => nextState(p, json));
 
         setIsSending(false);
         return; // ⬅️ STOP FLOW NORMAL
       }
 
       /* ===== NORMAL BOT REPLY ===== */
-      setMessages((p) => [...p, { from: "bot", text: json.reply }]);
+      // bubble hasil stream diganti teks final (sumber kebenaran dari server)
+      setMessages((p) =>
+        streamed
+          ? [...p.slice(0, -1), { from: "bot", text: json.reply }]
+          : [...p, { from: "bot", text: json.reply }]
+      );
 
-      if (json.state) setChatState(json.state);
+      setChatState((p) => nextState(p, json));
 
       /* ===== RECOMMENDATION ===== */
       if (json.recommendation) {
@@ -212,15 +336,17 @@ export default function ChatPanel({
       const res = await fetch(`${API_BASE}/chat`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: "reset", state: null }),
+        // reset tidak butuh state lama -> tanpa state_version (tidak ada 409)
+        body: JSON.stringify(chatBody("reset", null, { ...serverRef.current, version: null })),
       });
 
       if (!res.ok) throw new Error("reset error");
 
       const json = await res.json();
 
+      rememberServerSession(json);
       setMessages((p) => [...p, { from: "bot", text: json.reply }]);
-      if (json.state) setChatState(json.state);
+      setChatState((p) => nextState(p, json));
     } catch {
       setMessages((p) => [
         ...p,
@@ -2,14 +2,17 @@
 
 import { DataStatus } from "@/components/ui/DataStatus";
 import { API_BASE } from "@/constants";
+import type { RecommendResponse } from "@/types";
 import type { Theme } from "../_types/theme";
 
 export function DevPanel({
   theme,
   dataReady,
+  data,
 }: {
   theme: Theme;
   dataReady: { specs: boolean; retail: boolean; wholesale: boolean };
+  data?: RecommendResponse | null;
 }) {
   // Pastikan environment variable diset ke "1" di .env.local untuk melihat ini
   if (process.env.NEXT_PUBLIC_DEBUG !== "1") return null;
@@ -45,6 +48,17 @@ export function DevPanel({
             {API_BASE}
           </code>
         </div>
+
+        {/* Payload lengkap item teratas (request dikirim dengan debug=true) */}
+        {data?.items?.[0] && (
+          <pre className={`mt-3 max-h-80 overflow-auto text-[11px] font-mono p-2 rounded ${
+              isDark
+              ? "bg-teal-950/50 text-teal-300 border border-teal-900"
+              : "bg-teal-50 text-teal-700 border border-teal-100"
+          }`}>
+            {JSON.stringify(data.items[0], null, 2)}
+          </pre>
+        )}
       </details>
     </section>
   );
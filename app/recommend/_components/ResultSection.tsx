@@ -78,6 +78,7 @@ export function ResultsSection({ theme, loading, error, data, onBackToForm, onCa
     const emptyHint: any = data && (data as any).hint ? (data as any).hint : null;
     const filtersSummary: any = emptyHint?.filters_summary ?? null;
     const needsDiag: any[] = emptyHint?.needs_diag ?? [];
+    const relaxations: any[] = emptyHint?.relaxations ?? [];
 
     const cards = useMemo(() => {
         if (!data?.items?.length) return [];
@@ -185,6 +186,19 @@ export function ResultsSection({ theme, loading, error, data, onBackToForm, onCa
                         : "Belum Ada Mobil yang Cocok dengan Kriteria Saat Ini"
                         : "Hasil Rekomendasi"}
                 </h2>
+                {/* Hasil dari grid /recommendations/sweep (gerakan slider budget): perkiraan, bukan ranking penuh */}
+                {!loading && data?.approx && safeCount > 0 && (
+                    <p className="flex items-center gap-2 text-sm text-neutral-400">
+                        <span
+                            className={`rounded-md px-2 py-0.5 text-xs font-semibold ${
+                                isDark ? "bg-amber-900/50 text-amber-200" : "bg-amber-100 text-amber-800"
+                            }`}
+                        >
+                            pratinjau
+                        </span>
+                        Perkiraan untuk budget ini; tekan &quot;Tampilkan Rekomendasi&quot; untuk hasil lengkap.
+                    </p>
+                )}
             </div>
 
             {loading ? (
@@ -216,12 +230,32 @@ export function ResultsSection({ theme, loading, error, data, onBackToForm, onCa
                              const r = emptyHint?.reason as string | undefined;
                              return (
                                 <p className="text-sm text-neutral-400">
-                                     Silakan sesuaikan filter atau naikkan budget.
+                                     {r && r !== "ERROR" && emptyHint?.message
+                                        ? emptyHint.message
+                                        : "Silakan sesuaikan filter atau naikkan budget."}
                                 </p>
                              );
                         })()}
 
-                        {/* ... (Paste logika filtersSummary & needsDiag di sini) ... */}
+                        {/* Relaksasi termurah dari backend (spk_relax): perubahan satu langkah + jumlah mobil */}
+                        {relaxations.length > 0 && (
+                            <ul className="mt-4 mx-auto max-w-md space-y-2 text-left text-sm">
+                                {relaxations.slice(0, 4).map((x: any, i: number) => (
+                                    <li
+                                        key={`${x.kind}-${i}`}
+                                        className={`flex items-center justify-between gap-3 rounded-xl px-3 py-2 ${
+                                            isDark ? "bg-teal-950/40 text-teal-100" : "bg-teal-50 text-teal-800"
+                                        }`}
+                                    >
+                                        <span>{x.label}</span>
+                                        <span className="whitespace-nowrap text-xs opacity-80">
+                                            {x.exact ? "" : "±"}
+                                            {x.count} mobil
+                                        </span>
+                                    </li>
+                                ))}
+                            </ul>
+                        )}
 
                         <div className="mt-5">
                             <button
@@ -124,7 +124,7 @@ export default function RecommendPage() {
                     )}
                 </AnimatePresence>
 
-                <DevPanel theme={theme} dataReady={dataReady} />
+                <DevPanel theme={theme} dataReady={dataReady} data={data} />
             </main>
 
             <div aria-hidden className="pointer-events-none absolute inset-0 z-0">
@@ -1,19 +1,40 @@
 # file: backend/app.py
 from __future__ import annotations
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 
-from .images import reload_images
+from .compression import CompressionMiddleware
 from .meta_routes import router as meta_router
 from .recommend_routes import router as recommend_router
 from .chat_routes import router as chat_router
+from .config import WARMUP_MODE
+from .warmup import WARMUP, run_warmup, start_warmup_background
 
 load_dotenv()
 
-app = FastAPI(title="Rekomendasi Mobil API (JSON)", version="1.3.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warmup: master, fitur, statistik, model klaster, indeks gambar, sklearn.
+    #   background -> server langsung menerima koneksi, /ready 503 sampai selesai
+    #   blocking   -> startup menunggu warmup selesai
+    #   off        -> semua dimuat lazy oleh request pertama; /ready 200 bila master bisa dimuat
+    if WARMUP_MODE == "blocking":
+        await asyncio.to_thread(run_warmup)
+    elif WARMUP_MODE == "off":
+        WARMUP.mark_off()
+    else:
+        start_warmup_background()
+    yield
+
+
+app = FastAPI(title="Rekomendasi Mobil API (JSON)", version="1.3.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,8 +44,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Reindeks gambar saat start
-print(f"[images] reindexed:", reload_images())
+# Kompresi gzip/brotli (ambang ukuran & opt-out: lihat compression.py / config.py)
+app.add_middleware(CompressionMiddleware)
 
 
 @app.get("/", include_in_schema=False)
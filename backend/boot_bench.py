@@ -0,0 +1,110 @@
+# file: backend/boot_bench.py
+# Profil waktu impor + benchmark boot worker.
+#
+#   python -m backend.boot_bench                      # impor backend.app, budget dari BOOT_BUDGET_MS
+#   python -m backend.boot_bench --budget-ms 800 --runs 5
+#   python -m backend.boot_bench -m backend.images -m backend.loaders --top 10
+#
+# Setiap modul diimpor di interpreter baru (cache modul bersih), median dari
+# --runs percobaan dibandingkan dengan budget; exit code 1 bila ada yang lewat.
+# Profil diambil dari `python -X importtime` (kumulatif per modul, top-N).
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_BUDGET_MS = float(os.environ.get("BOOT_BUDGET_MS", "1500"))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _timed_import(module: str) -> float:
+    """Waktu (ms) impor `module` di interpreter baru, diukur di dalam proses anak."""
+    code = (
+        "import time; t0 = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - t0) * 1000.0)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    # baris terakhir stdout = angka; modul bisa saja mencetak log sendiri
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def import_profile(module: str) -> List[Tuple[str, float, float]]:
+    """[(modul, self_ms, cumulative_ms)] dari -X importtime, urut kumulatif menurun."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    rows: Dict[str, Tuple[float, float]] = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = [p.strip() for p in line.split(":", 1)[1].split("|")]
+        if len(parts) != 3:
+            continue
+        self_us, cum_us, name = parts
+        try:
+            rows[name] = (int(self_us) / 1000.0, int(cum_us) / 1000.0)
+        except ValueError:
+            continue
+    return sorted(((n, s, c) for n, (s, c) in rows.items()), key=lambda r: -r[2])
+
+
+def _top_level(profile: List[Tuple[str, float, float]], top: int) -> List[Tuple[str, float, float]]:
+    """Top-N paket akar (bukan submodul) supaya laporan tidak dobel hitung."""
+    seen = set()
+    out = []
+    for name, self_ms, cum_ms in profile:
+        root = name.split(".")[0]
+        if root in seen:
+            continue
+        seen.add(root)
+        out.append((root if root != name else name, self_ms, cum_ms))
+        if len(out) >= top:
+            break
+    return out
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Profil impor & budget waktu boot worker.")
+    ap.add_argument("-m", "--module", action="append", dest="modules",
+                    help="modul yang diukur (boleh berulang). Default: backend.app")
+    ap.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                    help=f"budget median waktu impor per modul (default {DEFAULT_BUDGET_MS:.0f}, env BOOT_BUDGET_MS)")
+    ap.add_argument("--runs", type=int, default=3, help="jumlah percobaan per modul (median)")
+    ap.add_argument("--top", type=int, default=15, help="jumlah baris profil yang ditampilkan")
+    ap.add_argument("--no-profile", action="store_true", help="lewati laporan -X importtime")
+    args = ap.parse_args(argv)
+
+    modules = args.modules or ["backend.app"]
+    failed = False
+    for mod in modules:
+        if not args.no_profile:
+            prof = import_profile(mod)
+            print(f"\n[PROFILE] {mod} — top {args.top} paket (kumulatif)")
+            print(f"{'paket':40s} {'self ms':>9s} {'kumulatif ms':>13s}")
+            for name, self_ms, cum_ms in _top_level(prof, args.top):
+                print(f"{name:40s} {self_ms:9.1f} {cum_ms:13.1f}")
+
+        times = [_timed_import(mod) for _ in range(max(1, args.runs))]
+        med = statistics.median(times)
+        ok = med <= args.budget_ms
+        failed |= not ok
+        status = "OK" if ok else "LEWAT BUDGET"
+        print(
+            f"[BOOT] {mod}: median={med:.0f}ms min={min(times):.0f}ms max={max(times):.0f}ms "
+            f"budget={args.budget_ms:.0f}ms -> {status}"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# file: backend/cancellation.py
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict
+
+from .config import DISCONNECT_POLL_MS
+
+# ============================================================
+# Pembatalan ranking saat client memutus koneksi
+# ============================================================
+# Endpoint menjalankan ranking di threadpool sambil memantau koneksi
+# (request.is_disconnected). Bila client putus, CancelToken dibatalkan dan
+# rank_candidates berhenti di cek antar-tahap berikutnya (RankCancelled).
+# Slider budget yang digeser cepat -> request lama dibatalkan browser
+# (AbortController) -> CPU tidak habis untuk hasil yang tidak dibaca.
+
+
+class RankCancelled(Exception):
+    """Ranking dihentikan karena token dibatalkan (mis. client putus)."""
+
+    def __init__(self, stage: str, reason: str = ""):
+        super().__init__(f"dibatalkan sebelum tahap '{stage}' ({reason})")
+        self.stage = stage
+        self.reason = reason
+
+
+class CancelToken:
+    __slots__ = ("_event", "reason")
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = ""
+
+    def cancel(self, reason: str = "client_disconnect") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self, stage: str) -> None:
+        """Dipanggil di antara tahap pipeline; raise RankCancelled bila dibatalkan."""
+        if self._event.is_set():
+            raise RankCancelled(stage, self.reason)
+
+
+async def await_with_disconnect(request: Any, fut: "asyncio.Future[Any]", token: CancelToken) -> Any:
+    """
+    Tunggu fut sambil memantau koneksi client setiap DISCONNECT_POLL_MS;
+    client putus -> token.cancel(). Tetap menunggu fut selesai (pekerjaan
+    berhenti sendiri di cek tahap berikutnya) lalu meneruskan hasil/exception.
+    """
+    poll_s = max(0.005, DISCONNECT_POLL_MS / 1000.0)
+    while True:
+        done, _ = await asyncio.wait({fut}, timeout=poll_s)
+        if done:
+            return fut.result()
+        if request is not None and not token.cancelled and await request.is_disconnected():
+            print("[CANCEL] client putus -> ranking dibatalkan")
+            token.cancel("client_disconnect")
+
+
+async def run_until_disconnect(request: Any, fn: Callable[[], Any], token: CancelToken) -> Any:
+    """Jalankan fn() (sync, memakai token) di threadpool dengan pemantauan koneksi."""
+    from starlette.concurrency import run_in_threadpool
+
+    return await await_with_disconnect(request, asyncio.ensure_future(run_in_threadpool(fn)), token)
+
+
+class CancelStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cancelled = 0
+        self.by_stage: Dict[str, int] = {}
+
+    def record(self, exc: RankCancelled) -> None:
+        with self._lock:
+            self.cancelled += 1
+            self.by_stage[exc.stage] = self.by_stage.get(exc.stage, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cancelled": self.cancelled, "by_stage": dict(self.by_stage)}
+
+
+CANCEL_STATS = CancelStats()
+
@@ -0,0 +1,392 @@
+# file: backend/chat_nlu.py
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from .config import NLU_RULE_MIN_CONF
+
+# ============================================================
+# Kamus kebutuhan
+# ============================================================
+
+# Kebutuhan kanonis yang dipakai SPK
+VALID_NEEDS = {"perkotaan", "perjalanan_jauh", "keluarga", "fun", "offroad", "niaga"}
+
+# Map common aliases/phrases to canonical needs
+CANONICAL_NEEDS = {
+    # perkotaan
+    "perkotaan": "perkotaan",
+    "harian": "perkotaan",
+    "pemakaian harian": "perkotaan",
+    "harian di kota": "perkotaan",
+    "kota": "perkotaan",
+    "macet": "perkotaan",
+    "irit": "perkotaan",
+    "gampang parkir": "perkotaan",
+    "masuk gang": "perkotaan",
+    "sempit": "perkotaan",
+
+    # perjalanan jauh
+    "perjalanan_jauh": "perjalanan_jauh",
+    "mudik": "perjalanan_jauh",
+    "luar kota": "perjalanan_jauh",
+    "tol": "perjalanan_jauh",
+    "roadtrip": "perjalanan_jauh",
+
+    # keluarga
+    "keluarga": "keluarga",
+    "anak": "keluarga",
+    "7 seater": "keluarga",
+    "7-seater": "keluarga",
+    "7seater": "keluarga",
+
+    # fun
+    "fun": "fun",
+    "sport": "fun",
+    "ngebut": "fun",
+    "gaya": "fun",
+
+    # offroad
+    "offroad": "offroad",
+    "medan berat": "offroad",
+    "segala medan": "offroad",
+    "gunung": "offroad",
+    "banjir": "offroad",
+    "proyek": "offroad",
+    "jalan rusak": "offroad",
+    "jalan jelek": "offroad",
+    "jalan jelek": "offroad",
+
+    # niaga
+    "niaga": "niaga",
+    "usaha": "niaga",
+    "angkut": "niaga",
+    "barang": "niaga",
+    "pickup": "niaga",
+}
+
+
+# Frasa kondisi lingkungan (state.env) dari teks mentah
+ENV_PHRASES = {
+    "jalan rusak": "bad_road",
+    "jalan jelek": "bad_road",
+    "jalan bergelombang": "bad_road",
+    "jalan berlubang": "bad_road",
+    "jalan tidak rata": "bad_road",
+    "jalan banyak lubang": "bad_road",
+    "banjir": "flood_prone",
+    "sering banjir": "flood_prone",
+    "naik barang": "cargo_need",
+    "angkut barang": "cargo_need",
+    "usaha": "cargo_need",
+}
+# "jalan(an/nya) ... rusak" dengan kata sisipan sepanjang apa pun dalam satu
+# kalimat ("jalan ke rumah nenek di desa yang jauh itu rusak"), seperti regex
+# lama `jalan.*rusak`: lookahead -> hanya "jalan" yang dikonsumsi, kata di
+# antaranya tetap dipindai untuk kebutuhan lain
+_BAD_ROAD_GAP = (
+    r"jalan\w*(?=[^.!?\n]*?\s(?:rusak|jelek|bergelombang|berlubang|tidak rata|banyak lubang)\b)"
+)
+
+
+# ============================================================
+# Multi-pattern matcher (satu alternation terkompilasi)
+# ============================================================
+
+Tags = FrozenSet[Tuple[str, str]]
+
+
+class PhraseMatcher:
+    """
+    Semua frasa digabung jadi satu regex alternation (terpanjang dulu) dengan
+    batas kata -> satu pass per teks, leftmost-longest, deterministik.
+    Setiap frasa membawa tag {(kategori, nilai)}. Pola mentah di `extra` dicoba
+    setelah frasa literal dan tidak boleh memakai grup penangkap.
+    """
+
+    def __init__(self, phrases: Dict[str, Tags], extra: Sequence[Tuple[str, Tags]] = ()):
+        lits = sorted(phrases, key=lambda p: (-len(p), p))
+        alts = [re.escape(p) for p in lits] + [pat for pat, _ in extra]
+        self._tags: List[Tags] = [phrases[p] for p in lits] + [tags for _, tags in extra]
+        self._re = re.compile(r"\b(?:" + "|".join(f"({a})" for a in alts) + r")\b")
+
+    def scan(self, t: str) -> List[Tuple[int, int, Tags]]:
+        """[(start, end, tags)] tanpa tumpang tindih, urut posisi."""
+        return [(m.start(), m.end(), self._tags[m.lastindex - 1]) for m in self._re.finditer(t)]
+
+
+def _table_matcher(category: str, table: Dict[str, str]) -> PhraseMatcher:
+    return PhraseMatcher({p: frozenset({(category, v)}) for p, v in table.items()})
+
+
+def _merge_categories(categories: Dict[str, Dict[str, str]]) -> Dict[str, Tags]:
+    """
+    Gabung beberapa kamus frasa. Frasa yang memuat frasa kategori lain ikut
+    membawa tag kategori itu ("sering banjir" [env] -> juga offroad [need]);
+    di dalam satu kategori frasa terpanjang tetap menang ("luar kota" bukan "kota").
+    """
+    merged: Dict[str, set] = {}
+    for cat, table in categories.items():
+        for p, v in table.items():
+            merged.setdefault(p, set()).add((cat, v))
+    for cat, table in categories.items():
+        sub = _table_matcher(cat, table)
+        for p, tags in merged.items():
+            if any(c == cat for c, _ in tags):
+                continue
+            for _, _, t in sub.scan(p):
+                tags |= t
+    return {p: frozenset(t) for p, t in merged.items()}
+
+
+# kebutuhan + flag lingkungan dalam satu pass
+TEXT_MATCHER = PhraseMatcher(
+    _merge_categories({"need": CANONICAL_NEEDS, "env": ENV_PHRASES}),
+    extra=[(_BAD_ROAD_GAP, frozenset({("env", "bad_road")}))],
+)
+
+
+def scan_text(t: str) -> Tuple[List[str], List[Tuple[int, int]], Dict[str, bool]]:
+    """
+    Satu pass atas teks (huruf kecil): (needs urut kemunculan, span frasa
+    kebutuhan, flag env).
+    """
+    needs: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    env: Dict[str, bool] = {}
+    for a, b, tags in TEXT_MATCHER.scan(t):
+        is_need = False
+        for cat, val in sorted(tags):
+            if cat == "need":
+                needs.append(val)
+                is_need = True
+            else:
+                env[val] = True
+        if is_need:
+            spans.append((a, b))
+    return list(dict.fromkeys(needs)), spans, env
+
+
+def detect_env_flags(text: str) -> Dict[str, bool]:
+    return scan_text((text or "").lower())[2]
+
+
+# normalisasi token kebutuhan hasil NLU: alias sebagai substring (tanpa batas
+# kata, "sporty" -> fun) lalu token sebagai potongan alias ("luar" -> luar kota)
+_NEED_SUBSTR_RE = re.compile(
+    "|".join(re.escape(a) for a in sorted(CANONICAL_NEEDS, key=lambda a: (-len(a), a)))
+)
+_ALIASES = list(CANONICAL_NEEDS)
+_ALIAS_BLOB = "\x00".join(_ALIASES)
+_ALIAS_STARTS: List[int] = []
+_pos = 0
+for _a in _ALIASES:
+    _ALIAS_STARTS.append(_pos)
+    _pos += len(_a) + 1
+del _pos, _a
+
+
+def need_for_token(t: str) -> Optional[str]:
+    """Token huruf kecil -> kebutuhan kanonis (alias di dalam token, lalu token di dalam alias)."""
+    if not t:
+        return None
+    m = _NEED_SUBSTR_RE.search(t)
+    if m:
+        return CANONICAL_NEEDS[m.group(0)]
+    i = _ALIAS_BLOB.find(t)
+    if i >= 0:
+        return CANONICAL_NEEDS[_ALIASES[bisect.bisect_right(_ALIAS_STARTS, i) - 1]]
+    return None
+
+
+# ============================================================
+# NLU berbasis aturan (fast-path sebelum LLM)
+# ============================================================
+# Menghasilkan dict dengan skema yang sama seperti output LLM (SYSTEM_PROMPT_NLU):
+#   {"intent", "budget", "needs", "filters": {"brand", "trans", "fuel"}}
+# plus `confidence` = porsi kata pesan yang "terjelaskan" oleh entitas yang
+# dikenali atau kata pengisi. Pesan pendek & terstruktur ("300 juta",
+# "keluarga, matic", "iya") -> confidence tinggi -> LLM tidak dipanggil.
+
+# angka + satuan rupiah; angka polos hanya dianggap budget saat ASK_BUDGET
+_BUDGET_UNIT_RE = re.compile(
+    r"(?:rp\.?\s*)?(\d+(?:[.,]\d+)?)\s*(jt|juta|m|miliar|milyar|b|rb|ribu)\b", re.I
+)
+_BUDGET_RP_RE = re.compile(r"\brp\.?\s*(\d{1,3}(?:[.,]\d{3})+|\d{7,})\b", re.I)
+_BARE_NUMBER_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*$")
+
+_TRANS_WORDS = {
+    "matic": "matic", "metik": "matic", "otomatis": "matic", "automatic": "matic",
+    "at": "matic", "cvt": "matic", "manual": "manual", "mt": "manual",
+}
+_FUEL_WORDS = {
+    "bensin": "bensin", "gasoline": "bensin", "diesel": "diesel", "solar": "diesel",
+    "hybrid": "hybrid", "hev": "hybrid", "phev": "hybrid", "listrik": "ev",
+    "ev": "ev", "bev": "ev", "electric": "ev",
+}
+_CONFIRM_WORDS = {"iya", "ya", "yes", "betul", "oke", "ok", "lanjut", "sip", "batal"}
+# kata negasi: jawaban konfirmasi saja ("tidak", "gak") tetap konfirmasi, tapi bila
+# pesan juga memuat entitas ("tidak mau diesel", "selain toyota") aturan tidak
+# tahu entitas mana yang dinegasi -> confidence 0, giliran diserahkan ke LLM
+_NEGATION_WORDS = {"tidak", "gak", "nggak", "enggak", "bukan", "jangan", "selain", "tanpa", "kecuali"}
+# kata pengisi yang tidak mengubah makna pencarian
+_FILLER_WORDS = {
+    "mau", "ingin", "pengen", "cari", "carikan", "nyari", "mobil", "yang", "buat", "untuk",
+    "dan", "atau", "sama", "dengan", "pakai", "pake", "budget", "bujet", "dana", "sekitar",
+    "maksimal", "max", "maks", "kisaran", "di", "ke", "kak", "min", "saya", "aku", "gue",
+    "dong", "ya", "nih", "aja", "saja", "tolong", "bisa", "ada", "punya", "kira", "kira-kira",
+    "harga", "sampai", "sampe", "dibawah", "bawah", "kurang", "lebih", "dari", "rp", "transmisi",
+    "bahan", "bakar", "merk", "merek", "brand", "tipe", "jenis", "sering", "biasanya", "dipakai",
+    "kebutuhan", "the", "a", "juga", "sih", "deh", "kok", "yg", "utk", "dgn", "tapi",
+}
+_WORD_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)?")
+
+
+def _parse_amount(num: str, unit: str) -> Optional[float]:
+    try:
+        v = float(num.replace(",", "."))
+    except ValueError:
+        return None
+    unit = (unit or "").lower()
+    if unit in ("m", "miliar", "milyar", "b"):
+        return v * 1_000_000_000
+    if unit in ("jt", "juta"):
+        return v * 1_000_000
+    if unit in ("rb", "ribu"):
+        return v * 1_000
+    return v
+
+
+def _find_budget(t: str, step: str) -> Tuple[Optional[float], List[Tuple[int, int]]]:
+    m = _BUDGET_UNIT_RE.search(t)
+    if m:
+        return _parse_amount(m.group(1), m.group(2)), [m.span()]
+    m = _BUDGET_RP_RE.search(t)
+    if m:
+        return float(re.sub(r"[.,]", "", m.group(1))), [m.span()]
+    if step == "ASK_BUDGET":
+        m = _BARE_NUMBER_RE.match(t)
+        if m:
+            v = float(m.group(1).replace(",", "."))
+            # "300" saat ditanya budget -> 300 juta
+            return (v * 1_000_000 if v < 10_000 else v), [m.span()]
+    return None, []
+
+
+_TRANS_MATCHER = _table_matcher("trans", _TRANS_WORDS)
+_FUEL_MATCHER = _table_matcher("fuel", _FUEL_WORDS)
+
+
+def _find_words(t: str, matcher: PhraseMatcher) -> Tuple[List[str], List[Tuple[int, int]]]:
+    found: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    for a, b, tags in matcher.scan(t):
+        found.extend(v for _, v in tags)
+        spans.append((a, b))
+    return list(dict.fromkeys(found)), spans
+
+
+@lru_cache(maxsize=4)
+def _brand_matcher(brands: Tuple[str, ...]) -> Optional[PhraseMatcher]:
+    if not brands:
+        return None
+    return PhraseMatcher({b.lower(): frozenset({("brand", b)}) for b in brands})
+
+
+def _find_brand(t: str, brands: List[str]) -> Tuple[Optional[str], List[Tuple[int, int]]]:
+    matcher = _brand_matcher(tuple(brands))
+    if matcher is None:
+        return None, []
+    for a, b, tags in matcher.scan(t):
+        return next(iter(tags))[1], [(a, b)]
+    return None, []
+
+
+def rule_based_nlu(text: str, step: str = "INIT", brands: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Ekstraksi deterministik budget / needs / fuel / brand / transmisi.
+    Return dict skema LLM + "confidence" (0..1) + "path"="rules".
+    """
+    t = (text or "").strip().lower()
+    spans: List[Tuple[int, int]] = []
+
+    budget, sp = _find_budget(t, step)
+    spans += sp
+    needs, sp, _ = scan_text(t)
+    spans += sp
+    trans, sp = _find_words(t, _TRANS_MATCHER)
+    spans += sp
+    fuel, sp = _find_words(t, _FUEL_MATCHER)
+    spans += sp
+    brand, sp = _find_brand(t, brands or [])
+    spans += sp
+
+    words = [(m.group(0), m.start()) for m in _WORD_RE.finditer(t)]
+    confirm = bool(words) and all(
+        w in _CONFIRM_WORDS or w in _NEGATION_WORDS or w in _FILLER_WORDS for w, _ in words
+    )
+    negated = any(w in _NEGATION_WORDS for w, _ in words)
+
+    explained = 0
+    for w, pos in words:
+        if w in _FILLER_WORDS or w in _CONFIRM_WORDS or any(a <= pos < b for a, b in spans):
+            explained += 1
+        elif confirm and w in _NEGATION_WORDS:
+            explained += 1
+    coverage = explained / len(words) if words else 0.0
+
+    has_entity = bool(budget or needs or trans or fuel or brand)
+    confidence = coverage if (has_entity or confirm) else 0.0
+    if negated and has_entity:
+        confidence = 0.0
+
+    filters: Dict[str, Any] = {}
+    if brand:
+        filters["brand"] = brand
+    if len(trans) == 1:
+        filters["trans"] = trans[0]
+    if fuel:
+        filters["fuel"] = fuel[0] if len(fuel) == 1 else fuel
+
+    return {
+        "intent": "SEARCH" if has_entity else "OTHER",
+        "budget": budget,
+        "needs": needs,
+        "filters": filters,
+        "confidence": round(confidence, 3),
+        "path": "rules",
+    }
+
+
+def rules_are_confident(result: Dict[str, Any], min_conf: float = NLU_RULE_MIN_CONF) -> bool:
+    return float(result.get("confidence") or 0.0) >= min_conf
+
+
+class NLUPathStats:
+    """Hitungan jalur NLU per giliran (rules / llm / fallback) untuk /metrics."""
+
+    def __init__(self):
+        # run_nlu dipanggil dari threadpool -> increment perlu lock
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.ms: Dict[str, float] = {}
+
+    def record(self, path: str, seconds: float) -> None:
+        with self._lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+            self.ms[path] = self.ms.get(path, 0.0) + seconds * 1000.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, ms = dict(self.counts), dict(self.ms)
+        return {
+            p: {"count": n, "avg_ms": round(ms.get(p, 0.0) / n, 2) if n else None}
+            for p, n in counts.items()
+        }
+
+
+NLU_STATS = NLUPathStats()
@@ -1,42 +1,77 @@
 # file: backend/chat_routes.py
 from __future__ import annotations
+import copy
 import os
 import json
 import re
 import math
 import time
+import asyncio
 import numpy as np  # Wajib import numpy
-from typing import List, Optional, Dict, Any, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from openai import OpenAI
 from dotenv import load_dotenv
 
 # Pastikan fungsi berikut ada di project Anda
-from .spk import rank_candidates
+from .spk import rank_candidates, rank_fingerprint
 from .data_loader import get_master_data
-from .common_utils import attach_images, df_to_items, FUEL_LABEL_MAP
+from .common_utils import RawJSON, attach_images, df_to_json_items, fast_json_response, json_bytes, FUEL_LABEL_MAP
+from .chat_nlu import (
+    CANONICAL_NEEDS,
+    NLU_STATS,
+    VALID_NEEDS,
+    detect_env_flags,
+    need_for_token,
+    rule_based_nlu,
+    rules_are_confident,
+    scan_text,
+)
+from .cancellation import CANCEL_STATS, CancelToken, RankCancelled, await_with_disconnect, run_until_disconnect
+from .chat_sessions import CHAT_SESSIONS, new_session_id, state_diff
+from .config import CHAT_SPECULATIVE_SPK, LLM_CACHE_TTL_S, NLU_MODE, SPK_DEADLINE_MS
+from .llm_cache import cache_key, get_llm_cache
+from .nlu_model import get_local_nlu, log_nlu_turn
 from .recommendation_state import set_last_recommendation, get_last_recommendation
+from .speculative import SPECULATIVE_SPK, Speculation
 from .spk_utils import fuel_to_code
 
 load_dotenv()
 router = APIRouter()
 
 # --- KONFIGURASI AI ---
-AI_MODE = "CLOUD"  # "LOCAL" jika pakai Ollama
-
-if AI_MODE == "CLOUD":
-    api_key = os.getenv("OPENROUTER_API_KEY") or "dummy"
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-        default_headers={"HTTP-Referer": "http://localhost:3000", "X-Title": "VRoom"},
-    )
-    MODEL_NAME = "openai/gpt-4o-mini"
-else:
-    client = OpenAI(base_url="http://localhost:11434/v1", api_key="ollama")
-    MODEL_NAME = "llama3.1"
+# "CLOUD" (OpenRouter), "LOCAL" (Ollama), atau "CLASSIFIER": NLU memakai model
+# TF-IDF lokal (nlu_model.py, latih via `python -m backend.nlu_train`);
+# mode analyst tetap memakai LLM cloud.
+AI_MODE = os.getenv("AI_MODE", "CLOUD").strip().upper()
+
+MODEL_NAME = "llama3.1" if AI_MODE == "LOCAL" else "openai/gpt-4o-mini"
+
+# Jumlah mobil yang direkomendasikan per giliran chat
+CHAT_TOPN = 5
+
+# SDK openai cukup berat diimpor (~0.5s); klien dibuat saat panggilan LLM pertama
+_LLM_CLIENT = None
+
+
+def get_llm_client():
+    global _LLM_CLIENT
+    if _LLM_CLIENT is None:
+        from openai import OpenAI
+
+        if AI_MODE != "LOCAL":
+            api_key = os.getenv("OPENROUTER_API_KEY") or "dummy"
+            _LLM_CLIENT = OpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=api_key,
+                default_headers={"HTTP-Referer": "http://localhost:3000", "X-Title": "VRoom"},
+            )
+        else:
+            _LLM_CLIENT = OpenAI(base_url="http://localhost:11434/v1", api_key="ollama")
+    return _LLM_CLIENT
 
 
 # --- DATA MODELS ---
@@ -52,6 +87,16 @@ class ConversationState(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     state: Optional[ConversationState] = None
+    session_id: Optional[str] = None  # kunci store rekomendasi per sesi
+    # True -> state disimpan di server (per session_id); balasan berisi
+    # state_diff + state_version, bukan state lengkap
+    server_state: bool = False
+    # mode server_state: versi state terakhir yang diterima client (None/0 =
+    # percakapan baru). Sesi tidak dikenal / versi beda -> 409 session_unknown,
+    # client mengirim ulang sekali dengan `state` lokal sebagai seed.
+    state_version: Optional[int] = None
+    # batas waktu ranking SPK (ms), dihitung sejak request tiba; None -> config.SPK_DEADLINE_MS
+    deadline_ms: Optional[float] = None
 
 
 # --- UTILS & SANITIZER ---
@@ -132,61 +177,7 @@ def build_summary_text(rec_list: List[Dict[str, Any]]) -> str:
 
 # --- tambahan: mapping & conflict resolver untuk chatty confirmation ---
 
-# Canonical needs the SPK expects
-VALID_NEEDS = {"perkotaan", "perjalanan_jauh", "keluarga", "fun", "offroad", "niaga"}
-
-# Map common aliases/phrases to canonical needs
-CANONICAL_NEEDS = {
-    # perkotaan
-    "perkotaan": "perkotaan",
-    "harian": "perkotaan",
-    "pemakaian harian": "perkotaan",
-    "harian di kota": "perkotaan",
-    "kota": "perkotaan",
-    "macet": "perkotaan",
-    "irit": "perkotaan",
-    "gampang parkir": "perkotaan",
-    "masuk gang": "perkotaan",
-    "sempit": "perkotaan",
-
-    # perjalanan jauh
-    "perjalanan_jauh": "perjalanan_jauh",
-    "mudik": "perjalanan_jauh",
-    "luar kota": "perjalanan_jauh",
-    "tol": "perjalanan_jauh",
-    "roadtrip": "perjalanan_jauh",
-
-    # keluarga
-    "keluarga": "keluarga",
-    "anak": "keluarga",
-    "7 seater": "keluarga",
-    "7-seater": "keluarga",
-    "7seater": "keluarga",
-
-    # fun
-    "fun": "fun",
-    "sport": "fun",
-    "ngebut": "fun",
-    "gaya": "fun",
-
-    # offroad
-    "offroad": "offroad",
-    "medan berat": "offroad",
-    "segala medan": "offroad",
-    "gunung": "offroad",
-    "banjir": "offroad",
-    "proyek": "offroad",
-    "jalan rusak": "offroad",
-    "jalan jelek": "offroad",
-    "jalan jelek": "offroad",
-
-    # niaga
-    "niaga": "niaga",
-    "usaha": "niaga",
-    "angkut": "niaga",
-    "barang": "niaga",
-    "pickup": "niaga",
-}
+# VALID_NEEDS & CANONICAL_NEEDS (alias -> kebutuhan kanonis) ada di chat_nlu.py
 
 _NEEDS_HUMAN_MAP = {
     "perkotaan": "harian di kota",
@@ -232,15 +223,11 @@ def normalize_need_token(token: str) -> Optional[str]:
     # exact map keys
     if t in CANONICAL_NEEDS:
         return CANONICAL_NEEDS[t]
-    # fuzzy containment: check if any alias is substring of token
-    for alias, canonical in CANONICAL_NEEDS.items():
-        if alias in t:
-            return canonical
-    # also check token contains alias (reverse)
-    for alias, canonical in CANONICAL_NEEDS.items():
-        if t in alias:
-            return canonical
-    return None
+    # alias di dalam token / token di dalam alias (satu regex + satu find, lihat chat_nlu)
+    return need_for_token(t)
+
+
+_NEED_SPLIT_RE = re.compile(r"[,\|;/]+|\band\b|\b&\b", re.I)
 
 
 def normalize_needs_list(raw_needs: List[Any]) -> List[str]:
@@ -248,12 +235,16 @@ def normalize_needs_list(raw_needs: List[Any]) -> List[str]:
     out: List[str] = []
     for item in raw_needs:
         try:
-            s = str(item)
+            s = str(item).lower()
         except Exception:
             continue
-        # split comma/and if user sends combined phrases
-        parts = re.split(r"[,\|;/]+|\band\b|\b&\b", s, flags=re.I)
-        for p in parts:
+        # semua alias berbatas kata dalam satu pass
+        found, _, _ = scan_text(s)
+        if found:
+            out.extend(found)
+            continue
+        # fallback per potongan: alias tanpa batas kata / potongan alias
+        for p in _NEED_SPLIT_RE.split(s):
             n = normalize_need_token(p)
             if n:
                 out.append(n)
@@ -283,16 +274,7 @@ def has_hesitation(text: str) -> bool:
     t = (text or "").lower()
     return any(w in t for w in HESITATION_WORDS)
 
-def detect_env_flags(text: str) -> Dict[str, bool]:
-    flags: Dict[str,bool] = {}
-    t = (text or "").lower()
-    if re.search(r"jalan.*(rusak|jelek|bergelombang|berlubang|tidak rata|banyak lubang)", t):
-        flags["bad_road"] = True
-    if re.search(r"\b(banjir|sering banjir)\b", t):
-        flags["flood_prone"] = True
-    if re.search(r"\b(naik barang|angkut barang|usaha)\b", t):
-        flags["cargo_need"] = True
-    return flags
+# detect_env_flags (frasa lingkungan -> state.env) ada di chat_nlu.py
 
 
 # --- PROMPTS ---
@@ -328,11 +310,340 @@ PANDUAN:
 """
 
 
+ANALYST_ERROR_REPLY = "Waduh, saya lagi pusing nih Kak. Coba tanya lagi nanti ya! 😵‍💫"
+
+
+def llm_complete(system_prompt: str, user_content: str, temperature: Optional[float] = None,
+                 ttl_s: Optional[float] = None, validate: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Panggil LLM lewat cache disk (llm_cache.py). Kunci = model + hash system
+    prompt + konten user ternormalisasi; ttl_s None -> simpan tanpa kedaluwarsa.
+    validate: hanya jawaban yang lolos yang disimpan ke cache.
+    """
+    def _call() -> str:
+        kwargs: Dict[str, Any] = {}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        res = get_llm_client().chat.completions.create(
+            model=MODEL_NAME,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content},
+            ],
+            **kwargs,
+        )
+        return res.choices[0].message.content
+
+    cache = get_llm_cache()
+    if cache is None:
+        return _call()
+    return cache.get_or_call(
+        MODEL_NAME, system_prompt, user_content, _call, temperature=temperature, ttl_s=ttl_s, validate=validate
+    )
+
+
+def _parse_nlu_json(raw: str) -> Dict[str, Any]:
+    """Jawaban NLU LLM -> dict; ValueError bila bukan objek JSON."""
+    try:
+        data = json.loads(clean_json_string(raw))
+    except ValueError as e:
+        raise ValueError(f"jawaban NLU bukan JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError("jawaban NLU bukan objek JSON")
+    return data
+
+
+def _is_nlu_json(raw: str) -> bool:
+    try:
+        _parse_nlu_json(raw)
+        return True
+    except ValueError:
+        return False
+
+
+def _llm_nlu(user_text: str) -> Dict[str, Any]:
+    # temperature 0 -> deterministik, aman di-cache tanpa kedaluwarsa; hanya
+    # jawaban yang bisa di-parse yang disimpan. Gagal parse -> ValueError,
+    # run_nlu jatuh ke hasil aturan.
+    extracted_raw = llm_complete(SYSTEM_PROMPT_NLU, user_text, temperature=0.0, validate=_is_nlu_json)
+    return _parse_nlu_json(extracted_raw)
+
+
+_BRANDS_SRC = None
+_BRANDS: List[str] = []
+
+
+def known_brands() -> List[str]:
+    """Daftar brand dari master (di-cache per objek master) untuk NLU aturan."""
+    global _BRANDS_SRC, _BRANDS
+    df = get_master_data()
+    if _BRANDS_SRC is not df:
+        col = df["brand"] if "brand" in df.columns else []
+        _BRANDS = sorted({str(b).strip() for b in col if str(b).strip()})
+        _BRANDS_SRC = df
+    return _BRANDS
+
+
+def run_nlu(user_text: str, step: str, before_llm: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """
+    NLU satu giliran sesuai NLU_MODE:
+      hybrid -> aturan dulu; LLM hanya bila confidence < NLU_RULE_MIN_CONF
+      rules  -> aturan saja;  llm -> LLM saja (perilaku lama)
+    AI_MODE="CLASSIFIER" mengganti panggilan LLM dengan model lokal.
+    before_llm dipanggil tepat sebelum panggilan LLM (jalur lambat saja).
+    Bila LLM / model lokal gagal, hasil aturan (meski confidence rendah) tetap dipakai.
+    """
+    t0 = time.perf_counter()
+    rules = None
+    if NLU_MODE != "llm":
+        try:
+            rules = rule_based_nlu(user_text, step, known_brands())
+        except Exception as e:
+            print(f"[NLU RULES ERROR] {e}")
+        if rules is not None and (NLU_MODE == "rules" or rules_are_confident(rules)):
+            dt = time.perf_counter() - t0
+            NLU_STATS.record("rules", dt)
+            print(f"[NLU] path=rules conf={rules['confidence']:.2f} t={dt * 1000:.1f}ms")
+            return rules
+
+    try:
+        if AI_MODE == "CLASSIFIER":
+            model = get_local_nlu()
+            if model is None:
+                raise RuntimeError("model NLU lokal belum dilatih (python -m backend.nlu_train)")
+            extracted = model.predict(user_text, step, known_brands())
+            path = "local"
+        else:
+            if before_llm is not None:
+                try:
+                    before_llm()
+                except Exception as e:
+                    print(f"[NLU] before_llm gagal: {e}")
+            extracted = _llm_nlu(user_text)
+            path = "llm"
+            # label LLM -> data latih NLU lokal (hanya bila NLU_LOG_PATH diset)
+            log_nlu_turn(user_text, step, extracted)
+    except Exception as e:
+        print(f"[NLU ERROR] {e}")
+        extracted = rules or {}
+        path = "rules_fallback" if rules else "none"
+    dt = time.perf_counter() - t0
+    NLU_STATS.record(path, dt)
+    conf = f"{rules['confidence']:.2f}" if rules else "-"
+    print(f"[NLU] path={path} rules_conf={conf} t={dt * 1000:.1f}ms")
+    return extracted
+
+
+def _rank_for_chat(df, budget: float, needs: List[str], filters: Dict[str, Any],
+                   deadline_ms: float = 0.0,
+                   cancel: Optional[CancelToken] = None,
+                   started_at: Optional[float] = None) -> Optional[Tuple[RawJSON, int, List[str]]]:
+    """
+    rank_candidates + gambar/label + serialisasi JSON untuk satu giliran chat.
+    Return (items_json, jumlah, tahap terdegradasi) atau None bila tidak ada
+    kandidat. Aman dijalankan di thread (jalur spekulatif); token dibatalkan
+    -> RankCancelled.
+    """
+    results = rank_candidates(
+        df_master=df,
+        budget=budget,
+        needs=needs,
+        spec_filters=filters,
+        topn=CHAT_TOPN,
+        deadline_ms=deadline_ms,
+        cancel=cancel,
+        started_at=started_at,
+    )
+    if results is None or (hasattr(results, "empty") and results.empty):
+        return None
+    degraded = list(results.attrs.get("spk_degraded") or [])
+
+    # Inject fuel_label for client UI
+    try:
+        results = attach_images(results)
+        if "fuel_code" in results.columns:
+            results["fuel_label"] = results["fuel_code"].map(FUEL_LABEL_MAP).fillna("Lainnya")
+    except Exception as e:
+        print("[ATTACH_IMAGES ERROR]", e)
+
+    # Serialisasi items sekali (bytes JSON); state analyst memakai bytes yang sama
+    return df_to_json_items(results), len(results), degraded
+
+
 # --- MAIN ENDPOINT ---
+def _begin_turn(payload: ChatRequest) -> Tuple[Optional[str], Optional[Dict[str, Any]], ConversationState]:
+    """
+    (session_id, state sebelumnya di server, state kerja) untuk satu giliran.
+    Mode server_state: `state` dari client = seed eksplisit (menimpa store).
+    Tanpa seed, client yang sudah punya state_version tapi sesinya tidak
+    dikenal (kedaluwarsa, terusir LRU, worker lain) atau versinya beda
+    mendapat 409 session_unknown, bukan percakapan baru diam-diam.
+    """
+    session_id = payload.session_id
+    prev_state: Optional[Dict[str, Any]] = None
+
+    if payload.server_state:
+        session_id = session_id or new_session_id()
+        if payload.state is not None:
+            # diff dihitung terhadap state yang dipegang client
+            prev_state = payload.state.model_dump()
+            return session_id, prev_state, payload.state
+        prev_state, version = CHAT_SESSIONS.load(session_id)
+        if payload.state_version and (prev_state is None or version != payload.state_version):
+            raise HTTPException(status_code=409, detail={"code": "session_unknown", "session_id": session_id})
+        if prev_state is not None:
+            # state dari store sudah tervalidasi saat disimpan -> tanpa validasi ulang
+            # (salinan terpisah: handler memutasi list/dict, prev_state dipakai untuk diff)
+            current_state = ConversationState.model_construct(**copy.deepcopy(prev_state))
+        else:
+            current_state = ConversationState()
+    else:
+        current_state = payload.state or ConversationState()
+    return session_id, prev_state, current_state
+
+
+def _finish_turn(payload: ChatRequest, resp: Dict[str, Any], session_id: Optional[str],
+                 prev_state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mode server_state: simpan state, ganti state lengkap dengan diff + versi."""
+    if payload.server_state:
+        st = resp.pop("state", None)
+        new_state = st.model_dump() if hasattr(st, "model_dump") else dict(st or {})
+        version = CHAT_SESSIONS.save(session_id, new_state)
+        resp["session_id"] = session_id
+        resp["state_version"] = version
+        resp["state_diff"] = state_diff(prev_state, new_state)
+    return resp
+
+
+def _cancelled_turn(e: RankCancelled) -> Response:
+    """Client putus saat ranking: state sesi tidak disimpan, tidak ada yang membaca respons."""
+    CANCEL_STATS.record(e)
+    print(f"[CHAT] giliran dibatalkan {e}")
+    return Response(status_code=499)
+
+
 @router.post("/chat")
-async def chat_endpoint(payload: ChatRequest = Body(...)):
+async def chat_endpoint(request: Request, payload: ChatRequest = Body(...)):
+    started_at = time.perf_counter()
+    session_id, prev_state, current_state = _begin_turn(payload)
+    try:
+        resp = await _chat_turn(payload, current_state, session_id, request=request, started_at=started_at)
+    except RankCancelled as e:
+        return _cancelled_turn(e)
+    # encode langsung ke bytes (NaN/Inf -> null)
+    return fast_json_response(_finish_turn(payload, resp, session_id, prev_state))
+
+
+def _sse(event: str, data: Any) -> bytes:
+    # json_bytes tidak menghasilkan newline mentah -> satu baris data per event
+    return b"event: " + event.encode("ascii") + b"\ndata: " + json_bytes(data) + b"\n\n"
+
+
+def llm_stream(system_prompt: str, user_content: str, ttl_s: Optional[float] = None):
+    """
+    Generator potongan teks jawaban LLM (stream=True). Cache hit -> satu potongan
+    utuh; miss -> token diteruskan saat tiba lalu teks lengkap disimpan ke cache.
+    """
+    cache = get_llm_cache()
+    key = cache_key(MODEL_NAME, system_prompt, user_content, None) if cache is not None else None
+    if cache is not None:
+        try:
+            hit = cache.get(key)
+        except Exception as e:
+            print(f"[LLM_CACHE] get gagal: {e}")
+            hit = None
+        if hit is not None:
+            yield hit
+            return
+
+    stream = get_llm_client().chat.completions.create(
+        model=MODEL_NAME,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        stream=True,
+    )
+    parts: List[str] = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if cache is not None and parts:
+        try:
+            cache.put(key, MODEL_NAME, "".join(parts), ttl_s)
+        except Exception as e:
+            print(f"[LLM_CACHE] put gagal: {e}")
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: Request, payload: ChatRequest = Body(...)):
+    """
+    Varian SSE dari /chat. Mode analyst meneruskan token LLM sebagai event
+    `token` ({"t": "..."}); semua giliran diakhiri event `final` berisi
+    respons lengkap yang sama dengan /chat (reply, state/state_diff, recommendation).
+    """
+    started_at = time.perf_counter()
+    session_id, prev_state, current_state = _begin_turn(payload)
+    try:
+        resp = await _chat_turn(
+            payload, current_state, session_id, stream=True, request=request, started_at=started_at
+        )
+    except RankCancelled as e:
+        return _cancelled_turn(e)
+    prompt = resp.pop("analyst_prompt", None)
+
+    # generator sinkron -> Starlette mengiterasinya di threadpool (LLM tidak memblokir event loop)
+    def events():
+        if prompt is not None:
+            parts: List[str] = []
+            try:
+                for piece in llm_stream(SYSTEM_PROMPT_ANALYST, prompt, ttl_s=LLM_CACHE_TTL_S):
+                    parts.append(piece)
+                    yield _sse("token", {"t": piece})
+                resp["reply"] = "".join(parts)
+            except Exception as e:
+                print(f"[ANALYST STREAM ERROR] {e}")
+                # token yang sudah terkirim tetap valid; tanpa token -> pesan maaf biasa
+                resp["reply"] = "".join(parts) or ANALYST_ERROR_REPLY
+        yield _sse("final", _finish_turn(payload, resp, session_id, prev_state))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _chat_turn(payload: ChatRequest, current_state: ConversationState, session_id: Optional[str],
+                     stream: bool = False, request: Optional[Request] = None,
+                     started_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Satu giliran percakapan; return dict respons (state masih objek).
+    stream=True: jalur analyst tidak memanggil LLM, tapi mengembalikan
+    "analyst_prompt" untuk diteruskan token demi token oleh /chat/stream.
+    request: bila diisi, ranking dibatalkan saat client putus (RankCancelled).
+    started_at: waktu request tiba; deadline_ms ranking dihitung dari sini
+    (NLU dan antrean threadpool ikut terhitung).
+    Ranking spekulatif yang diluncurkan tapi tidak diklaim (giliran berakhir
+    sebelum tahap ranking) dibatalkan saat giliran selesai.
+    """
+    specs: List[Speculation] = []
+    try:
+        return await _run_chat_turn(payload, current_state, session_id, stream, request, specs, started_at)
+    finally:
+        for spec in specs:
+            SPECULATIVE_SPK.discard(spec)
+
+
+async def _run_chat_turn(payload: ChatRequest, current_state: ConversationState, session_id: Optional[str],
+                         stream: bool, request: Optional[Request], specs: List[Speculation],
+                         started_at: Optional[float] = None) -> Dict[str, Any]:
     user_text = (payload.message or "").strip()
-    current_state = payload.state or ConversationState()
 
     # --- FITUR 1: RESET ---
     if user_text.lower() in ["reset", "ulangi", "mulai baru", "clear", "ganti budget"]:
@@ -354,23 +665,20 @@ async def chat_endpoint(payload: ChatRequest = Body(...)):
     # --- FITUR 2: ANALYST / RAG ---
     is_asking_reason = any(k in user_text.lower() for k in ["kenapa", "mengapa", "jelaskan", "kelebihan", "kekurangan", "analisis"])
     if "[analisis]" in user_text.lower() or (is_asking_reason and current_state.step == "READY"):
-        last_rec = get_last_recommendation()
+        last_rec = get_last_recommendation(session_id)
         if not last_rec or not last_rec.get("items"):
             return {"reply": "Maaf Kak, saya belum kasih rekomendasi mobil nih 😔. 🤔\nKita cari dulu yuk! Berapa budget maksimal Kakak?", "state": current_state}
         summary_data = build_summary_text(last_rec["items"])
         needs_context = ", ".join(needs_to_human(current_state.needs))
+        prompt = f"KONTEKS KEBUTUHAN USER: {needs_context}\n\nDATA REKOMENDASI TERAKHIR:\n{summary_data}\n\nPERTANYAAN USER: {user_text}"
+        if stream:
+            return {"reply": "", "state": current_state, "analyst_prompt": prompt}
         try:
-            res = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT_ANALYST},
-                    {"role": "user", "content": f"KONTEKS KEBUTUHAN USER: {needs_context}\n\nDATA REKOMENDASI TERAKHIR:\n{summary_data}\n\nPERTANYAAN USER: {user_text}"}
-                ]
-            )
-            return sanitize_for_json({"reply": res.choices[0].message.content, "state": current_state})
+            reply = llm_complete(SYSTEM_PROMPT_ANALYST, prompt, ttl_s=LLM_CACHE_TTL_S)
+            return {"reply": reply, "state": current_state}
         except Exception as e:
             print(f"[ANALYST ERROR] {e}")
-            return {"reply": "Waduh, saya lagi pusing nih Kak. Coba tanya lagi nanti ya! 😵‍💫", "state": current_state}
+            return {"reply": ANALYST_ERROR_REPLY, "state": current_state}
 
     # --- HANDLE CONFIRMATION (fast-path) ---
     if current_state.step == "CONFIRM_NEEDS":
@@ -390,24 +698,34 @@ async def chat_endpoint(payload: ChatRequest = Body(...)):
         # jika bukan jawaban singkat, biarkan NLU menangani pesan tersebut di bawah
 
     # --- FITUR 3: PENCARIAN & NLU ---
-    extracted = {}
-    try:
-        res = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT_NLU},
-                {"role": "user", "content": user_text},
-            ],
-            temperature=0.0,
+    # State masuk sudah punya budget + needs (giliran lanjutan): ranking SPK
+    # dimulai paralel dengan panggilan LLM; dipakai bila sidik jari input akhir sama.
+    spec: Optional[Speculation] = None
+    deadline_ms = float(payload.deadline_ms if payload.deadline_ms is not None else SPK_DEADLINE_MS)
+
+    def _start_speculation() -> None:
+        nonlocal spec
+        if not CHAT_SPECULATIVE_SPK or not current_state.budget or not current_state.needs:
+            return
+        budget = float(current_state.budget)
+        needs = sort_needs_by_priority([n for n in current_state.needs if n in VALID_NEEDS])
+        filters = copy.deepcopy(current_state.filters)
+        df_spec = get_master_data()
+        fp = rank_fingerprint(df_spec, budget, filters, needs, topn=CHAT_TOPN)
+        cached = get_last_recommendation(session_id)
+        if cached and cached.get("spk_fp") == fp:
+            return  # ranking sesi akan dipakai ulang, tidak perlu spekulasi
+        token = CancelToken()
+        spec = SPECULATIVE_SPK.launch(
+            fp,
+            lambda: _rank_for_chat(df_spec, budget, needs, filters, deadline_ms, token, started_at),
+            token=token,
         )
-        extracted_raw = res.choices[0].message.content
-        try:
-            extracted = json.loads(clean_json_string(extracted_raw))
-        except Exception:
-            extracted = {}
-    except Exception as e:
-        print(f"[NLU ERROR] {e}")
-        extracted = {}
+        specs.append(spec)
+
+    # NLU (aturan/LLM, known_brands, peluncuran spekulasi) di threadpool: panggilan LLM
+    # dan load master tidak memblokir event loop
+    extracted = await run_in_threadpool(run_nlu, user_text, current_state.step, before_llm=_start_speculation)
 
     # Logic Budget
     extracted_budget = extracted.get("budget")
@@ -596,7 +914,7 @@ async def chat_endpoint(payload: ChatRequest = Body(...)):
         fuels_check = current_state.filters.get("fuels") or ([current_state.filters.get("fuel_code")] if current_state.filters.get("fuel_code") else None)
         brand_val = current_state.filters.get("brand")
         if fuels_check and brand_val:
-            df_check = get_master_data()
+            df_check = await run_in_threadpool(get_master_data)
             brand_lower = str(brand_val).strip().lower()
             df_check = df_check[df_check["brand"].fillna("").str.lower() == brand_lower]
             # gunakan kolom fuel_code jika ada
@@ -630,7 +948,7 @@ async def chat_endpoint(payload: ChatRequest = Body(...)):
 
     # STEP 3: READY -> Jalankan SPK
     current_state.step = "READY"
-    df = get_master_data()
+    df = await run_in_threadpool(get_master_data)
 
     # DEBUG snapshot before SPK
     try:
@@ -645,50 +963,70 @@ async def chat_endpoint(payload: ChatRequest = Body(...)):
     except Exception:
         pass
 
-    results = None
-    t0 = time.time()
-    try:
-        results = rank_candidates(
-            df_master=df,
-            budget=current_state.budget,
-            needs=current_state.needs,
-            spec_filters=current_state.filters,
-            topn=5,
-        )
-    except Exception as e:
-        print(f"[SPK ERROR] {e}")
-        return {"reply": "Waduh, ada sedikit gangguan teknis nih Kak. Coba lagi nanti ya! 🛠️", "state": current_state}
-
-    if results is None or (hasattr(results, "empty") and results.empty):
-        # Pesan khusus jika filter terlalu ketat
-        if current_state.filters.get("brand"):
-             return {
-                "reply": f"Waduh... 🤔 Saya cari di database, {current_state.filters['brand'].title()} nggak ada yang masuk budget/kriteria Kakak nih.\n\n💡 Coba ganti merk lain atau ketik 'bebas' buat lihat semua merk.",
+    # --- REUSE RANKING SESI ---
+    # Sidik jari input SPK sama dengan ranking terakhir sesi ini (konfirmasi,
+    # basa-basi, follow-up) -> pakai hasil tersimpan tanpa rank_candidates.
+    # Bila hanya budget yang berubah, rank_candidates memakai ulang bagian
+    # query yang tidak bergantung budget (lihat spk_rank.get_rank_prep).
+    spk_fp = rank_fingerprint(df, current_state.budget, current_state.filters, current_state.needs, topn=CHAT_TOPN)
+    cached = get_last_recommendation(session_id)
+    if not cached or cached.get("spk_fp") != spk_fp or cached.get("items_json") is None:
+        cached = None
+
+    if cached is not None:
+        print(f"[CHAT] sidik jari SPK sama ({spk_fp}) -> ranking sesi dipakai ulang")
+        items_json = RawJSON(cached["items_json"])
+        n_results = int(cached.get("count") or 0)
+        degraded: List[str] = []
+    else:
+        fut = SPECULATIVE_SPK.claim(spec, spk_fp)
+        # ranking di threadpool sambil koneksi dipantau (client putus -> token dibatalkan)
+        try:
+            if fut is not None:
+                print(f"[CHAT] ranking spekulatif dipakai ({spk_fp})")
+                ranked = await await_with_disconnect(request, asyncio.wrap_future(fut), spec.token)
+            else:
+                token = CancelToken()
+                budget, needs, filters = current_state.budget, current_state.needs, current_state.filters
+                ranked = await run_until_disconnect(
+                    request, lambda: _rank_for_chat(df, budget, needs, filters, deadline_ms, token, started_at), token
+                )
+        except RankCancelled:
+            raise
+        except Exception as e:
+            print(f"[SPK ERROR] {e}")
+            return {"reply": "Waduh, ada sedikit gangguan teknis nih Kak. Coba lagi nanti ya! 🛠️", "state": current_state}
+
+        if ranked is None:
+            # Pesan khusus jika filter terlalu ketat
+            if current_state.filters.get("brand"):
+                 return {
+                    "reply": f"Waduh... 🤔 Saya cari di database, {current_state.filters['brand'].title()} nggak ada yang masuk budget/kriteria Kakak nih.\n\n💡 Coba ganti merk lain atau ketik 'bebas' buat lihat semua merk.",
+                    "state": current_state,
+                }
+            return {
+                "reply": "Waduh... 🤔 Saya sudah cari di database tapi belum nemu yang pas banget sama kriteria itu.\n\n💡 Coba naikkan sedikit budgetnya atau kurangi filternya ya Kak.",
                 "state": current_state,
             }
-        return {
-            "reply": "Waduh... 🤔 Saya sudah cari di database tapi belum nemu yang pas banget sama kriteria itu.\n\n💡 Coba naikkan sedikit budgetnya atau kurangi filternya ya Kak.",
-            "state": current_state,
-        }
-
-    # Inject fuel_label for client UI
-    try:
-        results = attach_images(results)
-        if "fuel_code" in results.columns:
-            results["fuel_label"] = results["fuel_code"].map(FUEL_LABEL_MAP).fillna("Lainnya")
-    except Exception as e:
-        print("[ATTACH_IMAGES ERROR]", e)
-
-    rec_items = df_to_items(results)
+        items_json, n_results, degraded = ranked
 
     rec_payload = {
         "budget": current_state.budget,
         "needs": current_state.needs,
         "filters": current_state.filters,
-        "count": len(rec_items),
-        "items": rec_items,
+        "count": n_results,
+        "items": items_json,
+        "degraded": bool(degraded),
     }
-    set_last_recommendation(rec_payload)
+    if degraded:
+        rec_payload["degraded_stages"] = degraded
+    state_payload = {k: v for k, v in rec_payload.items() if k != "items"}
+    if cached is None:
+        # hasil terdegradasi tidak diberi sidik jari -> giliran berikutnya ranking penuh
+        set_last_recommendation(
+            {**state_payload, "items_json": items_json.data, "spk_fp": None if degraded else spk_fp},
+            session_id=session_id,
+        )
 
     needs_str = ", ".join(current_state.needs).title()
     human_budget = format_budget_human(current_state.budget)
@@ -702,11 +1040,8 @@ async def chat_endpoint(payload: ChatRequest = Body(...)):
         f"💡 AHA! Ketemu!\nBuat kebutuhan {needs_str} dengan budget {human_budget}{filter_msg}, ini dia rekomendasi yang paling pas buat Kakak:"
     )
 
-    final_response = {
+    return {
         "reply": reply_text,
         "state": current_state,
         "recommendation": rec_payload
     }
-
-    # sanitize and return
-    return sanitize_for_json(final_response)
@@ -0,0 +1,86 @@
+# file: backend/chat_sessions.py
+from __future__ import annotations
+
+import copy
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .config import CHAT_SESSION_MAX, CHAT_SESSION_TTL_S
+
+# ============================================================
+# State percakapan di sisi server (mode opsional /chat server_state=true)
+# ============================================================
+# Client cukup mengirim session_id + pesan; server menyimpan ConversationState
+# sebagai dict biasa (tanpa validasi pydantic per turn) dan membalas hanya
+# field yang berubah (state_diff) + nomor versi. Sesi idle > TTL dibuang,
+# jumlah sesi dibatasi LRU. Per proses: sesi yang hilang (TTL, LRU, worker lain)
+# dijawab 409 session_unknown oleh /chat dan client mengirim ulang state lokal
+# sebagai seed; sticky session tetap disarankan untuk multi-worker.
+
+
+def new_session_id() -> str:
+    """Token sesi ringkas (16 karakter url-safe)."""
+    return secrets.token_urlsafe(12)
+
+
+def state_diff(prev: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Field top-level yang berubah dibanding state sebelumnya (semua bila prev None)."""
+    if prev is None:
+        return dict(new)
+    return {k: v for k, v in new.items() if prev.get(k) != v}
+
+
+class ConversationStore:
+    def __init__(self, ttl_s: float, max_sessions: int):
+        self.ttl_s = float(ttl_s)
+        self.max_sessions = int(max_sessions)
+        self._lock = threading.Lock()
+        # sid -> (state_dict, versi, waktu akses terakhir)
+        self._data: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def load(self, sid: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        """(salinan state, versi) milik sesi; (None, 0) bila belum ada / kedaluwarsa."""
+        with self._lock:
+            item = self._data.get(sid)
+            if item is None:
+                return None, 0
+            state, version, ts = item
+            if self.ttl_s > 0 and time.time() - ts > self.ttl_s:
+                del self._data[sid]
+                self.expired += 1
+                return None, 0
+            self._data.move_to_end(sid)
+            # handler memutasi list/dict state -> kembalikan salinan
+            return copy.deepcopy(state), version
+
+    def save(self, sid: str, state: Dict[str, Any]) -> int:
+        with self._lock:
+            old = self._data.pop(sid, None)
+            version = (old[1] if old else 0) + 1
+            self._data[sid] = (state, version, time.time())
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+                self.evicted += 1
+            return version
+
+    def drop(self, sid: str) -> None:
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._data),
+                "max_sessions": self.max_sessions,
+                "ttl_s": self.ttl_s,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+CHAT_SESSIONS = ConversationStore(CHAT_SESSION_TTL_S, CHAT_SESSION_MAX)
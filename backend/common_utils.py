@@ -1,8 +1,11 @@
 # file: backend/common_utils.py
 from __future__ import annotations
 from typing import Any, Dict, List
+import json
+import math
 import pandas as pd
 import numpy as np
+from fastapi.responses import Response
 
 # Import logika gambar canggih
 from .images import find_best_image_url
@@ -52,4 +55,87 @@ def df_to_items(df: pd.DataFrame) -> List[Dict[str, Any]]:
     clean_df = df.replace([np.inf, -np.inf], np.nan)
     clean_df = clean_df.where(pd.notnull(clean_df), None)
     
-    return clean_df.to_dict(orient="records")
\ No newline at end of file
+    return clean_df.to_dict(orient="records")
+
+
+# ============================================================
+# Proyeksi kolom hasil (payload ringkas untuk UI)
+# ============================================================
+# Kolom yang benar-benar dipakai kartu hasil (ResultSection.tsx) + chat
+# analyst. Sisanya (spec mentah, skor antara, dimensi hasil parsing)
+# hanya dikirim bila diminta lewat `fields` atau mode debug.
+LEAN_FIELDS: List[str] = [
+    "rank", "points", "brand", "model", "price", "fit_score",
+    "fuel", "fuel_code", "fuel_label", "trans", "seats", "cc_kwh",
+    "segmentasi", "alasan", "spk_reason", "image_url", "image",
+]
+
+
+def project_fields(df: pd.DataFrame, fields: List[str] | None = None, full: bool = False) -> pd.DataFrame:
+    """
+    Pilih subset kolom untuk dikirim ke client.
+    - full=True        -> semua kolom (payload debug)
+    - fields diberikan -> kolom tsb sesuai urutan permintaan (yang tidak ada diabaikan)
+    - default          -> LEAN_FIELDS
+    """
+    if full or df is None:
+        return df
+    wanted = fields if fields else LEAN_FIELDS
+    cols = [c for c in dict.fromkeys(str(f).strip() for f in wanted) if c in df.columns]
+    return df[cols]
+
+
+# ============================================================
+# Jalur JSON cepat: frame hasil -> bytes JSON dalam satu pass
+# ============================================================
+
+class RawJSON:
+    """Fragmen JSON yang sudah jadi (bytes); disisipkan apa adanya oleh json_bytes."""
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def df_to_json_items(df: pd.DataFrame) -> RawJSON:
+    """
+    Serialisasi DataFrame langsung ke array JSON records (encoder C pandas).
+    NaN/Inf -> null secara native, tanpa replace/where/to_dict.
+    """
+    if df is None or df.empty:
+        return RawJSON(b"[]")
+    return RawJSON(df.to_json(orient="records", double_precision=15, default_handler=str).encode("utf-8"))
+
+
+def _plain(v: Any) -> Any:
+    """Nilai skalar kecil (wrapper response) -> tipe JSON; NaN/Inf -> None."""
+    if isinstance(v, float):
+        return v if math.isfinite(v) else None
+    if isinstance(v, np.generic):
+        return _plain(v.item())
+    return v
+
+
+def json_bytes(obj: Any) -> bytes:
+    """
+    Encode obj ke bytes JSON. Fragmen RawJSON disisipkan tanpa di-parse ulang;
+    model pydantic di-dump; NaN/Inf -> null. Dipakai untuk wrapper response yang kecil.
+    """
+    if isinstance(obj, RawJSON):
+        return obj.data
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump()
+    if isinstance(obj, dict):
+        return b"{" + b",".join(
+            json.dumps(str(k), ensure_ascii=False).encode("utf-8") + b":" + json_bytes(v)
+            for k, v in obj.items()
+        ) + b"}"
+    if isinstance(obj, (list, tuple)):
+        return b"[" + b",".join(json_bytes(v) for v in obj) + b"]"
+    return json.dumps(_plain(obj), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def fast_json_response(obj: Any, status_code: int = 200) -> Response:
+    """Response JSON mentah (bypass jsonable_encoder FastAPI)."""
+    return Response(content=json_bytes(obj), status_code=status_code, media_type="application/json")
+
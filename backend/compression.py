@@ -0,0 +1,278 @@
+# file: backend/compression.py
+from __future__ import annotations
+
+import gzip
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    COMPRESS_BROTLI_QUALITY,
+    COMPRESS_ENABLED,
+    COMPRESS_EXCLUDE,
+    COMPRESS_GZIP_LEVEL,
+    COMPRESS_MIN_SIZE,
+)
+
+# brotli opsional: tanpa paket -> hanya gzip
+try:
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover
+    brotli = None
+
+# Header yang bisa diset route untuk menolak kompresi (dibuang sebelum dikirim)
+NO_COMPRESS_HEADER = "x-no-compress"
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# Prefix path yang tidak dikompres (env COMPRESS_EXCLUDE + no_compress_path())
+_EXCLUDED_PREFIXES: List[str] = list(COMPRESS_EXCLUDE)
+
+
+def no_compress_path(prefix: str) -> None:
+    """Daftarkan prefix path yang responsnya tidak boleh dikompres (opt-out per route)."""
+    if prefix and prefix not in _EXCLUDED_PREFIXES:
+        _EXCLUDED_PREFIXES.append(prefix)
+
+
+def mark_no_compress(response: Any) -> Any:
+    """Tandai satu Response agar dilewati middleware (opt-out per respons)."""
+    response.headers[NO_COMPRESS_HEADER] = "1"
+    return response
+
+
+# ============================================================
+# Statistik kompresi (dibaca oleh /metrics)
+# ============================================================
+class CompressionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.responses = 0
+        self.compressed = 0
+        self.skipped: Dict[str, int] = {}
+        self.by_encoding: Dict[str, Dict[str, int]] = {}
+
+    def skip(self, reason: str) -> None:
+        with self._lock:
+            self.responses += 1
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def record(self, encoding: str, raw: int, out: int) -> None:
+        with self._lock:
+            self.responses += 1
+            self.compressed += 1
+            e = self.by_encoding.setdefault(encoding, {"count": 0, "bytes_in": 0, "bytes_out": 0})
+            e["count"] += 1
+            e["bytes_in"] += raw
+            e["bytes_out"] += out
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            b_in = sum(e["bytes_in"] for e in self.by_encoding.values())
+            b_out = sum(e["bytes_out"] for e in self.by_encoding.values())
+            enc = {
+                k: {**v, "ratio": round(v["bytes_in"] / v["bytes_out"], 3) if v["bytes_out"] else None}
+                for k, v in self.by_encoding.items()
+            }
+            return {
+                "enabled": COMPRESS_ENABLED,
+                "min_size": COMPRESS_MIN_SIZE,
+                "brotli_available": brotli is not None,
+                "responses": self.responses,
+                "compressed": self.compressed,
+                "skipped": dict(self.skipped),
+                "bytes_in": b_in,
+                "bytes_out": b_out,
+                "ratio": round(b_in / b_out, 3) if b_out else None,
+                "by_encoding": enc,
+            }
+
+
+COMPRESSION_STATS = CompressionStats()
+
+
+# ============================================================
+# Negosiasi Accept-Encoding
+# ============================================================
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pilih encoding dari header Accept-Encoding (hormati q=0).
+    Urutan preferensi: br (bila paket tersedia) -> gzip.
+    """
+    if not accept_encoding:
+        return None
+    prefs: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[token] = q
+
+    def ok(name: str) -> bool:
+        return prefs.get(name, prefs.get("*", 0.0)) > 0
+
+    if brotli is not None and ok("br"):
+        return "br"
+    if ok("gzip"):
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    """Kompresor streaming (gzip / br) dengan antarmuka compress/flush yang sama."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data)
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._c.finish()
+        return self._c.flush()
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+# ============================================================
+# Middleware ASGI
+# ============================================================
+class CompressionMiddleware:
+    """
+    Kompresi respons gzip/brotli:
+    - hanya bila client mengizinkan (Accept-Encoding) dan tipe konten teks/JSON
+    - body satu potong < min_size dibiarkan apa adanya
+    - dilewati untuk prefix di COMPRESS_EXCLUDE / no_compress_path(), respons
+      ber-header X-No-Compress, respons yang sudah ber-Content-Encoding,
+      dan text/event-stream (streaming harus tetap terkirim per event)
+    """
+
+    def __init__(self, app, min_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.min_size = int(min_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope.get("path", "")
+        if any(path.startswith(p) for p in _EXCLUDED_PREFIXES):
+            COMPRESSION_STATS.skip("excluded_path")
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for k, v in scope.get("headers", []):
+            if k == b"accept-encoding":
+                accept = v.decode("latin-1")
+                break
+        encoding = choose_encoding(accept)
+
+        state: Dict[str, Any] = {"start": None, "encoder": None, "mode": None, "raw": 0, "out": 0}
+
+        async def send_wrapper(message):
+            mtype = message["type"]
+            if mtype == "http.response.start":
+                state["start"] = message
+                return
+
+            if mtype != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+
+            # --- keputusan diambil pada potongan body pertama ---
+            if state["mode"] is None:
+                start = state["start"]
+                headers: List[Tuple[bytes, bytes]] = list(start.get("headers", []))
+                names = {k.lower(): v for k, v in headers}
+                reason = None
+                if names.get(NO_COMPRESS_HEADER.encode()) is not None:
+                    reason = "opt_out"
+                elif b"content-encoding" in names:
+                    reason = "already_encoded"
+                elif encoding is None:
+                    reason = "not_accepted"
+                else:
+                    ctype = names.get(b"content-type", b"").decode("latin-1").lower()
+                    if ctype.startswith("text/event-stream"):
+                        reason = "event_stream"
+                    elif not any(ctype.startswith(t) for t in COMPRESSIBLE_TYPES):
+                        reason = "content_type"
+                    elif not more and len(body) < self.min_size:
+                        reason = "below_min_size"
+
+                headers = [(k, v) for k, v in headers if k.lower() != NO_COMPRESS_HEADER.encode()]
+                if reason is not None:
+                    COMPRESSION_STATS.skip(reason)
+                    state["mode"] = "identity"
+                    await send({**start, "headers": headers})
+                    await send(message)
+                    return
+
+                headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"vary")]
+                vary = names.get(b"vary", b"")
+                vary = (vary + b", Accept-Encoding") if vary else b"Accept-Encoding"
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", vary)]
+
+                if not more:
+                    # respons satu potong (kasus umum JSON) -> kompres sekaligus
+                    out = compress_bytes(body, encoding)
+                    COMPRESSION_STATS.record(encoding, len(body), len(out))
+                    state["mode"] = "done"
+                    headers.append((b"content-length", str(len(out)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": out})
+                    return
+
+                state["mode"] = "stream"
+                state["encoder"] = _Encoder(encoding)
+                await send({**start, "headers": headers})
+
+            if state["mode"] != "stream":
+                await send(message)
+                return
+
+            enc: _Encoder = state["encoder"]
+            out = enc.compress(body)
+            state["raw"] += len(body)
+            if not more:
+                out += enc.flush()
+                state["out"] += len(out)
+                COMPRESSION_STATS.record(encoding, state["raw"], state["out"])
+            else:
+                state["out"] += len(out)
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
@@ -2,7 +2,6 @@
 from __future__ import annotations
 
 import os
-import pandas as pd
 
 # Direktori data utama
 DATA_DIR = os.environ.get("DATA_DIR", "./data")
@@ -18,10 +17,104 @@ def _p(*parts: str) -> str:
 
 
 # Jendela waktu (kalau nanti dipakai di analisis tren)
-WINDOW_START = pd.Timestamp("2025-01-01")
-WINDOW_END = pd.Timestamp("2025-09-30")  # inklusif
+# Disimpan sebagai string; WINDOW_START / WINDOW_END (pd.Timestamp) dibuat lazy
+# lewat __getattr__ agar impor config tidak ikut memuat pandas.
+_WINDOW_DATES = {
+    "WINDOW_START": "2025-01-01",
+    "WINDOW_END": "2025-09-30",  # inklusif
+}
+
+
+def __getattr__(name: str):
+    if name in _WINDOW_DATES:
+        import pandas as pd
+        val = pd.Timestamp(_WINDOW_DATES[name])
+        globals()[name] = val
+        return val
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Pola / nama file
 ALLOWED_SPEC_FILENAME = "daftar_mobil.json"
 RETAIL_GLOB = "Retail_*.json"
 WHOLESALE_GLOB = "Wholesale_*.json"
+
+# Mode skor atribut kebutuhan di rank_candidates:
+#   "relative" -> dinormalisasi terhadap kandidat per request (perilaku lama)
+#   "catalog"  -> matriks skor N x 6 yang dinormalisasi terhadap seluruh katalog
+SPK_SCORE_MODE = os.environ.get("SPK_SCORE_MODE", "relative").strip().lower()
+
+# Klastering (klastering.py)
+#   CLUSTER_BACKEND: "auto" (minibatch bila baris > MAX_SAMPLES_CLUSTER), "kmeans", "minibatch"
+#   CLUSTER_K: HANYA untuk model klaster katalog (get_catalog_cluster_model, jalur
+#     deadline/approx). Klaster per request (cluster_and_label dari spk_rank) tetap
+#     k=6 karena dijalankan atas himpunan kandidat yang kecil.
+#   CLUSTER_BATCH_SIZE: batch MiniBatchKMeans (katalog & backend minibatch per request)
+CLUSTER_BACKEND = os.environ.get("CLUSTER_BACKEND", "auto").strip().lower()
+CLUSTER_K = int(os.environ.get("CLUSTER_K", "12"))
+CLUSTER_BATCH_SIZE = int(os.environ.get("CLUSTER_BATCH_SIZE", "1024"))
+
+# Kompresi respons (compression.py)
+#   COMPRESS_MIN_SIZE: body di bawah ukuran ini (byte) dikirim apa adanya
+#   COMPRESS_EXCLUDE : prefix path dipisah koma yang tidak dikompres
+COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))
+COMPRESS_EXCLUDE = [p.strip() for p in os.environ.get("COMPRESS_EXCLUDE", "").split(",") if p.strip()]
+
+# Single-flight /recommendations: request identik yang bersamaan berbagi satu perhitungan
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+# Warmup startup (warmup.py): "background" (default), "blocking", "off"
+WARMUP_MODE = os.environ.get("WARMUP_MODE", "background").strip().lower()
+WARMUP_WORKERS = int(os.environ.get("WARMUP_WORKERS", "4"))
+
+# Penyimpanan rekomendasi terakhir per sesi (recommendation_state.py)
+#   REC_STORE_BACKEND: "memory" (per proses) atau "sqlite" (WAL, dibagi antar worker)
+REC_STORE_BACKEND = os.environ.get("REC_STORE_BACKEND", "memory").strip().lower()
+REC_STORE_PATH = os.environ.get("REC_STORE_PATH", _p("rec_store.sqlite"))
+REC_STORE_TTL_S = float(os.environ.get("REC_STORE_TTL_S", "3600"))
+REC_STORE_MAX_ENTRIES = int(os.environ.get("REC_STORE_MAX_ENTRIES", "2000"))
+REC_STORE_MAX_BYTES = int(os.environ.get("REC_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# State percakapan di server (chat_sessions.py, /chat dengan server_state=true)
+CHAT_SESSION_TTL_S = float(os.environ.get("CHAT_SESSION_TTL_S", "1800"))
+CHAT_SESSION_MAX = int(os.environ.get("CHAT_SESSION_MAX", "5000"))
+
+# Deadline default ranking SPK (ms) untuk /recommendations & chat; 0 = tanpa batas.
+# Request boleh mengirim deadline_ms sendiri (lihat spk_rank.Deadline).
+SPK_DEADLINE_MS = float(os.environ.get("SPK_DEADLINE_MS", "0"))
+
+# Sapuan budget untuk prefetch slider (spk_sweep.py, /recommendations/sweep): maks titik grid
+SWEEP_MAX_POINTS = int(os.environ.get("SWEEP_MAX_POINTS", "41"))
+
+# Sesi re-ranking WebSocket (rank_session.py): entri memo per tahap per koneksi
+RANK_SESSION_CACHE = int(os.environ.get("RANK_SESSION_CACHE", "8"))
+
+# Interval cek koneksi client selama ranking (cancellation.py); client putus -> ranking dibatalkan
+DISCONNECT_POLL_MS = float(os.environ.get("DISCONNECT_POLL_MS", "50"))
+
+# Ranking SPK spekulatif selagi NLU LLM berjalan (speculative.py)
+CHAT_SPECULATIVE_SPK = os.environ.get("CHAT_SPECULATIVE_SPK", "1").strip().lower() not in {"0", "false", "no", "off"}
+CHAT_SPECULATIVE_WORKERS = int(os.environ.get("CHAT_SPECULATIVE_WORKERS", "2"))
+
+# NLU chat (chat_nlu.py)
+#   NLU_MODE: "hybrid" (aturan dulu, LLM bila confidence rendah), "llm", "rules"
+NLU_MODE = os.environ.get("NLU_MODE", "hybrid").strip().lower()
+NLU_RULE_MIN_CONF = float(os.environ.get("NLU_RULE_MIN_CONF", "0.75"))
+
+# Cache respons LLM di disk (llm_cache.py, SQLite WAL)
+#   NLU (temperature 0) disimpan tanpa kedaluwarsa; jawaban analyst pakai LLM_CACHE_TTL_S
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", _p("llm_cache.sqlite"))
+LLM_CACHE_TTL_S = float(os.environ.get("LLM_CACHE_TTL_S", "86400"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# NLU lokal (nlu_model.py, AI_MODE="CLASSIFIER")
+#   NLU_LOG_PATH: bila diset, giliran yang dilabeli LLM ditulis ke JSONL (data latih)
+NLU_MODEL_PATH = os.environ.get("NLU_MODEL_PATH", _p("nlu_model.joblib"))
+NLU_LOG_PATH = os.environ.get("NLU_LOG_PATH", "").strip()
+
+# Relaksasi saat hasil kosong (spk_relax.py): maks calon yang diverifikasi persis
+# (hard constraints atas jendela kandidat, ~10ms per calon)
+RELAX_VERIFY_MAX = int(os.environ.get("RELAX_VERIFY_MAX", "4"))
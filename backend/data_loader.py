@@ -1,5 +1,6 @@
 # file: backend/data_loader.py
 from __future__ import annotations
+import threading
 import pandas as pd
 
 # Kita import fungsi canggih dari loaders.py milik Anda
@@ -8,6 +9,8 @@ from .spk_features import build_master
 
 # Variable global untuk caching (Singleton)
 _CACHED_MASTER_DF: pd.DataFrame | None = None
+# Warmup (thread latar) dan request pertama bisa memanggil bersamaan -> satu load saja
+_MASTER_LOCK = threading.RLock()
 
 def reload_master_data() -> pd.DataFrame:
     """
@@ -16,8 +19,13 @@ def reload_master_data() -> pd.DataFrame:
     2. Panggil build_master untuk hitung skor jual kembali dll
     3. Simpan di cache
     """
+    with _MASTER_LOCK:
+        return _reload_master_locked()
+
+
+def _reload_master_locked() -> pd.DataFrame:
     global _CACHED_MASTER_DF
-    
+
     print("[LOADER] Memuat spesifikasi mobil...")
     try:
         specs = load_specs()
@@ -57,7 +65,10 @@ def get_master_data() -> pd.DataFrame:
     """
     Fungsi ini yang akan dipanggil oleh Chatbot & API.
     """
-    global _CACHED_MASTER_DF
-    if _CACHED_MASTER_DF is None:
-        return reload_master_data()
-    return _CACHED_MASTER_DF
\ No newline at end of file
+    df = _CACHED_MASTER_DF
+    if df is not None:
+        return df
+    with _MASTER_LOCK:
+        if _CACHED_MASTER_DF is None:
+            return _reload_master_locked()
+        return _CACHED_MASTER_DF
\ No newline at end of file
@@ -1,10 +1,13 @@
 # file: backend/klastering.py
 from __future__ import annotations
 from typing import Dict, List, Tuple, Optional
+import time
 import numpy as np
 import pandas as pd
 import re
 
+from .config import CLUSTER_BACKEND, CLUSTER_BATCH_SIZE, CLUSTER_K
+
 # Konstanta umum
 MAX_SAMPLES_CLUSTER = 2000
 NEED_LABELS = ["perjalanan_jauh", "keluarga", "fun", "perkotaan", "niaga", "offroad"]
@@ -74,7 +77,7 @@ def is_obvious_commercial_by_dimension(length: Optional[float], width: Optional[
         return True
     return False
 
-def _ensure_columns(cand: pd.DataFrame) -> pd.DataFrame:
+def _ensure_columns(cand: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
     """
     Normalisasi nama kolom yang umum berbeda di dataset: dimension, vehicle_weight, wheelbase, cc/kwh, seats, body_type.
     Mengembalikan DataFrame yang sudah punya kolom:
@@ -85,8 +88,11 @@ def _ensure_columns(cand: pd.DataFrame) -> pd.DataFrame:
       - cc_kwh_num (float)
       - seats (float/int)
       - body_type (string)
+
+    copy=False: kolom ditambahkan langsung ke `cand` (dipakai bila frame sudah
+    milik pemanggil, mis. frame kerja per-request di rank_candidates).
     """
-    df = cand.copy()
+    df = cand.copy() if copy else cand
 
     # mapping kolom umum ke nama standar
     col_map = {
@@ -128,9 +134,8 @@ def _ensure_columns(cand: pd.DataFrame) -> pd.DataFrame:
         df["dim_width_mm"]  = [p[1] for p in parsed]
         df["dim_height_mm"] = [p[2] for p in parsed]
         # Jika length_mm kosong, isi dari parsed dim
-        df["length_mm"] = df.apply(lambda r: r["length_mm"] if not pd.isna(r["length_mm"]) else r["dim_length_mm"], axis=1)
-        df["width_mm"]  = df.apply(lambda r: r["width_mm"] if not pd.isna(r["width_mm"]) else r["dim_width_mm"], axis=1)
-        df["height_mm"] = df.apply(lambda r: r["height_mm"] if not pd.isna(r["height_mm"]) else r["dim_height_mm"], axis=1)
+        for c in ["length_mm", "width_mm", "height_mm"]:
+            df[c] = pd.to_numeric(df[c], errors="coerce").fillna(pd.to_numeric(df[f"dim_{c}"], errors="coerce"))
     else:
         df["dim_length_mm"] = np.nan
         df["dim_width_mm"] = np.nan
@@ -182,60 +187,82 @@ def _ensure_columns(cand: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-def cluster_and_label(
-    cand: pd.DataFrame,
-    k: int = 6
-) -> Tuple[pd.DataFrame, Dict[int, str], np.ndarray, List[str], object, np.ndarray]:
-    """
-    KMeans atas fitur kendaraan + heuristik rule-based tambahan.
-    Pipeline:
-      - normalisasi kolom input
-      - clustering KMeans (fit pada fitur numerik)
-      - scoring heuristik untuk tiap kebutuhan
-      - koreksi per-item berdasarkan dimension/body_type/seats
-    """
-    try:
-        from sklearn.cluster import KMeans
-        from sklearn.preprocessing import StandardScaler
-    except Exception as e:
-        raise RuntimeError("scikit-learn diperlukan untuk klastering") from e
+def commercial_by_dimension_mask(length: np.ndarray, width: np.ndarray, height: np.ndarray) -> np.ndarray:
+    """Versi vektor is_obvious_commercial_by_dimension (NaN -> False)."""
+    with np.errstate(invalid="ignore"):
+        return (length >= 5200) | (height >= 2000) | (width >= 2100) | ((length >= 5400) & (height >= 1850))
 
-    # Normalisasi / map kolom input agar robust ke variasi dataset
-    df = _ensure_columns(cand)
 
-    # Fitur yang digunakan untuk clustering (harus ada di dataframe)
-    feat_cols = [
-        "length_mm", "width_mm", "height_mm", "wheelbase_mm",
-        "vehicle_weight_kg", "cc_kwh_num", "rim_inch", "tyre_w_mm", "awd_flag"
+def relabel_rows(df: pd.DataFrame, initial: pd.Series) -> pd.Series:
+    """
+    Koreksi label per-barang berdasarkan dimension/body_type/seats, divektorkan
+    dengan np.select. Urutan kondisi = urutan aturan (aturan pertama yang cocok menang):
+      1) dimensi jelas komersial & body bukan passenger          -> niaga
+      2) body passenger yang dilabel niaga:
+           seats>=5 atau tinggi < 1900                           -> keluarga
+           selain itu                                            -> perjalanan_jauh
+      3) seats >= 6 -> keluarga; seats == 5 -> perkotaan bila panjang < 4000, else keluarga
+      4) berat >= 2500 & panjang dim >= 5200 & body bukan passenger -> niaga
+      5) sedan panjang (> 5200)                                  -> perjalanan_jauh
+      6) dimensi komersial tapi seats >= 5                       -> keluarga
+      selain itu label awal (centroid).
+    """
+    def num(col: str) -> np.ndarray:
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+
+    seats = num("seats")
+    dimL, dimW, dimH = num("dim_length_mm"), num("dim_width_mm"), num("dim_height_mm")
+    length = num("length_mm")
+    weight = num("vehicle_weight_kg")
+    body = df["body_type"].astype(str).to_numpy() if "body_type" in df.columns else np.full(len(df), "", dtype=object)
+    init = initial.to_numpy(dtype=object)
+
+    passenger = np.isin(body, list(PASSENGER_BODY_TYPES))
+    commercial = commercial_by_dimension_mask(dimL, dimW, dimH)
+    is_sedan = body == "sedan"
+
+    with np.errstate(invalid="ignore"):
+        niaga_on_passenger = passenger & (init == "niaga")
+        conds = [
+            commercial & ~passenger,
+            niaga_on_passenger & ((seats >= 5) | (dimH < 1900)),
+            niaga_on_passenger,
+            seats >= 6,
+            (seats == 5) & (length < 4000),
+            seats == 5,
+            (weight >= 2500) & (dimL >= 5200) & ~passenger,
+            (dimL > 5200) & (is_sedan | ((body == "") & (length > 5200))),
+            commercial & (seats >= 5),
+        ]
+    choices = [
+        "niaga",
+        "keluarga",
+        "perjalanan_jauh",
+        "keluarga",
+        "perkotaan",
+        "keluarga",
+        "niaga",
+        "perjalanan_jauh",
+        "keluarga",
     ]
-    # Pastikan semua fitur ada (isi NaN bila tidak ada)
-    for f in feat_cols:
-        if f not in df.columns:
-            df[f] = np.nan
+    out = np.select(conds, np.array(choices, dtype=object), default=init)
+    return pd.Series(out, index=df.index)
 
-    X = df[feat_cols].copy().apply(lambda col: col.fillna(col.median()), axis=0)
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X.values)
 
-    n = len(df)
-    k_eff = min(k, max(1, int(min(6, max(1, int(np.sqrt(max(1, n/2))))))))
-    km = KMeans(
-        n_clusters=k_eff, n_init=1, max_iter=150, tol=1e-4,
-        algorithm="lloyd", random_state=42
-    )
-
-    if n > MAX_SAMPLES_CLUSTER:
-        rng = np.random.RandomState(42)
-        idx = rng.choice(n, size=MAX_SAMPLES_CLUSTER, replace=False)
-        km.fit(X_scaled[idx])
-        labels = km.predict(X_scaled)
-    else:
-        labels = km.fit_predict(X_scaled)
+# Fitur yang digunakan untuk clustering (harus ada di dataframe)
+CLUSTER_FEAT_COLS = [
+    "length_mm", "width_mm", "height_mm", "wheelbase_mm",
+    "vehicle_weight_kg", "cc_kwh_num", "rim_inch", "tyre_w_mm", "awd_flag"
+]
 
-    C_scaled = km.cluster_centers_
-    C_raw = scaler.inverse_transform(C_scaled)
 
-    # Heuristik label centroid (skala asli)
+def label_centroids(C_raw: np.ndarray, feat_cols: List[str]) -> Dict[int, str]:
+    """
+    Heuristik label centroid (skala asli): tiap centroid diberi label kebutuhan
+    dengan skor heuristik tertinggi (z-score antar centroid).
+    """
     feat_idx = {c: i for i, c in enumerate(feat_cols)}
     length = C_raw[:, feat_idx["length_mm"]]
     width  = C_raw[:, feat_idx["width_mm"]]
@@ -250,7 +277,7 @@ def cluster_and_label(
         mu, sd = np.nanmean(v), np.nanstd(v) + 1e-9
         return (v - mu) / sd
 
-    cc_per_w = np.divide(cc, np.maximum(weight, 1), where=np.isfinite(weight))
+    cc_per_w = np.divide(cc, np.maximum(weight, 1), out=np.full_like(cc, np.nan, dtype=float), where=np.isfinite(weight))
 
     # Scoring heuristik (centroid-level)
     s_trip       = 0.6 * z(wheelb) + 0.3 * z(weight) + 0.2 * z(cc)
@@ -264,64 +291,283 @@ def cluster_and_label(
 
     S = np.stack([s_trip, s_family, s_fun, s_city, s_commercial, s_offroad], axis=1)
     best = np.argmax(S, axis=1)
-    cluster_to_label = {i: NEED_LABELS[j] for i, j in enumerate(best)}
+    return {i: NEED_LABELS[j] for i, j in enumerate(best)}
+
+
+def _use_minibatch(n: int) -> bool:
+    if CLUSTER_BACKEND == "minibatch":
+        return True
+    if CLUSTER_BACKEND == "kmeans":
+        return False
+    return n > MAX_SAMPLES_CLUSTER  # "auto"
+
+
+def cluster_and_label(
+    cand: pd.DataFrame,
+    k: int = 6,
+    copy: bool = True,
+) -> Tuple[pd.DataFrame, Dict[int, str], np.ndarray, List[str], object, np.ndarray]:
+    """
+    KMeans atas fitur kendaraan + heuristik rule-based tambahan.
+    Pipeline:
+      - normalisasi kolom input
+      - clustering KMeans (fit pada fitur numerik)
+      - scoring heuristik untuk tiap kebutuhan
+      - koreksi per-item berdasarkan dimension/body_type/seats
+
+    Backend (config.CLUSTER_BACKEND):
+      - "kmeans"   : Lloyd KMeans penuh, k dibatasi maks 6
+      - "minibatch": MiniBatchKMeans atas SEMUA baris (tanpa subsample),
+                     batch = config.CLUSTER_BATCH_SIZE
+      - "auto"     : minibatch bila baris > MAX_SAMPLES_CLUSTER, selain itu kmeans
+
+    copy=False: kolom hasil (cluster_id, pred_label, dll) ditulis langsung ke `cand`.
+    """
+    try:
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+    except Exception as e:
+        raise RuntimeError("scikit-learn diperlukan untuk klastering") from e
+
+    # Normalisasi / map kolom input agar robust ke variasi dataset
+    df = _ensure_columns(cand, copy=copy)
+
+    feat_cols = list(CLUSTER_FEAT_COLS)
+    # Pastikan semua fitur ada (isi NaN bila tidak ada)
+    for f in feat_cols:
+        if f not in df.columns:
+            df[f] = np.nan
+
+    X = df[feat_cols].copy().apply(lambda col: col.fillna(col.median()), axis=0)
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X.values)
+
+    n = len(df)
+    t0 = time.perf_counter()
+    if _use_minibatch(n):
+        # Tanpa batas 6 cluster: katalog besar butuh k lebih banyak
+        k_eff = min(k, max(1, int(np.sqrt(max(1, n / 2)))))
+        km = MiniBatchKMeans(
+            n_clusters=k_eff, batch_size=CLUSTER_BATCH_SIZE, n_init=1,
+            max_iter=100, random_state=42
+        )
+        labels = km.fit_predict(X_scaled)
+        backend = "minibatch"
+    else:
+        k_eff = min(k, max(1, int(min(6, max(1, int(np.sqrt(max(1, n/2))))))))
+        km = KMeans(
+            n_clusters=k_eff, n_init=1, max_iter=150, tol=1e-4,
+            algorithm="lloyd", random_state=42
+        )
+        if n > MAX_SAMPLES_CLUSTER:
+            rng = np.random.RandomState(42)
+            idx = rng.choice(n, size=MAX_SAMPLES_CLUSTER, replace=False)
+            km.fit(X_scaled[idx])
+            labels = km.predict(X_scaled)
+        else:
+            labels = km.fit_predict(X_scaled)
+        backend = "kmeans"
+    fit_s = time.perf_counter() - t0
+    print(f" [CLUSTER] backend={backend} n={n} k={k_eff} inertia={float(km.inertia_):.1f} fit={fit_s:.3f}s")
+
+    C_scaled = km.cluster_centers_
+    C_raw = scaler.inverse_transform(C_scaled)
+
+    cluster_to_label = label_centroids(C_raw, feat_cols)
 
     # Pasca-proses per-barang: koreksi berdasarkan rules yang lebih deterministik
     df["cluster_id"] = labels
     df["pred_label"] = df["cluster_id"].map(cluster_to_label)
 
-    def decide_label_for_row(row, initial_label):
-        seats = row.get("seats", np.nan)
-        body = row.get("body_type", "")
-        dimL = row.get("dim_length_mm", None)
-        dimW = row.get("dim_width_mm", None)
-        dimH = row.get("dim_height_mm", None)
-        length_mm = row.get("length_mm", dimL)
-        weight_kg = row.get("vehicle_weight_kg", np.nan)
-
-        # Jika dimensi jelas komersial dan body bukan passenger jenis di dataset -> niaga
-        if is_obvious_commercial_by_dimension(dimL, dimW, dimH):
-            if body not in PASSENGER_BODY_TYPES:
-                return "niaga"
-            # body passenger -> lanjutkan pemeriksaan
-
-        # Hindari mem-label MPV/SUV/Van/Alphard-like sebagai niaga
-        if body in PASSENGER_BODY_TYPES:
-            if initial_label == "niaga":
-                if (not np.isnan(seats) and seats >= 5) or (dimH is not None and dimH < 1900):
-                    return "keluarga"
-                if dimL and dimL > 5200 and body == "sedan":
-                    return "perjalanan_jauh"
-                return "keluarga" if (not np.isnan(seats) and seats >=5) else "perjalanan_jauh"
-
-        # Seats logic
-        if not np.isnan(seats):
-            if seats >= 6:
-                return "keluarga"
-            if seats == 5:
-                if (length_mm is not None) and (length_mm < 4000):
-                    return "perkotaan"
-                return "keluarga"
-
-        # Berat besar + dimensi besar => niaga (kecuali body passenger)
-        if (weight_kg is not None and not np.isnan(weight_kg) and weight_kg >= 2500) and (dimL is not None and dimL >= 5200):
-            if body not in PASSENGER_BODY_TYPES:
-                return "niaga"
-
-        # Long sedan => perjalanan_jauh
-        if dimL and dimL > 5200 and (body == "sedan" or (body == "" and length_mm and length_mm > 5200)):
-            return "perjalanan_jauh"
-
-        # Jika dimensi niaga tapi seats banyak -> family
-        if is_obvious_commercial_by_dimension(dimL, dimW, dimH) and (not np.isnan(seats) and seats >=5):
-            return "keluarga"
-
-        return initial_label
-
-    df["pred_label"] = df.apply(lambda r: decide_label_for_row(r, r["pred_label"]), axis=1)
+    df["pred_label"] = relabel_rows(df, df["pred_label"])
 
     return df, cluster_to_label, C_scaled, feat_cols, scaler, C_raw
 
+
+# ============================================================
+# Model klaster inkremental (katalog)
+# ============================================================
+
+class IncrementalClusterModel:
+    """
+    MiniBatchKMeans atas seluruh katalog yang bisa di-update dengan partial_fit
+    untuk varian baru tanpa fit ulang dari nol.
+
+    - Scaler & median pengisi NaN ditetapkan saat fit() pertama lalu dibekukan,
+      supaya ruang fitur centroid tetap konsisten antar partial_fit.
+    - report() mengembalikan k, batch_size, jumlah baris yang sudah dilihat,
+      inertia (batch terakhir) dan waktu fit.
+    """
+
+    def __init__(self, k: int = 6, batch_size: int = 1024, random_state: int = 42):
+        self.k = int(k)
+        self.batch_size = int(batch_size)
+        self.random_state = random_state
+        self.feat_cols = list(CLUSTER_FEAT_COLS)
+        self.scaler = None
+        self.km = None
+        self.medians: Optional[pd.Series] = None
+        self.cluster_to_label: Dict[int, str] = {}
+        self.n_seen = 0
+        self.n_partial_fits = 0
+        self.inertia: Optional[float] = None
+        self.last_fit_s: Optional[float] = None
+        self.total_fit_s = 0.0
+
+    @property
+    def fitted(self) -> bool:
+        return self.km is not None
+
+    def _matrix(self, df: pd.DataFrame) -> np.ndarray:
+        df = _ensure_columns(df)
+        X = pd.DataFrame({
+            c: pd.to_numeric(df[c], errors="coerce") if c in df.columns else np.nan
+            for c in self.feat_cols
+        }, index=df.index)
+        if self.medians is None:
+            self.medians = X.median().fillna(0.0)
+        return X.fillna(self.medians).to_numpy(dtype=float)
+
+    def _after_fit(self, X_scaled: np.ndarray, t0: float) -> None:
+        self.last_fit_s = time.perf_counter() - t0
+        self.total_fit_s += self.last_fit_s
+        self.n_seen += X_scaled.shape[0]
+        self.inertia = float(-self.km.score(X_scaled))
+        C_raw = self.scaler.inverse_transform(self.km.cluster_centers_)
+        self.cluster_to_label = label_centroids(C_raw, self.feat_cols)
+
+    def fit(self, df: pd.DataFrame) -> "IncrementalClusterModel":
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        t0 = time.perf_counter()
+        self.medians = None
+        self.n_seen = 0
+        self.n_partial_fits = 0
+        self.total_fit_s = 0.0
+        X = self._matrix(df)
+        self.scaler = StandardScaler().fit(X)
+        X_scaled = self.scaler.transform(X)
+        k_eff = max(1, min(self.k, X_scaled.shape[0]))
+        self.km = MiniBatchKMeans(
+            n_clusters=k_eff, batch_size=self.batch_size, n_init=1,
+            max_iter=100, random_state=self.random_state
+        ).fit(X_scaled)
+        self._after_fit(X_scaled, t0)
+        return self
+
+    def partial_fit(self, df_new: pd.DataFrame) -> "IncrementalClusterModel":
+        """Update centroid dengan baris baru saja; fit() penuh bila belum pernah fit."""
+        if df_new is None or len(df_new) == 0:
+            return self
+        if not self.fitted:
+            return self.fit(df_new)
+        t0 = time.perf_counter()
+        X_scaled = self.scaler.transform(self._matrix(df_new))
+        self.km.partial_fit(X_scaled)
+        self.n_partial_fits += 1
+        self._after_fit(X_scaled, t0)
+        return self
+
+    def transform_scaled(self, df: pd.DataFrame) -> np.ndarray:
+        return self.scaler.transform(self._matrix(df))
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        return self.km.predict(self.transform_scaled(df))
+
+    def report(self) -> Dict[str, object]:
+        return {
+            "k": int(self.km.n_clusters) if self.fitted else self.k,
+            "batch_size": self.batch_size,
+            "n_seen": self.n_seen,
+            "n_partial_fits": self.n_partial_fits,
+            "inertia": self.inertia,
+            "last_fit_s": self.last_fit_s,
+            "total_fit_s": self.total_fit_s,
+        }
+
+
+# Model katalog (Singleton) + kunci varian yang sudah dilihat
+_CATALOG_MODEL: IncrementalClusterModel | None = None
+_CATALOG_MODEL_SRC: pd.DataFrame | None = None
+_CATALOG_SEEN_KEYS: set = set()
+
+
+def _variant_keys(df: pd.DataFrame) -> pd.Series:
+    brand = df.get("brand", pd.Series([""] * len(df), index=df.index)).astype(str).str.strip().str.upper()
+    model = df.get("model", pd.Series([""] * len(df), index=df.index)).astype(str).str.strip().str.lower()
+    return brand + "|" + model
+
+
+def get_catalog_cluster_model(df_master: pd.DataFrame) -> IncrementalClusterModel:
+    """
+    Model klaster atas seluruh master (k = config.CLUSTER_K). Saat master di-reload,
+    hanya varian yang belum pernah dilihat sejak model dibuat (brand|model, gabungan
+    semua reload) yang di-partial_fit; model tidak di-fit ulang.
+    """
+    global _CATALOG_MODEL, _CATALOG_MODEL_SRC, _CATALOG_SEEN_KEYS
+    if _CATALOG_MODEL is not None and _CATALOG_MODEL_SRC is df_master:
+        return _CATALOG_MODEL
+
+    from .spk_features import get_master_features
+
+    feat = get_master_features(df_master)
+    keys = _variant_keys(feat)
+    if _CATALOG_MODEL is None:
+        model = IncrementalClusterModel(k=CLUSTER_K, batch_size=CLUSTER_BATCH_SIZE).fit(feat)
+    else:
+        model = _CATALOG_MODEL
+        new_rows = ~keys.isin(_CATALOG_SEEN_KEYS)
+        if new_rows.any():
+            model.partial_fit(feat[new_rows.to_numpy()])
+    # gabung (bukan ganti): varian yang hilang lalu muncul lagi tidak di-partial_fit ulang
+    _CATALOG_SEEN_KEYS = _CATALOG_SEEN_KEYS | set(keys)
+    _CATALOG_MODEL, _CATALOG_MODEL_SRC = model, df_master
+    print(f"[CLUSTER] catalog model: {model.report()}")
+    return model
+
+
+# Proyeksi seluruh master ke model katalog (sekali per master): X_scaled,
+# cluster_id dan pred_label per posisi baris -> jalur deadline cukup gather.
+_CATALOG_PROJ: Tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray] | None = None
+
+
+def get_catalog_projection(df_master: pd.DataFrame) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """(X_scaled, cluster_id, pred_label) untuk semua baris master; None bila model katalog belum di-fit."""
+    global _CATALOG_PROJ
+    if _CATALOG_PROJ is not None and _CATALOG_PROJ[0] is df_master:
+        return _CATALOG_PROJ[1:]
+    model = _CATALOG_MODEL
+    if model is None or not model.fitted or _CATALOG_MODEL_SRC is not df_master:
+        return None
+    from .spk_features import get_master_features
+
+    feat = _ensure_columns(get_master_features(df_master))
+    X_scaled = model.transform_scaled(feat)
+    labels = model.km.predict(X_scaled)
+    pred = relabel_rows(feat, pd.Series(labels, index=feat.index).map(model.cluster_to_label))
+    _CATALOG_PROJ = (df_master, X_scaled, labels, pred.to_numpy(dtype=object))
+    return _CATALOG_PROJ[1:]
+
+
+def approx_need_scores(
+    df_master: pd.DataFrame, idx: np.ndarray, want_labels: List[str]
+) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Pengganti murah cluster_and_label + need_similarity_scores untuk ranking
+    yang dikejar deadline: baris master `idx` diambil dari proyeksi ke model
+    klaster katalog (tanpa fit KMeans per request).
+    Return (need_score, cluster_id, pred_label) atau None bila model belum siap.
+    """
+    proj = get_catalog_projection(df_master)
+    if proj is None:
+        return None
+    X_scaled, labels, pred = proj
+    model = _CATALOG_MODEL
+    scores = need_similarity_scores(X_scaled[idx], model.km.cluster_centers_, labels[idx], model.cluster_to_label, want_labels)
+    return scores, labels[idx], pred[idx]
+
+
 def need_similarity_scores(
     X_scaled: np.ndarray,
     C_scaled: np.ndarray,
@@ -340,19 +586,16 @@ def need_similarity_scores(
     if not want_labels:
         return np.zeros(X_scaled.shape[0])
 
-    label_to_cids: Dict[str, List[int]] = {}
-    for cid, lab in cluster_to_label.items():
-        label_to_cids.setdefault(lab, []).append(cid)
-
-    sims_per_need = []
-    for need in want_labels:
-        cids = label_to_cids.get(need, [])
-        if not cids:
-            sims_per_need.append(np.zeros(X_scaled.shape[0]))
-            continue
-        D = np.asarray(pairwise_distances(X_scaled, C_scaled[cids, :], metric="euclidean"))
-        sim = 1.0 / (1.0 + D)  # 0..1
-        sims_per_need.append(np.max(sim, axis=1))
-
-    sims = np.vstack(sims_per_need)
-    return sims.mean(axis=0)
+    # Jarak ke SEMUA centroid dalam satu panggilan, lalu reduksi per label kebutuhan
+    D = np.asarray(pairwise_distances(X_scaled, C_scaled, metric="euclidean"))
+    sim = 1.0 / (1.0 + D)  # 0..1, shape (n, k)
+
+    cid_labels = np.array([cluster_to_label.get(cid) for cid in range(C_scaled.shape[0])], dtype=object)
+    want = np.asarray(want_labels, dtype=object)
+    M = cid_labels[None, :] == want[:, None]  # (n_need, k) mask centroid per kebutuhan
+
+    # max sim per kebutuhan (kebutuhan tanpa centroid -> 0), lalu rata-rata antar kebutuhan
+    masked = np.where(M[:, None, :], sim[None, :, :], -np.inf)
+    per_need = masked.max(axis=2)
+    per_need[~M.any(axis=1)] = 0.0
+    return per_need.mean(axis=0)
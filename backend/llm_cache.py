@@ -0,0 +1,171 @@
+# file: backend/llm_cache.py
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_BYTES, LLM_CACHE_PATH
+
+# ============================================================
+# Cache respons LLM (content-addressed, SQLite WAL di disk)
+# ============================================================
+# Kunci = sha256(model | sha256(system prompt) | konten user ternormalisasi | temperature).
+# ttl_s None -> tidak kedaluwarsa (NLU, temperature 0 -> deterministik);
+# selain itu entri dibuang setelah ttl_s detik. Total ukuran dijaga di bawah
+# max_bytes dengan membuang entri yang paling lama tidak diakses.
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_content(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "").strip().lower())
+
+
+def cache_key(model: str, system_prompt: str, user_content: str, temperature: Optional[float]) -> str:
+    sys_h = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+    raw = "\x1f".join([model or "", sys_h, normalize_content(user_content), repr(temperature)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        c = self._conn()
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, model TEXT, created REAL, accessed REAL,"
+            " expires REAL, size INTEGER, response TEXT)"
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        c = self._conn()
+        row = c.execute("SELECT response, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] < now):
+            if row is not None:
+                c.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            with self._lock:
+                self.misses += 1
+            return None
+        c.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, model: str, response: str, ttl_s: Optional[float]) -> None:
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        expires = now + ttl_s if ttl_s else None
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, created, accessed, expires, size, response)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, now, now, expires, size, response),
+            )
+            self._evict(c, now)
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+    def _evict(self, c: sqlite3.Connection, now: float) -> None:
+        c.execute("DELETE FROM llm_cache WHERE expires IS NOT NULL AND expires < ?", (now,))
+        (total,) = c.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if total <= self.max_bytes:
+            return
+        drop = []
+        for key, size in c.execute("SELECT key, size FROM llm_cache ORDER BY accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            drop.append((key,))
+            total -= size
+        c.executemany("DELETE FROM llm_cache WHERE key = ?", drop)
+
+    def get_or_call(
+        self,
+        model: str,
+        system_prompt: str,
+        user_content: str,
+        call: Callable[[], str],
+        temperature: Optional[float] = None,
+        ttl_s: Optional[float] = None,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """
+        Ambil dari cache; bila miss, panggil `call()` lalu simpan hasilnya.
+        validate(out) False -> hasil dikembalikan tapi tidak disimpan (dan entri
+        lama yang tidak lolos validasi dianggap miss), supaya jawaban rusak
+        tidak tersimpan selamanya.
+        """
+        key = cache_key(model, system_prompt, user_content, temperature)
+        try:
+            hit = self.get(key)
+        except Exception as e:
+            print(f"[LLM_CACHE] get gagal: {e}")
+            hit = None
+        if hit is not None and (validate is None or validate(hit)):
+            return hit
+        out = call()
+        if out and (validate is None or validate(out)):
+            try:
+                self.put(key, model, out, ttl_s)
+            except Exception as e:
+                print(f"[LLM_CACHE] put gagal: {e}")
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        n, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "enabled": True,
+            "path": self.path,
+            "entries": int(n),
+            "bytes": int(total),
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+
+_LLM_CACHE: Optional[LLMResponseCache] = None
+_LLM_CACHE_FAILED = False
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Singleton cache (None bila dimatikan atau database gagal dibuka)."""
+    global _LLM_CACHE, _LLM_CACHE_FAILED
+    if not LLM_CACHE_ENABLED or _LLM_CACHE_FAILED:
+        return None
+    if _LLM_CACHE is None:
+        try:
+            _LLM_CACHE = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES)
+        except Exception as e:
+            print(f"[LLM_CACHE] gagal dibuka ({e}); cache dimatikan")
+            _LLM_CACHE_FAILED = True
+            return None
+    return _LLM_CACHE
@@ -6,10 +6,22 @@ import os
 from typing import Any, Dict, List
 
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 
+from .cancellation import CANCEL_STATS
+from .chat_nlu import NLU_STATS
+from .chat_sessions import CHAT_SESSIONS
+from .compression import COMPRESSION_STATS
+from .data_loader import get_master_data
 from .config import _p, RETAIL_GLOB, WHOLESALE_GLOB
 from .images import IMG_EXTS
+from .llm_cache import get_llm_cache
 from .loaders import load_specs
+from .rank_session import RANK_SESSION_STATS
+from .recommendation_state import get_store
+from .singleflight import RECOMMEND_FLIGHT
+from .speculative import SPECULATIVE_SPK
+from .warmup import WARMUP
 from .spk_utils import fuel_to_code
 
 router = APIRouter(tags=["meta"])
@@ -97,3 +109,36 @@ def meta():
             "wholesale": have_wh,
         },
     }
+
+
+@router.get("/metrics")
+def metrics() -> Dict[str, Any]:
+    """Ringkasan metrik runtime: kompresi, single-flight, store rekomendasi, sesi, NLU & cache LLM."""
+    llm_cache = get_llm_cache()
+    return {
+        "compression": COMPRESSION_STATS.snapshot(),
+        "singleflight": {"recommendations": RECOMMEND_FLIGHT.snapshot()},
+        "recommendation_store": get_store().stats(),
+        "chat_sessions": CHAT_SESSIONS.stats(),
+        "nlu_paths": NLU_STATS.snapshot(),
+        "chat_speculation": SPECULATIVE_SPK.snapshot(),
+        "cancellations": CANCEL_STATS.snapshot(),
+        "rank_sessions": RANK_SESSION_STATS.snapshot(),
+        "llm_cache": llm_cache.stats() if llm_cache is not None else {"enabled": False},
+    }
+
+
+@router.get("/ready")
+def ready():
+    """
+    Readiness untuk load balancer: 200 setelah warmup selesai, selain itu 503.
+    WARMUP_MODE=off: 200 begitu master berhasil dimuat (dimuat di sini bila belum).
+    """
+    snap = WARMUP.snapshot()
+    if snap["state"] == "off":
+        try:
+            master = get_master_data()
+            snap["ready"] = master is not None and not master.empty
+        except Exception as e:
+            snap["error"] = str(e)
+    return JSONResponse(snap, status_code=200 if snap["ready"] else 503)
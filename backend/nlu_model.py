@@ -0,0 +1,258 @@
+# file: backend/nlu_model.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .chat_nlu import CANONICAL_NEEDS, VALID_NEEDS, need_for_token, rule_based_nlu, scan_text
+from .config import NLU_LOG_PATH, NLU_MODEL_PATH
+
+# ============================================================
+# NLU lokal: TF-IDF + klasifier linear (AI_MODE="CLASSIFIER")
+# ============================================================
+# Memprediksi field skema SYSTEM_PROMPT_NLU yang berupa kategori:
+#   intent (multikelas), needs (multi-label, satu klasifier biner per kebutuhan),
+#   filters.trans & filters.fuel (multikelas dengan kelas "none").
+# Budget & brand tetap diambil dari NLU aturan (angka / nama dari master).
+# Dilatih dari log giliran chat yang dilabeli LLM (NLU_LOG_PATH) lewat
+# `python -m backend.nlu_train`; CPU saja, prediksi ~1 ms per pesan.
+# sklearn diimpor saat training / load model, bukan saat impor modul.
+
+INTENTS = ("SEARCH", "RESET", "INFO", "OTHER")
+TRANS_CLASSES = ("matic", "manual")
+FUEL_CLASSES = ("bensin", "diesel", "hybrid", "ev")
+NEED_ORDER = sorted(VALID_NEEDS)
+MODEL_VERSION = 1
+
+
+# ------------------------------------------------------------
+# Label dari output NLU (LLM) -> target klasifier
+# ------------------------------------------------------------
+def _canon_needs(raw: Any) -> List[str]:
+    out: List[str] = []
+    for item in raw or []:
+        s = str(item).strip().lower()
+        if s in VALID_NEEDS:
+            out.append(s)
+            continue
+        if s in CANONICAL_NEEDS:
+            out.append(CANONICAL_NEEDS[s])
+            continue
+        found, _, _ = scan_text(s)
+        if found:
+            out.extend(found)
+        else:
+            n = need_for_token(s)
+            if n:
+                out.append(n)
+    return list(dict.fromkeys(out))
+
+
+def _one_of(value: Any, classes: Tuple[str, ...]) -> str:
+    if isinstance(value, list):
+        value = value[0] if value else None
+    v = str(value or "").strip().lower()
+    return v if v in classes else "none"
+
+
+def labels_from_nlu(nlu: Dict[str, Any]) -> Dict[str, Any]:
+    """Output NLU (skema LLM) -> {"intent", "needs", "trans", "fuel"} ternormalisasi."""
+    nlu = nlu or {}
+    filters = nlu.get("filters") or {}
+    intent = str(nlu.get("intent") or "OTHER").strip().upper()
+    return {
+        "intent": intent if intent in INTENTS else "OTHER",
+        "needs": _canon_needs(nlu.get("needs")),
+        "trans": _one_of(filters.get("trans"), TRANS_CLASSES),
+        "fuel": _one_of(filters.get("fuel") or nlu.get("fuel"), FUEL_CLASSES),
+    }
+
+
+# ------------------------------------------------------------
+# Log giliran chat (data latih)
+# ------------------------------------------------------------
+_LOG_LOCK = threading.Lock()
+
+
+def log_nlu_turn(text: str, step: str, nlu: Dict[str, Any], path: str = "llm") -> None:
+    """Tambahkan satu baris JSONL {ts, text, step, path, nlu} bila NLU_LOG_PATH diset."""
+    if not NLU_LOG_PATH or not text:
+        return
+    line = json.dumps(
+        {"ts": time.time(), "text": text, "step": step, "path": path, "nlu": nlu},
+        ensure_ascii=False, default=str,
+    )
+    try:
+        with _LOG_LOCK:
+            os.makedirs(os.path.dirname(os.path.abspath(NLU_LOG_PATH)), exist_ok=True)
+            with open(NLU_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except Exception as e:
+        print(f"[NLU LOG] gagal menulis log: {e}")
+
+
+def read_turn_log(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """[(teks, label)] dari log JSONL; baris rusak dilewati."""
+    rows: List[Tuple[str, Dict[str, Any]]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            text = str(rec.get("text") or "").strip()
+            if text:
+                rows.append((text, labels_from_nlu(rec.get("nlu") or {})))
+    return rows
+
+
+# ------------------------------------------------------------
+# Model
+# ------------------------------------------------------------
+class _Head:
+    """Klasifier linear; bila data latih hanya punya satu kelas -> konstanta."""
+
+    def __init__(self, C: float = 4.0):
+        self.C = C
+        self.clf = None
+        self.const: Optional[str] = None
+
+    def fit(self, X, y: List[str]) -> "_Head":
+        if len(set(y)) < 2:
+            self.const = y[0] if y else "none"
+            return self
+        from sklearn.linear_model import LogisticRegression
+
+        self.clf = LogisticRegression(C=self.C, max_iter=2000, class_weight="balanced")
+        self.clf.fit(X, y)
+        return self
+
+    def predict(self, X) -> Tuple[List[str], List[float]]:
+        n = X.shape[0]
+        if self.clf is None:
+            return [self.const] * n, [1.0] * n
+        proba = self.clf.predict_proba(X)
+        idx = proba.argmax(axis=1)
+        classes = self.clf.classes_
+        return [str(classes[i]) for i in idx], [float(proba[r, i]) for r, i in enumerate(idx)]
+
+
+class LocalNLU:
+    """TF-IDF (kata 1-2 + karakter 2-5) bersama untuk semua head."""
+
+    def __init__(self):
+        self.vectorizer = None
+        self.intent = _Head()
+        self.trans = _Head()
+        self.fuel = _Head()
+        self.needs: Dict[str, _Head] = {}
+        self.meta: Dict[str, Any] = {}
+
+    def fit(self, texts: List[str], labels: List[Dict[str, Any]]) -> "LocalNLU":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.pipeline import FeatureUnion
+
+        self.vectorizer = FeatureUnion([
+            ("word", TfidfVectorizer(analyzer="word", ngram_range=(1, 2), sublinear_tf=True, lowercase=True)),
+            ("char", TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True, lowercase=True)),
+        ])
+        X = self.vectorizer.fit_transform(texts)
+        self.intent.fit(X, [l["intent"] for l in labels])
+        self.trans.fit(X, [l["trans"] for l in labels])
+        self.fuel.fit(X, [l["fuel"] for l in labels])
+        self.needs = {
+            n: _Head().fit(X, ["yes" if n in l["needs"] else "no" for l in labels])
+            for n in NEED_ORDER
+        }
+        self.meta = {"version": MODEL_VERSION, "trained_at": time.time(), "n_train": len(texts)}
+        return self
+
+    def predict_labels(self, texts: List[str]) -> List[Dict[str, Any]]:
+        X = self.vectorizer.transform(texts)
+        intents, p_int = self.intent.predict(X)
+        trans, p_tr = self.trans.predict(X)
+        fuel, p_fu = self.fuel.predict(X)
+        need_preds = {n: h.predict(X) for n, h in self.needs.items()}
+        out = []
+        for i in range(len(texts)):
+            needs = [n for n in NEED_ORDER if need_preds[n][0][i] == "yes"]
+            # confidence = keyakinan terendah di antara head multikelas
+            conf = min(p_int[i], p_tr[i], p_fu[i])
+            out.append({"intent": intents[i], "needs": needs, "trans": trans[i], "fuel": fuel[i], "confidence": conf})
+        return out
+
+    def predict(self, text: str, step: str = "INIT", brands: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Satu pesan -> dict skema LLM (+ confidence, path="local")."""
+        lab = self.predict_labels([text])[0]
+        rules = rule_based_nlu(text, step, brands)
+        filters: Dict[str, Any] = {}
+        if rules["filters"].get("brand"):
+            filters["brand"] = rules["filters"]["brand"]
+        if lab["trans"] != "none":
+            filters["trans"] = lab["trans"]
+        if lab["fuel"] != "none":
+            filters["fuel"] = lab["fuel"]
+        return {
+            "intent": lab["intent"],
+            "budget": rules["budget"],
+            "needs": lab["needs"],
+            "filters": filters,
+            "confidence": round(lab["confidence"], 3),
+            "path": "local",
+        }
+
+    def save(self, path: str) -> None:
+        import joblib
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        joblib.dump(self, path)
+
+
+def load_local_nlu(path: str) -> LocalNLU:
+    import joblib
+
+    model = joblib.load(path)
+    if not isinstance(model, LocalNLU) or model.meta.get("version") != MODEL_VERSION:
+        raise ValueError(f"model NLU di {path} tidak kompatibel, latih ulang")
+    return model
+
+
+_LOCAL_NLU: Optional[LocalNLU] = None
+_LOCAL_NLU_MTIME: Optional[float] = None
+# mtime file yang gagal dimuat: tidak dicoba lagi sampai file berubah
+_LOCAL_NLU_FAILED_MTIME: Optional[float] = None
+_LOCAL_NLU_LOCK = threading.Lock()
+
+
+def get_local_nlu() -> Optional[LocalNLU]:
+    """
+    Singleton model lokal; dimuat ulang bila file berubah. None bila belum
+    dilatih atau file terakhir gagal dimuat (dicoba lagi setelah file berubah).
+    """
+    global _LOCAL_NLU, _LOCAL_NLU_MTIME, _LOCAL_NLU_FAILED_MTIME
+    try:
+        mtime = os.path.getmtime(NLU_MODEL_PATH)
+    except OSError:
+        return None
+    if _LOCAL_NLU is not None and _LOCAL_NLU_MTIME == mtime:
+        return _LOCAL_NLU
+    if _LOCAL_NLU_FAILED_MTIME == mtime:
+        return None
+    with _LOCAL_NLU_LOCK:
+        if _LOCAL_NLU_FAILED_MTIME == mtime:
+            return None
+        if _LOCAL_NLU is None or _LOCAL_NLU_MTIME != mtime:
+            try:
+                _LOCAL_NLU = load_local_nlu(NLU_MODEL_PATH)
+                _LOCAL_NLU_MTIME = mtime
+                _LOCAL_NLU_FAILED_MTIME = None
+                print(f"[NLU LOCAL] model dimuat dari {NLU_MODEL_PATH} (n_train={_LOCAL_NLU.meta.get('n_train')})")
+            except Exception as e:
+                _LOCAL_NLU_FAILED_MTIME = mtime
+                print(f"[NLU LOCAL] gagal memuat model: {e} (tidak dicoba lagi sampai file berubah)")
+                return None
+    return _LOCAL_NLU
+
@@ -0,0 +1,181 @@
+# file: backend/nlu_train.py
+# Training + laporan akurasi/latensi NLU lokal (AI_MODE="CLASSIFIER").
+#
+#   python -m backend.nlu_train --log data/nlu_turns.jsonl        # log giliran berlabel LLM
+#   python -m backend.nlu_train --bootstrap 3000                  # tanpa log: data sintetis
+#   python -m backend.nlu_train --log data/nlu_turns.jsonl --bootstrap 1000 --out data/nlu_model.joblib
+#   python -m backend.nlu_train --eval-only --log data/nlu_turns.jsonl   # uji model yang ada
+#
+# Data dipisah train/test (--test-size); laporan berisi akurasi intent/trans/fuel,
+# exact-match & micro-F1 needs, serta latensi prediksi satu pesan (median/p95).
+# Model akhir dilatih ulang dengan seluruh data sebelum disimpan.
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from .chat_nlu import CANONICAL_NEEDS, _FUEL_WORDS, _TRANS_WORDS
+from .config import NLU_LOG_PATH, NLU_MODEL_PATH
+from .nlu_model import LocalNLU, load_local_nlu, read_turn_log
+
+Example = Tuple[str, Dict[str, Any]]
+
+# ------------------------------------------------------------
+# Data sintetis (bootstrap sebelum ada log)
+# ------------------------------------------------------------
+_OPENERS = ["", "mau cari mobil", "cari mobil", "pengen mobil", "tolong carikan mobil", "saya butuh mobil", "kak, mau mobil"]
+_NEED_LINKS = ["buat", "untuk", "yang cocok buat", "sering dipakai", "biasanya dipakai"]
+_BUDGETS = ["", "budget 200 juta", "dana 300jt", "maksimal 450 juta", "sekitar 1,2 miliar", "rp 250.000.000", "dibawah 350 jt"]
+_RESET = ["reset", "ulangi", "mulai baru", "mulai dari awal", "ganti budget", "clear", "ulang dari awal ya"]
+_INFO = [
+    "apa bedanya matic dan manual", "hybrid itu apa sih", "bedanya diesel sama bensin apa",
+    "mobil listrik ngecasnya berapa lama", "apa itu cvt", "kenapa mobil hybrid lebih mahal",
+    "apa kelebihan mesin diesel", "berapa konsumsi bbm rata-rata", "pajak mobil listrik berapa",
+]
+_OTHER = [
+    "halo", "hai kak", "terima kasih", "makasih ya", "oke sip", "selamat pagi", "kamu siapa",
+    "lagi apa", "wkwk", "hmm", "nanti saya kabari", "test",
+]
+
+
+def bootstrap_examples(n: int, seed: int = 7) -> List[Example]:
+    """Kalimat sintetis dari kamus alias + label yang diketahui dari pembentuknya."""
+    rng = random.Random(seed)
+    aliases = list(CANONICAL_NEEDS.items())
+    trans_words = list(_TRANS_WORDS.items())
+    fuel_words = list(_FUEL_WORDS.items())
+    out: List[Example] = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.08:
+            out.append((rng.choice(_RESET), {"intent": "RESET", "needs": [], "trans": "none", "fuel": "none"}))
+            continue
+        if r < 0.16:
+            out.append((rng.choice(_INFO), {"intent": "INFO", "needs": [], "trans": "none", "fuel": "none"}))
+            continue
+        if r < 0.24:
+            out.append((rng.choice(_OTHER), {"intent": "OTHER", "needs": [], "trans": "none", "fuel": "none"}))
+            continue
+
+        parts = [rng.choice(_OPENERS)]
+        needs: List[str] = []
+        for alias, canon in rng.sample(aliases, rng.choice([0, 1, 1, 2, 2, 3])):
+            parts.append(f"{rng.choice(_NEED_LINKS)} {alias}")
+            needs.append(canon)
+        trans = "none"
+        if rng.random() < 0.35:
+            word, trans = rng.choice(trans_words)
+            parts.append(rng.choice(["", "transmisi ", "yang "]) + word)
+        fuel = "none"
+        if rng.random() < 0.3:
+            word, fuel = rng.choice(fuel_words)
+            parts.append(rng.choice(["", "mesin ", "bahan bakar "]) + word)
+        parts.append(rng.choice(_BUDGETS))
+        head, tail = parts[0], parts[1:]
+        rng.shuffle(tail)
+        text = " ".join(p for p in [head, *tail] if p).strip() or "mobil"
+        out.append((text, {"intent": "SEARCH", "needs": list(dict.fromkeys(needs)), "trans": trans, "fuel": fuel}))
+    return out
+
+
+# ------------------------------------------------------------
+# Evaluasi
+# ------------------------------------------------------------
+def evaluate(model: LocalNLU, data: List[Example]) -> Dict[str, Any]:
+    texts = [t for t, _ in data]
+    gold = [l for _, l in data]
+    pred = model.predict_labels(texts)
+
+    def acc(field: str) -> float:
+        return sum(p[field] == g[field] for p, g in zip(pred, gold)) / len(gold)
+
+    tp = fp = fn = 0
+    exact = 0
+    for p, g in zip(pred, gold):
+        ps, gs = set(p["needs"]), set(g["needs"])
+        tp += len(ps & gs)
+        fp += len(ps - gs)
+        fn += len(gs - ps)
+        exact += ps == gs
+    prec = tp / (tp + fp) if tp + fp else 1.0
+    rec = tp / (tp + fn) if tp + fn else 1.0
+
+    # latensi satu pesan (jalur chat: vektorisasi + semua head)
+    lat: List[float] = []
+    for t in texts[:500]:
+        t0 = time.perf_counter()
+        model.predict_labels([t])
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    lat.sort()
+    return {
+        "n": len(gold),
+        "intent_acc": acc("intent"),
+        "trans_acc": acc("trans"),
+        "fuel_acc": acc("fuel"),
+        "needs_exact": exact / len(gold),
+        "needs_micro_f1": (2 * prec * rec / (prec + rec)) if prec + rec else 0.0,
+        "latency_ms_median": statistics.median(lat),
+        "latency_ms_p95": lat[min(len(lat) - 1, int(0.95 * len(lat)))],
+    }
+
+
+def print_report(title: str, rep: Dict[str, Any]) -> None:
+    print(f"\n[REPORT] {title} (n={rep['n']})")
+    for key in ("intent_acc", "trans_acc", "fuel_acc", "needs_exact", "needs_micro_f1"):
+        print(f"  {key:18s} {rep[key]:.3f}")
+    print(f"  {'latensi median':18s} {rep['latency_ms_median']:.2f} ms")
+    print(f"  {'latensi p95':18s} {rep['latency_ms_p95']:.2f} ms")
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Latih & evaluasi NLU lokal (TF-IDF + linear).")
+    ap.add_argument("--log", default=NLU_LOG_PATH or None,
+                    help="log JSONL giliran chat berlabel (default env NLU_LOG_PATH)")
+    ap.add_argument("--bootstrap", type=int, default=0, help="tambah N contoh sintetis")
+    ap.add_argument("--out", default=NLU_MODEL_PATH, help=f"path model (default {NLU_MODEL_PATH})")
+    ap.add_argument("--test-size", type=float, default=0.2, help="porsi data uji")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--eval-only", action="store_true", help="evaluasi model di --out tanpa training")
+    args = ap.parse_args(argv)
+
+    data: List[Example] = []
+    if args.log:
+        if not os.path.exists(args.log):
+            print(f"[TRAIN] log tidak ditemukan: {args.log}")
+            return 2
+        data += read_turn_log(args.log)
+        print(f"[TRAIN] {len(data)} giliran dari {args.log}")
+    if args.bootstrap:
+        data += bootstrap_examples(args.bootstrap, args.seed)
+        print(f"[TRAIN] + {args.bootstrap} contoh sintetis")
+    if len(data) < 10:
+        print("[TRAIN] data terlalu sedikit (<10); pakai --log dan/atau --bootstrap N")
+        return 2
+
+    if args.eval_only:
+        print_report(f"model {args.out}", evaluate(load_local_nlu(args.out), data))
+        return 0
+
+    rng = random.Random(args.seed)
+    rng.shuffle(data)
+    n_test = max(1, int(len(data) * args.test_size))
+    test, train = data[:n_test], data[n_test:]
+
+    t0 = time.perf_counter()
+    model = LocalNLU().fit([t for t, _ in train], [l for _, l in train])
+    print(f"[TRAIN] fit {len(train)} contoh dalam {time.perf_counter() - t0:.2f}s")
+    print_report("held-out", evaluate(model, test))
+
+    final = LocalNLU().fit([t for t, _ in data], [l for _, l in data])
+    final.save(args.out)
+    print(f"\n[TRAIN] model ({len(data)} contoh) disimpan ke {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# file: backend/rank_session.py
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cancellation import CancelToken
+from .config import RANK_SESSION_CACHE, SPK_SCORE_MODE
+from .spk_needs import sanitize_needs
+from .spk_rank import (
+    ALPHA_PRICE,
+    Deadline,
+    cluster_fit,
+    cluster_need_scores,
+    dedup_keys,
+    dedup_order,
+    get_rank_prep,
+    hard_stage,
+    pref_scores,
+    price_fit_scores,
+    price_window,
+    soft_stage,
+    top_frame,
+)
+from .spk_scores import SCORE_MODES
+from .spk_stats import PercentileStats
+from .spk_utils import _ensure_df, assign_array_safe
+
+# ============================================================
+# Sesi re-ranking live (satu koneksi WebSocket /ws/recommendations)
+# ============================================================
+# Parameter terkini diubah sebagian per pesan; tiap tahap rank_candidates
+# di-memo per sesi dengan kunci = input yang benar-benar dibacanya:
+#   hard constraints  : jendela kandidat (budget + brand/trans/fuel) + HIMPUNAN needs
+#   fit klaster       : kandidat lolos hard (tidak bergantung needs)
+#   need_score, pref  : kandidat + urutan needs
+#   soft/style        : kandidat + himpunan needs
+#   price_fit         : kandidat + budget (selalu dihitung ulang, murah)
+# Geser budget tanpa mengubah himpunan kandidat -> hanya price_fit + dedup;
+# ubah urutan needs -> tanpa hard constraints, fit klaster & soft.
+# Hasil identik dengan rank_candidates tanpa deadline.
+
+FILTER_KEYS = ("brand", "trans_choice", "fuels")
+
+
+def _idx_key(idx: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(idx).tobytes()).hexdigest()
+
+
+class RankSessionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.updates = 0
+        self.stage_hits = 0
+        self.stage_misses = 0
+
+    def add(self, **delta: int) -> None:
+        with self._lock:
+            for k, v in delta.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self.open,
+                "updates": self.updates,
+                "stage_hits": self.stage_hits,
+                "stage_misses": self.stage_misses,
+            }
+
+
+RANK_SESSION_STATS = RankSessionStats()
+
+
+class RankSession:
+    def __init__(self, df_master: pd.DataFrame, cache_entries: int = RANK_SESSION_CACHE):
+        self.df_master = df_master
+        self.cache_entries = max(1, int(cache_entries))
+        self.budget: Optional[float] = None
+        self.needs: List[str] = []
+        self.filters: Dict[str, Any] = {}
+        self.topn = 6
+        self.session_id: Optional[str] = None
+        self.computed: List[str] = []
+        self._memo: Dict[str, "OrderedDict[Any, Any]"] = {}
+        self._price_all = pd.to_numeric(df_master["price"], errors="coerce").to_numpy(dtype=float)
+
+    def reset_master(self, df_master: pd.DataFrame) -> None:
+        """Master di-reload: parameter tetap, semua memo tahap dibuang."""
+        self.df_master = df_master
+        self._memo.clear()
+        self._price_all = pd.to_numeric(df_master["price"], errors="coerce").to_numpy(dtype=float)
+
+    # ------------------------------------------------------------
+    # Parameter
+    # ------------------------------------------------------------
+    def update(self, patch: Dict[str, Any]) -> None:
+        """
+        Gabungkan perubahan parsial. Field yang tidak dikirim tetap;
+        filters digabung per kunci (null / "" / [] -> filter dihapus).
+        Seluruh patch divalidasi dulu; satu field salah -> ValueError dan
+        sesi tidak berubah sama sekali.
+        """
+        budget, needs, topn, filters = self.budget, self.needs, self.topn, dict(self.filters)
+        if patch.get("budget") is not None:
+            try:
+                budget = float(patch["budget"])
+            except (TypeError, ValueError):
+                raise ValueError("budget harus angka") from None
+            if not budget > 0:
+                raise ValueError("budget harus > 0")
+        if patch.get("needs") is not None:
+            if not isinstance(patch["needs"], list):
+                raise ValueError("needs harus list")
+            needs = sanitize_needs(patch["needs"])
+        if patch.get("topn") is not None:
+            try:
+                topn = int(patch["topn"])
+            except (TypeError, ValueError):
+                raise ValueError("topn harus bilangan bulat") from None
+            if topn <= 0:
+                raise ValueError("topn harus > 0")
+        patch_filters = patch.get("filters") or {}
+        if not isinstance(patch_filters, dict):
+            raise ValueError("filters harus objek")
+        for key, value in patch_filters.items():
+            if key not in FILTER_KEYS:
+                continue
+            if value in (None, "", []):
+                filters.pop(key, None)
+            elif key == "fuels":
+                if not isinstance(value, list):
+                    raise ValueError("filters.fuels harus list")
+                filters[key] = list(value)
+            else:
+                filters[key] = value
+
+        self.budget, self.needs, self.topn, self.filters = budget, needs, topn, filters
+        if patch.get("session_id"):
+            self.session_id = str(patch["session_id"])
+        RANK_SESSION_STATS.add(updates=1)
+
+    # ------------------------------------------------------------
+    # Memo per tahap
+    # ------------------------------------------------------------
+    def _memo_get(self, stage: str, key: Any, fn: Callable[[], Any]) -> Any:
+        memo = self._memo.setdefault(stage, OrderedDict())
+        if key in memo:
+            memo.move_to_end(key)
+            RANK_SESSION_STATS.add(stage_hits=1)
+            return memo[key]
+        value = fn()
+        memo[key] = value
+        while len(memo) > self.cache_entries:
+            memo.popitem(last=False)
+        self.computed.append(stage)
+        RANK_SESSION_STATS.add(stage_misses=1)
+        return value
+
+    # ------------------------------------------------------------
+    # Ranking
+    # ------------------------------------------------------------
+    def rank(self, cancel: Optional[CancelToken] = None) -> pd.DataFrame:
+        """Top-n untuk parameter terkini (frame kosong bila tidak ada kandidat)."""
+        if self.budget is None:
+            raise ValueError("budget belum diset")
+        t0 = time.perf_counter()
+        check = cancel.check if cancel is not None else (lambda stage: None)
+        self.computed = []
+        df, budget, needs, filters = self.df_master, self.budget, self.needs, self.filters
+        score_mode = SPK_SCORE_MODE.lower()
+        if score_mode not in SCORE_MODES:
+            score_mode = "relative"
+        needs_set = frozenset(needs)
+        prep = get_rank_prep(df, needs, filters, score_mode)
+
+        check("filter")
+        lo, cap = price_window(budget)
+        price_all = self._price_all
+        idx = np.flatnonzero((price_all <= cap) & (price_all >= lo))
+        if prep.brand_mask is not None:
+            idx = idx[prep.brand_mask[idx]]
+        idx = idx[prep.trans_mask[idx]]
+        if prep.fuel_mask is not None:
+            idx = idx[prep.fuel_mask[idx]]
+        if idx.size == 0:
+            return _ensure_df(df.iloc[idx])
+
+        check("hard_constraints")
+        hard_idx, cand_feat = self._memo_get("hard", (_idx_key(idx), needs_set), lambda: hard_stage(df, idx, needs))
+        if hard_idx.size == 0:
+            return _ensure_df(cand_feat)
+        hkey = _idx_key(hard_idx)
+
+        check("cluster")
+        fit = self._memo_get("cluster", hkey, lambda: cluster_fit(cand_feat))
+        cand, need_score = self._memo_get(
+            "need_score", (hkey, tuple(needs)), lambda: cluster_need_scores(fit, cand_feat, needs)
+        )
+        assign_array_safe(cand, "need_score", need_score, fallback=0.0)
+        stats = self._memo_get("stats", hkey, lambda: PercentileStats(cand))
+
+        check("score")
+        cand["price_fit"] = price_fit_scores(cand["price"], budget, stats)
+        pref = self._memo_get(
+            "pref", (hkey, tuple(needs), score_mode),
+            lambda: pref_scores(cand, hard_idx, needs, prep, score_mode, stats),
+        )
+        cand["fit_score"] = ((1.0 - ALPHA_PRICE) * pref + ALPHA_PRICE * cand["price_fit"]).clip(0, 1)
+
+        check("soft")
+
+        def _soft() -> Tuple[np.ndarray, np.ndarray]:
+            soft_stage(cand, hard_idx, needs, prep, stats, Deadline(None), [])
+            return cand["soft_mult"].to_numpy(), cand["style_mult"].to_numpy()
+
+        cand["soft_mult"], cand["style_mult"] = self._memo_get("soft", (hkey, needs_set), _soft)
+        cand["raw_score"] = cand["fit_score"]
+        cand["fit_score"] = (cand["fit_score"] * cand["soft_mult"] * cand["style_mult"]).clip(0, 1.0)
+
+        check("dedup")
+        keys = self._memo_get("dedup", hkey, lambda: dedup_keys(cand))
+        out = top_frame(cand, dedup_order(keys, cand["fit_score"].to_numpy()), self.topn, budget, needs)
+        print(
+            f" [WS RANK] budget={budget:,.0f} needs={needs} kandidat={len(hard_idx)} "
+            f"dihitung_ulang={self.computed or ['price']} t={(time.perf_counter() - t0) * 1000:.1f}ms"
+        )
+        return _ensure_df(out)
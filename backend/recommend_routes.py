@@ -1,20 +1,29 @@
 # file: backend/recommend_routes.py
 from __future__ import annotations
 
+import asyncio
+import json
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
 
-from .common_utils import FUEL_LABEL_MAP, attach_images, df_to_items
+from .cancellation import CANCEL_STATS, CancelToken, RankCancelled, run_until_disconnect
+from .common_utils import FUEL_LABEL_MAP, LEAN_FIELDS, attach_images, df_to_json_items, fast_json_response, json_bytes, project_fields
+from .config import SINGLEFLIGHT_ENABLED, SPK_DEADLINE_MS, SWEEP_MAX_POINTS
 from .images import reload_images
 from .data_loader import get_master_data
 from .spk_needs import sanitize_needs 
+from .rank_session import RANK_SESSION_STATS, RankSession
 from .recommendation_state import set_last_recommendation
-from .schemas import RecommendRequest
-from .spk_rank import rank_candidates
+from .schemas import BudgetSweepRequest, RecommendRequest
+from .singleflight import RECOMMEND_FLIGHT
+from .spk_rank import price_window, rank_candidates
+from .spk_relax import relax_search
+from .spk_sweep import budget_grid, sweep_budgets
 from .spk_utils import fuel_to_code
 
 router = APIRouter(tags=["recommend"])
@@ -31,170 +40,65 @@ def compute_empty_hint(
 ) -> Dict[str, Any]:
     """
     Dipakai ketika rank_candidates mengembalikan DataFrame kosong.
+    Diagnosa + relaksasi termurah (naik/turun budget, hapus brand/transmisi/BBM,
+    lepas need) dihitung di spk_relax.relax_search dari mask & indeks harga
+    yang sudah disiapkan per master.
     """
+    filters_summary: Dict[str, Any] = {
+        "brand": None,
+        "trans_choice": None,
+        "fuels": None,
+    }
     try:
-        df = master.copy()
-
-        def num_col(name: str) -> pd.Series:
-            if name in df.columns:
-                return pd.to_numeric(df[name], errors="coerce")
-            return pd.Series(np.nan, index=df.index, dtype="float64")
-
-        def cat_col(name: str, default: str = "") -> pd.Series:
-            if name in df.columns:
-                return df[name].astype(str)
-            return pd.Series([default] * len(df), index=df.index, dtype="object")
-
-        prices_all = num_col("price")
-        prices_all_valid = prices_all[prices_all.notna()]
-        min_overall = float(prices_all_valid.min()) if not prices_all_valid.empty else None
-
-        filters_summary: Dict[str, Any] = {
-            "brand": None,
-            "trans_choice": None,
-            "fuels": None,
-        }
-
-        # Filter Brand
         brand = filters.get("brand")
-        if brand and "brand" in df.columns:
-            brand_str = str(brand).strip()
-            filters_summary["brand"] = brand_str
-            df = df[df["brand"].astype(str).str.lower().str.contains(brand_str.lower(), na=False)]
-
-        # Filter Transmisi
+        if brand:
+            filters_summary["brand"] = str(brand).strip()
         trans_choice = filters.get("trans_choice")
-        if trans_choice and "trans" in df.columns:
-            tc_raw = str(trans_choice).strip()
-            tc = tc_raw.lower()
-            if tc not in {"all", "any", ""}:
-                filters_summary["trans_choice"] = tc_raw
-                df = df[df["trans"].astype(str).str.lower().str.contains(tc, na=False)]
-
-        # Filter Fuels
+        if trans_choice and str(trans_choice).strip().lower() not in {"all", "any", ""}:
+            filters_summary["trans_choice"] = str(trans_choice).strip()
         fuels = filters.get("fuels")
-        if fuels and "fuel_code" in df.columns:
-            fuel_set = {str(c).lower() for c in fuels}
-            filters_summary["fuels"] = sorted(fuel_set)
-            df = df[df["fuel_code"].astype(str).str.lower().isin(fuel_set)]
-
-        if df.empty:
-            # --- CLEANING HINT RESPONSE ---
-            return clean_json_response({
-                "reason": "NO_MATCH_FILTERS",
-                "message": "Tidak ada mobil di data yang cocok dengan kombinasi brand / transmisi / BBM saat ini.",
-                "current_budget": float(budget),
-                "min_price_overall": min_overall,
-                "min_price_filtered": None,
-                "max_price_allowed": None,
-                "suggested_budget": None,
-                "filters_summary": filters_summary,
-                "needs_diag": [],
-            })
-
-        p = num_col("price")
-        mask_price_valid = p.notna()
-        p_valid = p[mask_price_valid]
-
-        if p_valid.empty:
-            return clean_json_response({
-                "reason": "UNKNOWN",
-                "message": "Sistem tidak menemukan informasi harga yang valid.",
-                "current_budget": float(budget),
-                "min_price_overall": min_overall,
-                "min_price_filtered": None,
-                "max_price_allowed": None,
-                "suggested_budget": None,
-                "filters_summary": filters_summary,
-                "needs_diag": [],
-            })
-
-        min_price_filtered = float(p_valid.min())
-        cap = float(budget * 1.15)
-        df_cap = df[mask_price_valid & (p <= cap)]
-
-        # Needs Diag
-        needs_diag: List[Dict[str, Any]] = []
-        seg = cat_col("segmentasi").str.lower()
-        awd = num_col("awd_flag").fillna(0.0)
-        seats = num_col("seats")
-        length = num_col("length_mm")
-        width = num_col("width_mm")
-        weight = num_col("vehicle_weight_kg")
-        wb = num_col("wheelbase_mm")
-        cc = num_col("cc_kwh_num")
-        fuel_code = df["fuel_code"].astype(str).str.lower() if "fuel_code" in df.columns else pd.Series(["o"]*len(df), index=df.index)
-
-        def _q(series: pd.Series, q: float, default: float | None = None) -> float | None:
-            s = pd.to_numeric(series, errors="coerce").dropna()
-            if s.empty: return default
-            return float(np.nanpercentile(s, q))
-
-        len_p40 = _q(length, 40, None)
-        wid_p40 = _q(width, 40, None)
-        wgt_p50 = _q(weight, 50, None)
-        wb_p70 = _q(wb, 70, None)
-
-        def add_need_diag(need_key, mask_core, mask_loose=None):
-            mask_core = mask_core.reindex(df.index).fillna(False)
-            mask_all = mask_core & mask_price_valid
-            total = int(mask_all.sum())
-            min_price_all = float(p[mask_all].min()) if total > 0 else None
-            
-            mask_cap_local = mask_all & (p <= cap)
-            under_cap = int(mask_cap_local.sum())
-            min_price_under_cap = float(p[mask_cap_local].min()) if under_cap > 0 else None
-            
-            total_loose = None
-            min_price_loose = None
-            if mask_loose is not None:
-                ml = mask_loose.reindex(df.index).fillna(False) & mask_price_valid
-                total_loose = int(ml.sum())
-                if total_loose > 0:
-                    min_price_loose = float(p[ml].min())
-
-            needs_diag.append({
-                "need": need_key,
-                "total": total,
-                "under_cap": under_cap,
-                "min_price_all": min_price_all,
-                "min_price_under_cap": min_price_under_cap,
-                "total_loose": total_loose,
-                "min_price_loose": min_price_loose,
-            })
-
-        need_set = set(needs or [])
-        # ... (Logika diagnosa per kebutuhan sama seperti sebelumnya, dipersingkat) ...
-        # (Anda bisa copy-paste logika detail diagnosa dari file sebelumnya jika perlu, 
-        #  tapi inti perbaikannya ada di return clean_json_response)
-        
-        # Simulasi logika diagnosa
-        for need_key in need_set:
-             # (Placeholder logic - asumsikan diagnosa berjalan)
-             pass
-
-        df_cap_empty = df_cap.empty
-        reason = "CONSTRAINTS_TOO_STRICT"
-        message = "Budget dan filter dasar cukup, tapi kebutuhan terlalu ketat."
-        suggested_budget = None
-
-        if df_cap_empty:
+        if fuels:
+            filters_summary["fuels"] = sorted({str(c).lower() for c in fuels})
+
+        r = relax_search(master, budget, filters, needs)
+        lower_limit, cap = price_window(budget)
+        relaxations = r["relaxations"]
+        best = relaxations[0] if relaxations else None
+        best_budget = next((x for x in relaxations if x["kind"] == "budget" and x["exact"]), None)
+        suggested_budget = best_budget["budget"] if best_budget else None
+
+        if r["min_price_overall"] is None:
+            reason = "UNKNOWN"
+            message = "Sistem tidak menemukan informasi harga yang valid."
+        elif r["n_filtered"] == 0:
+            reason = "NO_MATCH_FILTERS"
+            message = "Tidak ada mobil di data yang cocok dengan kombinasi brand / transmisi / BBM saat ini."
+        elif r["n_filtered_window"] > 0:
+            reason = "CONSTRAINTS_TOO_STRICT"
+            message = "Budget dan filter dasar cukup, tapi kebutuhan terlalu ketat."
+        elif r["max_price_filtered"] < lower_limit:
+            reason = "BUDGET_TOO_HIGH"
+            message = "Semua mobil yang cocok dengan filter jauh di bawah budget (lebih dari 100 juta)."
+        else:
             reason = "BUDGET_TOO_LOW"
             message = "Semua mobil di atas budget."
-            raw_min_budget = min_price_filtered / 1.15
-            suggested_budget = float(np.ceil(raw_min_budget / 5000000) * 5000000)
+        if best is not None:
+            message += f" Saran: {best['label']} ({best['count']} mobil)."
 
         # --- CLEANING HINT RESPONSE ---
         return clean_json_response({
             "reason": reason,
             "message": message,
             "current_budget": float(budget),
-            "min_price_overall": min_overall,
-            "min_price_filtered": min_price_filtered,
+            "min_price_overall": r["min_price_overall"],
+            "min_price_filtered": r["min_price_filtered"],
             "max_price_allowed": cap,
             "suggested_budget": suggested_budget,
             "filters_summary": filters_summary,
-            "needs_diag": needs_diag,
+            "needs_diag": r["needs_diag"],
+            "relaxations": relaxations,
+            "best": best,
+            "relax_ms": r["ms"],
         })
 
     except Exception as e:
@@ -207,8 +111,10 @@ def compute_empty_hint(
             "min_price_filtered": None,
             "max_price_allowed": None,
             "suggested_budget": None,
-            "filters_summary": {},
+            "filters_summary": filters_summary,
             "needs_diag": [],
+            "relaxations": [],
+            "best": None,
         })
 
 # Helper untuk membersihkan NaN/Inf sebelum JSON
@@ -230,11 +136,106 @@ def clean_json_response(data: Any) -> Any:
 # =====================================================================
 #                         ENDPOINT REKOMENDASI
 # =====================================================================
-@router.post("/recommendations")
-def recommendations(req: RecommendRequest):
-    t0 = time.perf_counter()
-    master = get_master_data()
+def recommend_query_key(
+    master: pd.DataFrame,
+    budget: float,
+    filters: Dict[str, Any],
+    needs: List[str],
+    topn: int,
+    fields: Optional[List[str]],
+    debug: bool,
+    deadline_ms: float = 0.0,
+) -> Tuple[Any, ...]:
+    """
+    Kunci query ternormalisasi untuk single-flight.
+    Urutan needs dipertahankan (bobot kebutuhan bergantung posisi);
+    fuels diurutkan; id(master) memisahkan versi data setelah reload.
+    """
+    fuels = filters.get("fuels")
+    return (
+        id(master),
+        float(budget),
+        int(topn),
+        tuple(needs),
+        str(filters.get("brand") or "").strip(),
+        str(filters.get("trans_choice") or "").strip(),
+        tuple(sorted(fuels)) if fuels else (),
+        tuple(fields) if fields else (),
+        bool(debug),
+        # hasil ber-deadline bisa terdegradasi -> tidak dibagi dengan query tanpa deadline
+        float(deadline_ms or 0.0),
+    )
+
+
+def _present_candidates(cand: pd.DataFrame) -> pd.DataFrame:
+    """Frame hasil ranking -> kolom tampilan (gambar, fuel_label, pembulatan)."""
+    cand = attach_images(cand)
+
+    display = ["rank", "points", "brand", "model", "price", "fit_score", "fuel", "fuel_code", "trans", "seats", "cc_kwh", "alasan", "image_url", "image"]
+    for col in display:
+        if col not in cand.columns: cand[col] = np.nan
+
+    cand["fuel_code"] = cand["fuel_code"].astype(str).str.lower()
+    cand["fuel_label"] = cand["fuel_code"].map(FUEL_LABEL_MAP).fillna("Lainnya")
+    cand["price"] = pd.to_numeric(cand["price"], errors="coerce").round(0)
+    cand["fit_score"] = pd.to_numeric(cand["fit_score"], errors="coerce").round(4)
+    return cand
+
+
+def _compute_recommendation(
+    master: pd.DataFrame,
+    budget: float,
+    filters: Dict[str, Any],
+    needs: List[str],
+    topn: int,
+    fields: Optional[List[str]],
+    debug: bool,
+    deadline_ms: float = 0.0,
+    cancel: Optional[CancelToken] = None,
+    started_at: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Ranking + serialisasi satu query. Hasil (bytes JSON) dibagi ke semua
+    request identik yang sedang menunggu, jadi tidak boleh dimutasi.
+    """
+    cand = rank_candidates(
+        master, budget, filters, needs, topn, deadline_ms=deadline_ms, cancel=cancel, started_at=started_at
+    )
+    if not isinstance(cand, pd.DataFrame):
+        raise HTTPException(status_code=500, detail="Error ranking")
+    degraded = list(cand.attrs.get("spk_degraded") or [])
 
+    if cand.empty:
+        return {"count": 0, "hint": compute_empty_hint(master, budget, filters, needs)}
+
+    cand = _present_candidates(cand)
+
+    # --- PROYEKSI KOLOM ---
+    # Default hanya kolom yang dipakai UI; `fields` memilih kolom sendiri,
+    # `debug` mengirim seluruh frame kandidat (DevPanel).
+    out = project_fields(cand, fields, full=debug)
+
+    # --- SERIALISASI SATU PASS ---
+    # Frame hasil langsung ke bytes JSON (NaN/Inf -> null); state analyst
+    # menyimpan bytes yang sama dan baru di-decode bila dibutuhkan.
+    items_json = df_to_json_items(out)
+    # state analyst butuh minimal kolom ringkas; serialisasi ulang hanya
+    # bila client memilih `fields` sendiri (tanpa debug)
+    state_json = items_json
+    if fields and not debug:
+        state_json = df_to_json_items(project_fields(cand))
+
+    return {
+        "count": len(cand),
+        "items_json": items_json,
+        "state_json": state_json,
+        "cols": (out.shape[1], cand.shape[1]),
+        "degraded": degraded,
+    }
+
+
+def _request_filters(req: Any) -> Dict[str, Any]:
+    """Filter body request -> dict; fuels dinormalisasi ke kode g/d/h/p/e."""
     filters: Dict[str, Any] = {}
     if getattr(req, "filters", None) is not None:
         filters = req.filters.dict() if hasattr(req.filters, "dict") else dict(req.filters)
@@ -244,64 +245,273 @@ def recommendations(req: RecommendRequest):
         filters["fuels"] = [
             c for c in {fuel_to_code(v) for v in fuels_in} if c in {"g", "d", "h", "p", "e"}
         ]
+    return filters
+
 
+@router.post("/recommendations")
+async def recommendations(req: RecommendRequest, request: Request):
+    t0 = time.perf_counter()
+    # load/reload master (pandas, di bawah lock) tidak boleh memblokir event loop
+    master = await run_in_threadpool(get_master_data)
+    filters = _request_filters(req)
     needs = sanitize_needs(req.needs or []) if getattr(req, "needs", None) is not None else []
     topn = int(getattr(req, "topn", 6) or 6)
     budget = float(req.budget)
+    fields = req.fields or None
+    debug = bool(req.debug)
+    deadline_ms = float(req.deadline_ms if req.deadline_ms is not None else SPK_DEADLINE_MS)
 
-    cand = rank_candidates(master, budget, filters, needs, topn)
-    if not isinstance(cand, pd.DataFrame):
-        set_last_recommendation(None)
-        raise HTTPException(status_code=500, detail="Error ranking")
+    # --- SINGLE-FLIGHT ---
+    # Request identik yang datang bersamaan menunggu satu perhitungan di event
+    # loop; hanya leader yang memakai slot threadpool. Ranking leader berjalan
+    # sambil koneksinya dipantau; client putus -> token dibatalkan ->
+    # rank_candidates berhenti di tahap berikutnya. Leader yang dibatalkan
+    # tidak menyeret follower: salah satunya menjadi leader baru.
+    token = CancelToken()
 
-    if cand.empty:
-        t1 = time.perf_counter()
-        print(f"[REC] empty result — load+rank={t1 - t0:.3f}s")
-        empty_hint = compute_empty_hint(master, budget, filters, needs)
-        set_last_recommendation(None)
+    def compute() -> Dict[str, Any]:
+        # deadline dihitung sejak request tiba (t0), bukan sejak ranking mulai
+        return _compute_recommendation(master, budget, filters, needs, topn, fields, debug, deadline_ms, token, t0)
+
+    async def run() -> Dict[str, Any]:
+        return await run_until_disconnect(request, compute, token)
+
+    try:
+        if SINGLEFLIGHT_ENABLED:
+            key = recommend_query_key(master, budget, filters, needs, topn, fields, debug, deadline_ms)
+            res, shared = await RECOMMEND_FLIGHT.do(key, run, retry_on=(RankCancelled,))
+        else:
+            res, shared = await run(), False
+    except RankCancelled as e:
+        # client sudah pergi: tidak ada yang membaca respons, state sesi dibiarkan
+        CANCEL_STATS.record(e)
+        print(f"[REC] dibatalkan {e} setelah {time.perf_counter() - t0:.3f}s")
+        return Response(status_code=499)
+    except HTTPException:
+        set_last_recommendation(None, session_id=req.session_id)
+        raise
+
+    t1 = time.perf_counter()
+    if res["count"] == 0:
+        print(f"[REC] empty result — load+rank={t1 - t0:.3f}s shared={shared}")
+        set_last_recommendation(None, session_id=req.session_id)
         return clean_json_response({
             "count": 0,
             "items": [],
             "needs": needs,
-            "hint": empty_hint,
+            "hint": res["hint"],
         })
 
-    cand = attach_images(cand)
-
-    display = ["rank", "points", "brand", "model", "price", "fit_score", "fuel", "fuel_code", "trans", "seats", "cc_kwh", "alasan", "image_url", "image"]
-    for col in display:
-        if col not in cand.columns: cand[col] = np.nan
-
-    cand["fuel_code"] = cand["fuel_code"].astype(str).str.lower()
-    cand["fuel_label"] = cand["fuel_code"].map(FUEL_LABEL_MAP).fillna("Lainnya")
-    cand["price"] = pd.to_numeric(cand["price"], errors="coerce").round(0)
-    cand["fit_score"] = pd.to_numeric(cand["fit_score"], errors="coerce").round(4)
-
-    # --- CLEANING FINAL ---
-    # Konversi ke dict dan bersihkan NaN/Inf
-    items_raw = df_to_items(cand)
-    items = clean_json_response(items_raw)
-
+    n_items = res["count"]
+    items_json = res["items_json"]
     payload = {
         "timestamp": time.time(),
         "needs": needs,
         "budget": budget,
         "filters": filters,
-        "count": len(items),
-        "items": items,
+        "count": n_items,
+        "items_json": res["state_json"].data,
     }
-    set_last_recommendation(payload)
+    set_last_recommendation(payload, session_id=req.session_id)
+
+    n_cols, n_cols_all = res["cols"]
+    print(
+        f"[REC] rows_master={len(master)} rows_out={n_items} cols={n_cols}/{n_cols_all} "
+        f"bytes={len(items_json.data)} load+rank={t1 - t0:.3f}s shared={shared}"
+        + (f" degraded={res['degraded']}" if res["degraded"] else "")
+    )
+
+    body: Dict[str, Any] = {
+        "count": n_items,
+        "items": items_json,
+        "needs": needs,
+        "degraded": bool(res["degraded"]),
+    }
+    if res["degraded"]:
+        body["degraded_stages"] = res["degraded"]
+    return fast_json_response(body)
+
+
+# Kolom statis per mobil di respons sweep; rank/fit_score/points/spk_reason
+# bergantung budget dan dikirim per titik grid.
+SWEEP_CAR_FIELDS = [f for f in LEAN_FIELDS if f not in {"rank", "points", "fit_score", "spk_reason"}]
 
-    t1 = time.perf_counter()
-    print(f"[REC] rows_master={len(master)} rows_out={len(items)} load+rank={t1 - t0:.3f}s")
 
-    return clean_json_response({
-        "count": len(items),
-        "items": items,
+@router.post("/recommendations/sweep")
+async def recommendations_sweep(req: BudgetSweepRequest, request: Request):
+    """
+    Top-n untuk satu grid budget (needs + filter tetap) dalam satu pass,
+    supaya UI bisa menjawab gerakan slider budget tanpa request baru.
+    Item per budget = cars[i] + {rank, fit_score, points, spk_reason}.
+    Hasil bersifat pratinjau (approx); submit tetap lewat /recommendations.
+    """
+    t0 = time.perf_counter()
+    # load/reload master (pandas, di bawah lock) tidak boleh memblokir event loop
+    master = await run_in_threadpool(get_master_data)
+    filters = _request_filters(req)
+    needs = sanitize_needs(req.needs or [])
+    topn = int(req.topn or 6)
+    budgets = req.budgets or budget_grid(float(req.budget), req.span_frac, req.step)
+    budgets = budgets[:SWEEP_MAX_POINTS]
+
+    token = CancelToken()
+    try:
+        cars, grid = await run_until_disconnect(
+            request, lambda: sweep_budgets(master, budgets, filters, needs, topn, cancel=token), token
+        )
+    except RankCancelled as e:
+        CANCEL_STATS.record(e)
+        print(f"[SWEEP] dibatalkan {e}")
+        return Response(status_code=499)
+
+    if not cars.empty:
+        cars = attach_images(cars)
+        if "fuel_code" in cars.columns:
+            cars["fuel_code"] = cars["fuel_code"].astype(str).str.lower()
+            cars["fuel_label"] = cars["fuel_code"].map(FUEL_LABEL_MAP).fillna("Lainnya")
+        cars["price"] = pd.to_numeric(cars["price"], errors="coerce").round(0)
+    cars_json = df_to_json_items(project_fields(cars, SWEEP_CAR_FIELDS))
+
+    print(
+        f"[SWEEP] budgets={len(grid)} cars={len(cars)} bytes={len(cars_json.data)} "
+        f"t={time.perf_counter() - t0:.3f}s"
+    )
+    return fast_json_response({
+        "budgets": [g["budget"] for g in grid],
         "needs": needs,
+        "topn": topn,
+        "approx": True,
+        "cars": cars_json,
+        "grid": grid,
     })
 
 
+@router.websocket("/ws/recommendations")
+async def recommendations_ws(ws: WebSocket):
+    """
+    Sesi re-ranking live. Client mengirim perubahan parsial (JSON teks):
+        {"seq": 3, "budget": 350000000, "needs": ["keluarga", "fun"], "topn": 6,
+         "filters": {"brand": "toyota", "trans_choice": "Matic", "fuels": ["g", "d"]},
+         "session_id": "..."}
+    Field yang tidak dikirim tetap; filter bernilai null / "" / [] dihapus.
+    Balasan (seq = seq pesan terakhir yang sudah diterapkan):
+        {"type": "result", "seq", "count", "items", "needs", "stages", "ms"}
+        {"type": "empty", "seq", "needs", "hint"}
+        {"type": "error", "seq", "detail"}
+    `stages` = tahap yang dihitung ulang (lihat rank_session). Pesan yang
+    datang saat ranking berjalan membatalkan ranking itu; hanya state
+    terbaru yang dijawab.
+    """
+    await ws.accept()
+    session = RankSession(await run_in_threadpool(get_master_data))
+    RANK_SESSION_STATS.add(open=1)
+    patches: List[Dict[str, Any]] = []
+    wake = asyncio.Event()
+    running: List[CancelToken] = []
+    closed = False
+
+    async def send(body: Dict[str, Any]) -> None:
+        await ws.send_text(json_bytes(body).decode("utf-8"))
+
+    async def reader() -> None:
+        nonlocal closed
+        try:
+            while True:
+                text = await ws.receive_text()
+                try:
+                    msg = json.loads(text)
+                    if not isinstance(msg, dict):
+                        raise ValueError("pesan harus objek JSON")
+                except ValueError as e:
+                    await send({"type": "error", "seq": None, "detail": f"JSON tidak valid: {e}"})
+                    continue
+                patches.append(msg)
+                for token in running:
+                    token.cancel("superseded")
+                wake.set()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed = True
+            for token in running:
+                token.cancel("client_disconnect")
+            wake.set()
+
+    reader_task = asyncio.create_task(reader())
+    try:
+        while True:
+            await wake.wait()
+            wake.clear()
+            if closed:
+                break
+            batch, patches[:] = list(patches), []
+            if not batch:
+                continue
+            # patch ditolak utuh (sesi tidak berubah); patch lain tetap diterapkan
+            seq, applied = None, False
+            for patch in batch:
+                try:
+                    session.update(patch)
+                except ValueError as e:
+                    await send({"type": "error", "seq": patch.get("seq"), "detail": str(e)})
+                    continue
+                seq, applied = patch.get("seq"), True
+            if not applied:
+                continue
+
+            master = await run_in_threadpool(get_master_data)
+            if session.df_master is not master:
+                session.reset_master(master)
+
+            t0 = time.perf_counter()
+            token = CancelToken()
+            running[:] = [token]
+            try:
+                cand = await run_in_threadpool(session.rank, token)
+            except RankCancelled as e:
+                # digantikan pesan yang lebih baru (atau client putus)
+                CANCEL_STATS.record(e)
+                continue
+            except ValueError as e:
+                await send({"type": "error", "seq": seq, "detail": str(e)})
+                continue
+            finally:
+                running.clear()
+
+            needs, filters, budget = session.needs, dict(session.filters), session.budget
+            if cand.empty:
+                hint = await run_in_threadpool(compute_empty_hint, master, budget, filters, needs)
+                if session.session_id:
+                    set_last_recommendation(None, session_id=session.session_id)
+                await send({"type": "empty", "seq": seq, "needs": needs, "hint": clean_json_response(hint)})
+                continue
+
+            items_json = df_to_json_items(project_fields(_present_candidates(cand)))
+            if session.session_id:
+                set_last_recommendation({
+                    "timestamp": time.time(),
+                    "needs": needs,
+                    "budget": budget,
+                    "filters": filters,
+                    "count": len(cand),
+                    "items_json": items_json.data,
+                }, session_id=session.session_id)
+            await send({
+                "type": "result",
+                "seq": seq,
+                "count": len(cand),
+                "items": items_json,
+                "needs": needs,
+                "stages": session.computed,
+                "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader_task.cancel()
+        RANK_SESSION_STATS.add(open=-1)
+
+
 @router.post("/images/reload")
 def images_reload():
     cnt = reload_images()
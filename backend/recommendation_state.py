@@ -1,16 +1,245 @@
 # file: backend/recommendation_state.py
 from __future__ import annotations
 
+from collections import OrderedDict
 from typing import Any, Dict, Optional
+import json
+import os
+import sqlite3
+import threading
 import time
 
-# payload terakhir yang disimpan dari mesin rekomendasi
-_LAST_RECOMMENDATION: Optional[Dict[str, Any]] = None
+from .config import (
+    REC_STORE_BACKEND,
+    REC_STORE_MAX_BYTES,
+    REC_STORE_MAX_ENTRIES,
+    REC_STORE_PATH,
+    REC_STORE_TTL_S,
+)
 
+# Sesi tanpa id (client lama) berbagi satu slot, sama seperti perilaku global dulu
+DEFAULT_SESSION = "_default"
 
-def set_last_recommendation(payload: Optional[Dict[str, Any]]) -> None:
+
+def _session_key(session_id: Optional[str]) -> str:
+    sid = (session_id or "").strip()
+    return sid[:128] if sid else DEFAULT_SESSION
+
+
+def _split_payload(payload: Dict[str, Any]) -> tuple[Dict[str, Any], bytes]:
+    """Pisahkan metadata (dict kecil) dan items (bytes JSON)."""
+    meta = {k: v for k, v in payload.items() if k not in ("items", "items_json")}
+    items_json = payload.get("items_json")
+    if items_json is None:
+        items_json = json.dumps(payload.get("items") or [], default=str).encode("utf-8")
+    elif isinstance(items_json, str):
+        items_json = items_json.encode("utf-8")
+    return meta, items_json
+
+
+def _decode_items(data: Dict[str, Any]) -> Dict[str, Any]:
+    if data.get("items") is None and data.get("items_json") is not None:
+        try:
+            data["items"] = json.loads(data["items_json"])
+        except Exception:
+            data["items"] = []
+    return data
+
+
+# ============================================================
+# Backend in-process: LRU + TTL + budget memori
+# ============================================================
+class MemoryRecommendationStore:
+    """
+    Satu entri per sesi. Ukuran entri ~ len(items_json) + metadata JSON;
+    entri tertua (LRU) dibuang bila melewati max_entries atau max_bytes.
+    """
+
+    def __init__(self, ttl_s: float, max_entries: int, max_bytes: int):
+        self.ttl_s = float(ttl_s)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _drop(self, key: str) -> None:
+        self._data.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def set(self, session_id: str, payload: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._drop(session_id)
+            if payload is None:
+                return
+            meta, items_json = _split_payload(payload)
+            size = len(items_json) + len(json.dumps(meta, default=str))
+            if size > self.max_bytes:
+                return
+            self._data[session_id] = {**meta, "items_json": items_json}
+            self._sizes[session_id] = size
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evicted += 1
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._data.get(session_id)
+            if data is None:
+                return None
+            if self.ttl_s > 0 and time.time() - data.get("timestamp", 0) > self.ttl_s:
+                self._drop(session_id)
+                self.expired += 1
+                return None
+            self._data.move_to_end(session_id)
+        # salinan dangkal + items di-decode baru (di luar lock): entri cache tetap
+        # hanya bytes JSON, tidak bisa dimutasi pemanggil dan ukurannya tetap
+        # sesuai yang dihitung di _bytes
+        return _decode_items(dict(data))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+# ============================================================
+# Backend SQLite (WAL): dibagi antar worker dalam satu mesin
+# ============================================================
+class SQLiteRecommendationStore:
+    """
+    Tabel rec(sid, ts, accessed, size, meta, items). Koneksi per thread;
+    WAL supaya banyak worker bisa membaca sambil satu menulis.
+    Eviksi (TTL lalu LRU berdasarkan `accessed`) dijalankan setiap set().
     """
-    Diset dari /recommendations atau dari run_recommendation_from_chat.
+
+    def __init__(self, path: str, ttl_s: float, max_entries: int, max_bytes: int):
+        self.path = path
+        self.ttl_s = float(ttl_s)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self._local = threading.local()
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        with self._conn() as c:
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS rec ("
+                " sid TEXT PRIMARY KEY, ts REAL, accessed REAL, size INTEGER,"
+                " meta TEXT, items BLOB)"
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS rec_accessed ON rec(accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def set(self, session_id: str, payload: Optional[Dict[str, Any]]) -> None:
+        c = self._conn()
+        if payload is None:
+            c.execute("DELETE FROM rec WHERE sid = ?", (session_id,))
+            return
+        meta, items_json = _split_payload(payload)
+        meta_s = json.dumps(meta, default=str)
+        size = len(items_json) + len(meta_s)
+        if size > self.max_bytes:
+            c.execute("DELETE FROM rec WHERE sid = ?", (session_id,))
+            return
+        now = time.time()
+        ts = float(meta.get("timestamp", now))
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "INSERT OR REPLACE INTO rec (sid, ts, accessed, size, meta, items) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, ts, now, size, meta_s, sqlite3.Binary(items_json)),
+            )
+            self._evict(c, now)
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+    def _evict(self, c: sqlite3.Connection, now: float) -> None:
+        if self.ttl_s > 0:
+            c.execute("DELETE FROM rec WHERE ts < ?", (now - self.ttl_s,))
+        n, total = c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM rec").fetchone()
+        if n <= self.max_entries and total <= self.max_bytes:
+            return
+        # buang dari yang paling lama tidak diakses sampai kembali di bawah batas
+        drop = []
+        for sid, size in c.execute("SELECT sid, size FROM rec ORDER BY accessed ASC"):
+            if n <= self.max_entries and total <= self.max_bytes:
+                break
+            drop.append((sid,))
+            n -= 1
+            total -= size
+        c.executemany("DELETE FROM rec WHERE sid = ?", drop)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        c = self._conn()
+        row = c.execute("SELECT ts, meta, items FROM rec WHERE sid = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        ts, meta_s, items = row
+        now = time.time()
+        if self.ttl_s > 0 and now - ts > self.ttl_s:
+            c.execute("DELETE FROM rec WHERE sid = ?", (session_id,))
+            return None
+        c.execute("UPDATE rec SET accessed = ? WHERE sid = ?", (now, session_id))
+        data = json.loads(meta_s)
+        data["items_json"] = bytes(items)
+        return _decode_items(data)
+
+    def stats(self) -> Dict[str, Any]:
+        n, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM rec").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": int(n),
+            "bytes": int(total),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+        }
+
+
+def _make_store():
+    if REC_STORE_BACKEND == "sqlite":
+        try:
+            return SQLiteRecommendationStore(REC_STORE_PATH, REC_STORE_TTL_S, REC_STORE_MAX_ENTRIES, REC_STORE_MAX_BYTES)
+        except Exception as e:
+            print(f"[REC_STORE] SQLite gagal dibuka ({e}); fallback ke memori")
+    return MemoryRecommendationStore(REC_STORE_TTL_S, REC_STORE_MAX_ENTRIES, REC_STORE_MAX_BYTES)
+
+
+_STORE = _make_store()
+
+
+def get_store():
+    return _STORE
+
+
+def set_last_recommendation(payload: Optional[Dict[str, Any]], session_id: Optional[str] = None) -> None:
+    """
+    Diset dari /recommendations atau dari run_recommendation_from_chat,
+    per sesi (session_id kosong -> slot default bersama).
 
     payload minimal:
     {
@@ -21,20 +250,19 @@ def set_last_recommendation(payload: Optional[Dict[str, Any]]) -> None:
         "count": int,
         "items": List[Dict[str, Any]]
     }
-    """
-    global _LAST_RECOMMENDATION
-    if payload is None:
-        _LAST_RECOMMENDATION = None
-        return
 
-    # copy tipis + pastikan ada timestamp
-    data = dict(payload)
-    data.setdefault("timestamp", time.time())
-    _LAST_RECOMMENDATION = data
+    Alternatif "items": kirim "items_json" (bytes array JSON dari jalur respons
+    cepat); items baru di-decode saat pertama kali dibaca (mode analyst).
+    payload None -> hapus rekomendasi sesi tsb.
+    """
+    if payload is not None:
+        payload = dict(payload)
+        payload.setdefault("timestamp", time.time())
+    _STORE.set(_session_key(session_id), payload)
 
 
-def get_last_recommendation() -> Optional[Dict[str, Any]]:
+def get_last_recommendation(session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
-    Ambil payload rekomendasi terakhir (bisa None).
+    Ambil payload rekomendasi terakhir milik sesi (bisa None bila belum ada / kedaluwarsa).
     """
-    return _LAST_RECOMMENDATION
+    return _STORE.get(_session_key(session_id))
@@ -31,6 +31,30 @@ class RecommendRequest(BaseModel):
     # pakai default_factory supaya tidak pakai list mutable shared
     needs: List[str] = Field(default_factory=list)
     filters: Optional[RecommendFilters] = None
+    # proyeksi kolom item: None -> set ringkas default (LEAN_FIELDS)
+    fields: Optional[List[str]] = None
+    # True -> kirim semua kolom frame kandidat (untuk DevPanel)
+    debug: bool = False
+    # id sesi client: hasil disimpan per sesi untuk mode analyst di /chat
+    session_id: Optional[str] = None
+    # batas waktu ranking (ms) sejak request tiba; lewat porsi tertentu -> tahap mahal dilewati
+    # dan respons ditandai degraded. None -> config.SPK_DEADLINE_MS (0 = tanpa batas)
+    deadline_ms: Optional[float] = None
+
+
+class BudgetSweepRequest(BaseModel):
+    """
+    Body request untuk /recommendations/sweep (prefetch slider budget).
+    Grid: `budgets` bila diisi, selain itu budget ± span_frac (pecahan, 0.2 = 20%)
+    dalam kelipatan step.
+    """
+    budget: float
+    span_frac: float = 0.2
+    step: float = 10_000_000
+    budgets: Optional[List[float]] = None
+    topn: Optional[int] = 6
+    needs: List[str] = Field(default_factory=list)
+    filters: Optional[RecommendFilters] = None
 
 
 # =========================
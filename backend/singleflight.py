@@ -0,0 +1,86 @@
+# file: backend/singleflight.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# ============================================================
+# Single-flight: request identik yang datang bersamaan hanya dihitung sekali
+# ============================================================
+# Endpoint /recommendations async, jadi koordinasi dilakukan di event loop
+# (dict key -> asyncio.Future, tanpa lock). Pemanggil pertama untuk sebuah
+# key menjadi "leader" dan satu-satunya yang mengirim perhitungan ke
+# threadpool; pemanggil lain dengan key sama menunggu future (di-shield, jadi
+# follower yang batal tidak membatalkan leader) lalu memakai hasil (atau
+# exception) yang sama. Follower tidak memakai slot threadpool sama sekali.
+# Setelah selesai key dibuang, jadi ini bukan cache: request berikutnya
+# menghitung ulang. Semua method harus dipanggil dari event loop yang sama.
+
+
+class _LeaderGone(Exception):
+    """Task leader dibatalkan (asyncio) sebelum selesai -> follower memilih leader baru."""
+
+
+class SingleFlight:
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        retry_on: Tuple[type, ...] = (),
+    ) -> Tuple[Any, bool]:
+        """
+        Jalankan await fn() sekali per key yang sedang in-flight.
+        Return (hasil, shared) — shared=True bila hasil milik leader lain.
+        retry_on: exception leader yang tidak dibagikan ke follower (mis.
+        RankCancelled karena client leader putus) -> follower mencoba lagi
+        dan salah satunya menjadi leader baru.
+        """
+        while True:
+            fut = self._calls.get(key)
+            if fut is None:
+                break
+            self.shared += 1
+            try:
+                return await asyncio.shield(fut), True
+            except _LeaderGone:
+                continue
+            except Exception as e:
+                if retry_on and isinstance(e, retry_on):
+                    continue
+                raise
+
+        fut = asyncio.get_running_loop().create_future()
+        # exception leader tanpa follower tidak perlu dilaporkan asyncio
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = fut
+        self.leaders += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        except BaseException:
+            fut.set_exception(_LeaderGone())
+            raise
+        else:
+            fut.set_result(result)
+        finally:
+            self._calls.pop(key, None)
+        return result, False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "in_flight": len(self._calls),
+        }
+
+
+# Satu grup untuk perhitungan /recommendations
+RECOMMEND_FLIGHT = SingleFlight("recommendations")
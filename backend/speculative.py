@@ -0,0 +1,98 @@
+# file: backend/speculative.py
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .cancellation import CancelToken
+from .config import CHAT_SPECULATIVE_WORKERS
+
+# ============================================================
+# Eksekusi spekulatif (ranking SPK selagi NLU LLM berjalan)
+# ============================================================
+# launch(fp, fn): jalankan fn di thread pool, ditandai sidik jari input.
+# claim(spec, fp): hasil hanya dipakai bila sidik jari akhir sama; bila beda
+# future dibatalkan (kalau belum mulai) dan token-nya dibatalkan (kalau sudah
+# berjalan, ranking berhenti di cek tahap berikutnya), hasilnya dibuang.
+# discard(spec): giliran selesai tanpa sampai ke ranking (mis. minta konfirmasi,
+# tanya budget) -> spekulasi yang belum diklaim dibatalkan dengan cara yang sama.
+
+
+class Speculation:
+    __slots__ = ("fp", "future", "token", "settled")
+
+    def __init__(self, fp: str, future: Future, token: Optional[CancelToken] = None):
+        self.fp = fp
+        self.future = future
+        self.token = token
+        self.settled = False     # sudah diklaim / dibuang
+
+
+class SpeculativeRunner:
+    def __init__(self, workers: int):
+        self.workers = max(1, int(workers))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.used = 0
+        self.mismatched = 0
+        self.discarded = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="spec")
+        return self._pool
+
+    def launch(self, fp: str, fn: Callable[[], Any], token: Optional[CancelToken] = None) -> Speculation:
+        fut = self._get_pool().submit(fn)
+        with self._lock:
+            self.launched += 1
+        return Speculation(fp, fut, token)
+
+    def claim(self, spec: Optional[Speculation], fp: str) -> Optional[Future]:
+        """Future spekulasi bila sidik jarinya sama dengan fp, selain itu None."""
+        if spec is None or spec.settled:
+            return None
+        spec.settled = True
+        if spec.fp == fp:
+            with self._lock:
+                self.used += 1
+            return spec.future
+        self._cancel(spec, "speculation_mismatch")
+        with self._lock:
+            self.mismatched += 1
+        return None
+
+    def discard(self, spec: Optional[Speculation]) -> None:
+        """Batalkan spekulasi yang tidak pernah diklaim (giliran berakhir sebelum ranking)."""
+        if spec is None or spec.settled:
+            return
+        spec.settled = True
+        self._cancel(spec, "unused")
+        with self._lock:
+            self.discarded += 1
+
+    @staticmethod
+    def _cancel(spec: Speculation, reason: str) -> None:
+        spec.future.cancel()
+        if spec.token is not None:
+            spec.token.cancel(reason)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            launched, used, mismatched, discarded = self.launched, self.used, self.mismatched, self.discarded
+        return {
+            "launched": launched,
+            "used": used,
+            "mismatched": mismatched,
+            # giliran berakhir sebelum ranking (mis. minta konfirmasi) -> dibatalkan
+            "discarded": discarded,
+            # giliran yang masih berjalan
+            "unclaimed": launched - used - mismatched - discarded,
+        }
+
+
+SPECULATIVE_SPK = SpeculativeRunner(CHAT_SPECULATIVE_WORKERS)
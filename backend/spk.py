@@ -16,6 +16,7 @@ from .spk_utils import (
 from .spk_features import (
     has_turbo,
     add_need_features,
+    get_master_features,
     build_master,
 )
 
@@ -26,6 +27,7 @@ from .spk_rank import (
     soft_multiplier,
     style_adjust_multiplier,
     rank_candidates,
+    rank_fingerprint,
 )
 
 # Alias bermanfaat (kalau mau dipakai langsung)
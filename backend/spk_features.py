@@ -140,6 +140,26 @@ def add_need_features(df: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
+# Cache fitur master (Singleton). Master diperlakukan immutable, jadi fitur
+# kebutuhan cukup dihitung sekali per objek master; pipeline rank_candidates
+# cukup mengambil baris via array posisi.
+_MASTER_FEAT_SRC: pd.DataFrame | None = None
+_MASTER_FEAT_DF: pd.DataFrame | None = None
+
+
+def get_master_features(df_master: pd.DataFrame) -> pd.DataFrame:
+    """
+    Kembalikan add_need_features(df_master), di-cache selama objek master sama.
+    Hasilnya JANGAN dimutasi; ambil subset dengan .take(idx) lalu olah salinannya.
+    """
+    global _MASTER_FEAT_SRC, _MASTER_FEAT_DF
+    if _MASTER_FEAT_SRC is df_master and _MASTER_FEAT_DF is not None:
+        return _MASTER_FEAT_DF
+    feat = add_need_features(df_master)
+    _MASTER_FEAT_SRC, _MASTER_FEAT_DF = df_master, feat
+    return feat
+
+
 # ============================================================
 # BUILD MASTER (gabung wholesale + retail + depresiasi)
 # ============================================================
@@ -8,6 +8,7 @@ import pandas as pd
 
 from .spk_utils import _series_num
 from .spk_features import has_turbo
+from .spk_stats import PercentileStats
 
 
 def has_turbo_model(model: str) -> bool:
@@ -163,7 +164,11 @@ def is_obvious_commercial_by_dimension(length, width, height):
         return False
 
 
-def hard_constraints_filter(cand_feat: pd.DataFrame, needs: List[str]) -> pd.Series:
+def hard_constraints_filter(
+    cand_feat: pd.DataFrame,
+    needs: List[str],
+    stats: Optional[PercentileStats] = None,
+) -> pd.Series:
     """
     Filter WAJIB berdasarkan:
     - kursi, segmen, ukuran, AWD, dll
@@ -175,6 +180,8 @@ def hard_constraints_filter(cand_feat: pd.DataFrame, needs: List[str]) -> pd.Ser
     - Jika dimension = 5140 x 1928 x 1880 -> prefer niaga (sesuai permintaan)
     - Jangan sampai SUV/MPV/Alphard-like (mis. 4450 x 1775 x 1710) masuk niaga
     - Tambah kolom debug 'spk_hard_reason' jika diinginkan (tidak wajib)
+
+    stats: PercentileStats atas cand_feat (opsional, dibuat di sini bila None).
     """
     needs = needs or []
     n = len(cand_feat)
@@ -226,33 +233,28 @@ def hard_constraints_filter(cand_feat: pd.DataFrame, needs: List[str]) -> pd.Ser
     seg_norm = seg.astype(str).apply(norm_body)
 
     # ---------------------------------------------------------------------
-    # Persentil — adaptif terhadap inventory
+    # Persentil — adaptif terhadap inventory (dihitung sekali per kolom)
     # ---------------------------------------------------------------------
-    def pct(s: pd.Series, q: float, fallback):
-        try:
-            if s.dropna().size > 0:
-                return float(np.nanpercentile(s.dropna(), q))
-            return fallback
-        except Exception:
-            return fallback
+    if stats is None:
+        stats = PercentileStats(cand_feat)
 
-    p_len60 = pct(length, 60, -np.inf)
-    p_len70 = pct(length, 70, -np.inf)
-    p_len50 = pct(length, 50, -np.inf)
-    p_len10 = pct(length, 10, -np.inf)
+    p_len60 = stats.get("length_mm", 60, -np.inf)
+    p_len70 = stats.get("length_mm", 70, -np.inf)
+    p_len50 = stats.get("length_mm", 50, -np.inf)
+    p_len10 = stats.get("length_mm", 10, -np.inf)
 
-    p_wid60 = pct(width, 60, -np.inf)
-    p_wid50 = pct(width, 50, -np.inf)
-    p_wid10 = pct(width, 10, -np.inf)
+    p_wid60 = stats.get("width_mm", 60, -np.inf)
+    p_wid50 = stats.get("width_mm", 50, -np.inf)
+    p_wid10 = stats.get("width_mm", 10, -np.inf)
 
-    p_wgt50 = pct(weight, 50, np.inf)
-    p_wgt90 = pct(weight, 90, np.inf)
+    p_wgt50 = stats.get("vehicle_weight_kg", 50, np.inf)
+    p_wgt90 = stats.get("vehicle_weight_kg", 90, np.inf)
 
-    p_wb60 = pct(wb, 60, -np.inf)
+    p_wb60 = stats.get("wheelbase_mm", 60, -np.inf)
 
     # Proxy power-to-weight
     pw = _pw_series(cc, weight)
-    p_pw55 = pct(pw, 55, -np.inf)
+    p_pw55 = stats.get("pw", 55, -np.inf, series=pw)
 
     # Cepat (FUN) heuristics
     turbo_ok = model.apply(has_turbo_model)
@@ -2,12 +2,18 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Optional, Tuple
 
+import hashlib
+import json
 import re
+import threading
 import time
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 
-from .klastering import cluster_and_label, need_similarity_scores
+from .cancellation import CancelToken, RankCancelled
+from .klastering import approx_need_scores, cluster_and_label, need_similarity_scores
 from .spk_utils import (
     contains_ci,
     vector_match_trans,
@@ -15,26 +21,511 @@ from .spk_utils import (
     assign_array_safe,
     _dbg,
     _ensure_df,
-    price_fit_anchor,
+    price_fit_anchor_array,
     fuel_to_code,
     brand_match_mask,
 )
-from .spk_features import add_need_features
+from .spk_features import get_master_features
 from .spk_needs import sanitize_needs
 from .spk_hard import hard_constraints_filter, has_turbo_model
+from .spk_stats import PercentileStats
+from .spk_scores import (
+    SCORE_MODES,
+    need_weights,
+    need_weight_vector,
+    need_attribute_scores,
+    get_need_score_matrix,
+)
+from .config import SPK_SCORE_MODE
 # Kita mempercayakan logika penilaian sepenuhnya ke spk_soft
 from .spk_soft import compute_percentiles, soft_multiplier, style_adjust_multiplier
 
 
+def _narrow(idx: np.ndarray, mask: Any) -> np.ndarray:
+    """Persempit array posisi kandidat dengan mask boolean yang sejajar idx."""
+    return idx[np.asarray(mask, dtype=bool)]
+
+
+def _fuel_codes(spec_filters: Dict[str, Any]) -> Optional[frozenset]:
+    """Kode BBM yang diminta filter; None bila tidak membatasi (kosong / semua 5)."""
+    fuels = spec_filters.get("fuels", None)
+    if fuels is None:
+        return None
+    if isinstance(fuels, (str, bytes)):
+        fuels_list = [fuels]
+    else:
+        try:
+            fuels_list = list(fuels)
+        except TypeError:
+            fuels_list = [fuels]
+
+    want_codes = set()
+    for x in fuels_list:
+        if x is None:
+            continue
+        raw = x.get("code") if isinstance(x, dict) else x
+        code = fuel_to_code(str(raw))
+        if code and code != "o":
+            want_codes.add(code)
+    return frozenset(want_codes) if 0 < len(want_codes) < 5 else None
+
+
+# ============================================================
+# Query siap-pakai (bagian yang tidak bergantung budget)
+# ============================================================
+# Per (versi master, needs, brand, transmisi, fuel, mode skor) disimpan:
+#   - mask brand / transmisi / fuel atas seluruh master
+#   - vektor skor atribut katalog (M @ w) untuk mode "catalog"
+#   - memo style_mult per baris master (hanya bergantung baris + needs)
+# Ganti budget saja -> semua ini dipakai ulang; yang dihitung ulang hanya
+# jendela harga, hard constraints, klaster, price_fit dan soft multiplier.
+_MASTER_VERSION_SRC: pd.DataFrame | None = None
+_MASTER_VERSION: str = ""
+_PREP_CACHE: "OrderedDict[Tuple[Any, ...], RankPrep]" = OrderedDict()
+_PREP_CACHE_MAX = 64
+_PREP_LOCK = threading.Lock()
+
+
+def master_version(df_master: pd.DataFrame) -> str:
+    """Hash isi master (brand/model/harga); stabil antar worker untuk data yang sama."""
+    global _MASTER_VERSION_SRC, _MASTER_VERSION
+    if _MASTER_VERSION_SRC is df_master and _MASTER_VERSION:
+        return _MASTER_VERSION
+    cols = [c for c in ("brand", "model", "price") if c in df_master.columns]
+    h = pd.util.hash_pandas_object(df_master[cols], index=False).to_numpy()
+    ver = hashlib.sha1(h.tobytes()).hexdigest()[:16]
+    _MASTER_VERSION_SRC, _MASTER_VERSION = df_master, ver
+    return ver
+
+
+def _query_key(needs: List[str], spec_filters: Dict[str, Any], score_mode: str) -> Tuple[Any, ...]:
+    fuels = _fuel_codes(spec_filters)
+    return (
+        tuple(needs),
+        str(spec_filters.get("brand") or "").strip(),
+        str(spec_filters.get("trans_choice") or "").strip(),
+        tuple(sorted(fuels)) if fuels else (),
+        score_mode,
+    )
+
+
+def rank_fingerprint(
+    df_master: pd.DataFrame,
+    budget: float,
+    spec_filters: Dict[str, Any],
+    needs: List[str],
+    topn: int = 15,
+    score_mode: Optional[str] = None,
+) -> str:
+    """
+    Sidik jari input SPK: sama -> rank_candidates pasti memberi hasil sama.
+    Hanya field yang benar-benar dibaca rank_candidates yang ikut di-hash.
+    """
+    mode = (score_mode or SPK_SCORE_MODE).lower()
+    key = (master_version(df_master), float(budget), int(topn)) + _query_key(sanitize_needs(needs or []), spec_filters or {}, mode)
+    return hashlib.sha1(json.dumps(key, default=str).encode("utf-8")).hexdigest()[:20]
+
+
+class RankPrep:
+    def __init__(self, df_master: pd.DataFrame, needs: List[str], spec_filters: Dict[str, Any], score_mode: str):
+        n = len(df_master)
+        self.brand_mask: Optional[np.ndarray] = None
+        if spec_filters.get("brand"):
+            self.brand_mask = np.asarray(brand_match_mask(df_master["brand"], spec_filters["brand"]), dtype=bool)
+        self.trans_mask = np.asarray(vector_match_trans(df_master["trans"], spec_filters.get("trans_choice")), dtype=bool)
+        self.fuel_codes = _fuel_codes(spec_filters)
+        self.fuel_mask: Optional[np.ndarray] = None
+        if self.fuel_codes is not None:
+            self.fuel_mask = df_master["fuel_code"].astype(str).str.lower().isin(self.fuel_codes).to_numpy()
+        self.w_vec = need_weight_vector(needs)
+        self.attr_catalog: Optional[np.ndarray] = None
+        if score_mode == "catalog" and float(self.w_vec.sum()) > 0:
+            self.attr_catalog = (get_need_score_matrix(df_master) @ self.w_vec).astype(float)
+        self.style_memo = np.full(n, np.nan)
+        self.hits = 0
+
+
+def get_rank_prep(df_master: pd.DataFrame, needs: List[str], spec_filters: Dict[str, Any], score_mode: str) -> RankPrep:
+    # Dipanggil bersamaan dari threadpool, executor spekulatif, sweep, sesi WS
+    # dan spk_relax -> akses cache di bawah lock; RankPrep dibangun di luar lock.
+    key = (id(df_master), master_version(df_master)) + _query_key(needs, spec_filters, score_mode)
+    with _PREP_LOCK:
+        prep = _PREP_CACHE.get(key)
+        if prep is not None:
+            _PREP_CACHE.move_to_end(key)
+            prep.hits += 1
+            return prep
+    prep = RankPrep(df_master, needs, spec_filters, score_mode)
+    with _PREP_LOCK:
+        # thread lain bisa lebih dulu membangun key yang sama -> pakai yang sudah ada
+        prep = _PREP_CACHE.setdefault(key, prep)
+        _PREP_CACHE.move_to_end(key)
+        while len(_PREP_CACHE) > _PREP_CACHE_MAX:
+            _PREP_CACHE.popitem(last=False)
+    return prep
+
+
+# ============================================================
+# Deadline (degradasi bertahap)
+# ============================================================
+# Porsi deadline yang sudah terpakai sebelum tahap mahal dilewati/didekati:
+#   klaster per request -> proyeksi ke model klaster katalog (atau need_score netral)
+#   soft multiplier per baris -> 1.0; style multiplier hanya dari memo
+DEADLINE_CLUSTER_FRAC = 0.35
+DEADLINE_SOFT_FRAC = 0.6
+
+
+class Deadline:
+    """Batas waktu satu ranking; ms None/<=0 -> tanpa batas (tidak pernah telat)."""
+
+    __slots__ = ("t0", "limit_s")
+
+    def __init__(self, ms: Optional[float], t0: Optional[float] = None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.limit_s = float(ms) / 1000.0 if ms and ms > 0 else None
+
+    def spent(self) -> float:
+        """Porsi deadline yang sudah terpakai (0 bila tanpa batas)."""
+        if self.limit_s is None:
+            return 0.0
+        return (time.perf_counter() - self.t0) / self.limit_s
+
+    def late(self, frac: float) -> bool:
+        return self.limit_s is not None and self.spent() >= frac
+
+
+# ============================================================
+# Tahap pipeline (dipakai rank_candidates & spk_sweep)
+# ============================================================
+# Hanya jendela harga, price_fit dan teks alasan yang bergantung budget;
+# hard constraints, klaster, skor atribut dan soft/style tidak.
+MAX_DOWN = 100_000_000.0
+PRICE_CAP_FRAC = 1.15
+# REVISI: Tetapkan bobot harga 30% untuk menjaga "Worth It" logic
+# alpha_price = 0.20 if ({"fun", "offroad"} & needs_set) else 0.30 --> DIHAPUS
+ALPHA_PRICE = 0.30  # FIXED 30% agar harga tetap sensitif untuk orang awam
+
+
+def price_window(budget: float) -> Tuple[float, float]:
+    """(batas bawah, batas atas) harga kandidat: budget - 100jt .. 115% budget."""
+    return max(0.0, budget - MAX_DOWN), budget * PRICE_CAP_FRAC
+
+
+def hard_stage(df_master: pd.DataFrame, idx: np.ndarray, needs: List[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Fitur kebutuhan + hard constraints atas posisi idx -> (idx sisa, frame kerja)."""
+    # Fitur master di-cache sekali; di sini satu-satunya materialisasi frame kerja.
+    cand_feat = get_master_features(df_master).take(idx)
+    # hard_constraints_filter sudah menangani parsing dimensi secara internal
+    hard_ok = hard_constraints_filter(cand_feat, needs or [], stats=PercentileStats(cand_feat))
+
+    if not isinstance(hard_ok, pd.Series):
+        hard_ok = pd.Series(bool(hard_ok), index=cand_feat.index)
+    else:
+        hard_ok = hard_ok.reindex(cand_feat.index)
+    hard_ok = hard_ok.fillna(False).astype(bool).to_numpy()
+
+    n_before = len(idx)
+    if not hard_ok.all():
+        idx = idx[hard_ok]
+        cand_feat = cand_feat.take(np.flatnonzero(hard_ok))
+    n_after = len(idx)
+    print(f" [FILTER] Hard Constraints (Kebutuhan) -> Membuang {n_before - n_after} mobil. Sisa {n_after}.")
+    return idx, cand_feat
+
+
+ClusterFit = Tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray, Dict[int, str]]
+
+
+def cluster_fit(cand_feat: pd.DataFrame) -> Optional[ClusterFit]:
+    """
+    Fit klaster per request (tidak bergantung needs):
+    (frame kerja, X_scaled, centroid, cluster_id, label per klaster); None bila gagal.
+    """
+    # cand_feat adalah frame kerja milik request ini -> boleh dimutasi (copy=False)
+    try:
+        cand_feat2, cluster_to_label, C_scaled, feat_cols, scaler, _ = cluster_and_label(cand_feat, k=6, copy=False)
+        X_for_need = cand_feat2[feat_cols].apply(lambda col: col.fillna(col.median()), axis=0).values
+        X_scaled = scaler.transform(X_for_need)
+        cluster_ids = cand_feat2.get("cluster_id", np.zeros(len(cand_feat2), dtype=int))
+        return cand_feat2, X_scaled, C_scaled, np.asarray(cluster_ids), cluster_to_label
+    except Exception as e:
+        print(f" [WARN] Clustering Error: {e}")
+        return None
+
+
+def cluster_need_scores(fit: Optional[ClusterFit], cand_feat: pd.DataFrame, needs: List[str]) -> Tuple[pd.DataFrame, Any]:
+    """(frame kerja, need_score) dari hasil cluster_fit; gagal -> (cand_feat, 0.0)."""
+    if fit is None:
+        return cand_feat, 0.0
+    cand, X_scaled, C_scaled, cluster_ids, cluster_to_label = fit
+    try:
+        return cand, need_similarity_scores(X_scaled, C_scaled, cluster_ids, cluster_to_label, needs or [])
+    except Exception as e:
+        print(f" [WARN] Clustering Error: {e}")
+        return cand_feat, 0.0
+
+
+def cluster_stage(
+    df_master: pd.DataFrame,
+    idx: np.ndarray,
+    cand_feat: pd.DataFrame,
+    needs: List[str],
+    deadline: Deadline,
+    degraded: List[str],
+) -> pd.DataFrame:
+    """Klaster kandidat + kolom need_score; telat -> proyeksi model klaster katalog."""
+    if deadline.late(DEADLINE_CLUSTER_FRAC):
+        # telat: tanpa fit KMeans per request
+        approx = None
+        try:
+            approx = approx_need_scores(df_master, idx, needs or [])
+        except Exception as e:
+            print(f" [WARN] Approx Cluster Error: {e}")
+        cand = cand_feat
+        if approx is not None:
+            need_score, cand["cluster_id"], cand["pred_label"] = approx
+            degraded.append("cluster_approx")
+        else:
+            need_score = 0.5
+            degraded.append("cluster_skipped")
+        print(f" [DEADLINE] {degraded[-1]} (terpakai {deadline.spent():.0%})")
+    else:
+        cand, need_score = cluster_need_scores(cluster_fit(cand_feat), cand_feat, needs)
+
+    assign_array_safe(cand, "need_score", need_score, fallback=0.0)
+    return cand
+
+
+def price_fit_scores(price: pd.Series, budget: float, stats: PercentileStats) -> pd.Series:
+    """price_fit = 0.5 * posisi harga dalam p10..p90 kandidat + 0.5 * anchor budget."""
+    lower_limit, _ = price_window(budget)
+    p = pd.to_numeric(price, errors="coerce")
+    if p.notna().any():
+        p10 = stats.get("price", 10, 0.0)
+        p90 = stats.get("price", 90, 1.0)
+    else:
+        p10, p90 = 0.0, 1.0
+    p10 = max(p10, lower_limit)
+    span = max(1.0, p90 - p10)
+    price_rank = ((p - p10) / span).clip(0, 1)
+    price_anchor = price_fit_anchor_array(p.to_numpy(dtype=float), budget)
+    return 0.5 * price_rank + 0.5 * price_anchor
+
+
+def pref_scores(
+    cand: pd.DataFrame,
+    idx: np.ndarray,
+    needs: List[str],
+    prep: RankPrep,
+    score_mode: str,
+    stats: PercentileStats,
+) -> pd.Series:
+    """Skor preferensi (atribut berbobot + need_score klaster), 0..1, sebelum harga."""
+    weights = need_weights(needs)
+    print(f" [SCORE] Bobot Kebutuhan: {list(zip(needs[:3], weights))} (mode={score_mode})")
+
+    w_total = 0.0
+    if score_mode == "catalog":
+        # Matriks N x 6 atas persentil seluruh katalog: gather + matriks-vektor
+        w_total = float(prep.w_vec.sum())
+        if w_total > 0:
+            attr_weighted = pd.Series(prep.attr_catalog[idx], index=cand.index)
+    else:
+        # Relatif terhadap kandidat (persentil dari stats kandidat final)
+        score_map = need_attribute_scores(cand, stats)
+        attr_weighted = pd.Series(0.0, index=cand.index, dtype=float)
+        for i, need_key in enumerate(needs[:3]):
+            if need_key in score_map:
+                s_val = score_map[need_key]
+                w_val = weights[i]
+                attr_weighted += s_val * w_val
+                w_total += w_val
+
+    if w_total > 0:
+        attr_score = (attr_weighted / w_total).clip(0, 1)
+    else:
+        attr_score = pd.to_numeric(cand.get("need_score", 0.5), errors="coerce").fillna(0.5)
+
+    if needs:
+        need_s = pd.to_numeric(cand.get("need_score", 0.5), errors="coerce").fillna(0.5)
+        return (0.7 * attr_score + 0.3 * need_s).clip(0, 1)
+    return attr_score
+
+
+def soft_stage(
+    cand: pd.DataFrame,
+    idx: np.ndarray,
+    needs: List[str],
+    prep: RankPrep,
+    stats: PercentileStats,
+    deadline: Deadline,
+    degraded: List[str],
+) -> None:
+    """Isi kolom soft_mult & style_mult (style di-memo per posisi master)."""
+    memo = prep.style_memo
+    missing = np.isnan(memo[idx])
+    if deadline.late(DEADLINE_SOFT_FRAC):
+        # telat: soft netral, style hanya dari memo (baris baru -> 1.0, memo tidak diisi)
+        cand["soft_mult"] = 1.0
+        cand["style_mult"] = np.where(missing, 1.0, memo[idx])
+        degraded.append("soft_skipped")
+        print(f" [DEADLINE] soft_skipped (terpakai {deadline.spent():.0%}, style memo {int((~missing).sum())}/{len(idx)})")
+    else:
+        P = compute_percentiles(cand, stats=stats)
+        cand["soft_mult"] = cand.apply(lambda r: soft_multiplier(r, needs or [], P), axis=1)
+        if missing.any():
+            memo[idx[missing]] = cand[missing].apply(
+                lambda r: style_adjust_multiplier(r, needs or []), axis=1
+            ).to_numpy(dtype=float)
+        cand["style_mult"] = memo[idx]
+
+
+_VARIANT_TOKENS = [
+    "prime", "signature", "extended", "extended range", "extended-range", "extendedrange",
+    "premium", "performance", "dynamic", "deluxe", "sport", "long range", "longrange", "lr",
+    "standard", "base", "ultimate", "plus", "pro", "elite", "comfort", "tech", "advanced",
+    "limited", "reguler", "reg", "two tone", "twotone", "two-tone", "premium extended range",
+    "premiumextended", "premiumextendedrange"
+]
+_VARIANT_PAT = r"\b(?:" + "|".join(re.escape(t) for t in _VARIANT_TOKENS) + r")\b"
+MAX_TRIMS_PER_MODEL = 2
+
+
+def _infer_model_base(s: str) -> str:
+    if not isinstance(s, str):
+        s = str(s or "")
+    s0 = s.lower()
+    s0 = re.sub(r"\b(ev|bev|phev|phev|hev|hybrid|plugin|plug-in|plugin-hybrid|electric)\b", " ", s0, flags=re.I)
+    s0 = re.sub(_VARIANT_PAT, " ", s0, flags=re.I)
+    s0 = re.sub(r"\b(v\d+|mk\d+|gen\d+|g\d+)\b", " ", s0, flags=re.I)
+    s0 = re.sub(r"\b(reguler|series|type|edition|line|limited|model)\b", " ", s0, flags=re.I)
+    s0 = re.sub(r"[\/\,\-\(\)]", " ", s0)
+    s0 = re.sub(r"\s+", " ", s0).strip()
+    if not s0:
+        s0 = " ".join((s or "").split()[:2]).strip().lower()
+    return s0
+
+
+def dedup_keys(cand: pd.DataFrame) -> pd.DataFrame:
+    """Frame kunci dedup per baris cand (pos, model_norm, price_int, model_base, brand_key_lc)."""
+    model_s = cand["model"].astype(str)
+    brand_s = cand.get("brand", pd.Series([""] * len(cand), index=cand.index)).astype(str)
+    return pd.DataFrame({
+        "pos": np.arange(len(cand)),
+        "model_norm": model_s.str.replace(r"\s+", " ", regex=True).str.strip().str.lower().to_numpy(),
+        "price_int": pd.to_numeric(cand["price"], errors="coerce").fillna(-1).astype(int).to_numpy(),
+        "model_base": model_s.str.strip().str.lower().apply(_infer_model_base).to_numpy(),
+        "brand_key_lc": brand_s.str.strip().str.lower().to_numpy(),
+    })
+
+
+def dedup_order(keys: pd.DataFrame, fit_score: np.ndarray) -> np.ndarray:
+    """
+    Posisi cand urut fit_score menurun setelah dedup: maks 2 trim per
+    (brand, model dasar) dan satu baris per (model, harga). fit_score sejajar keys.
+    """
+    keys = keys.assign(fit_score=fit_score).sort_values(["fit_score"], ascending=[False])
+    keys = keys.groupby(["brand_key_lc", "model_base"], sort=False).head(MAX_TRIMS_PER_MODEL)
+    keys = keys.sort_values(["fit_score"], ascending=[False]).drop_duplicates(subset=["model_norm", "price_int"], keep="first")
+    return keys["pos"].to_numpy()
+
+
+def top_frame(cand: pd.DataFrame, order: np.ndarray, topn: Optional[int], budget: float, needs: List[str]) -> pd.DataFrame:
+    """Materialisasi top-n dari urutan dedup + spk_reason, rank, points."""
+    n_out = len(order)
+    if n_out > 1:
+        points_all = np.round(np.linspace(99, 60, num=n_out)).astype(int)
+    else:
+        points_all = np.full(n_out, 99, dtype=int)
+
+    topn = 15 if (topn is None or topn <= 0) else int(topn)
+
+    # Materialisasi: hanya baris top-n yang disalin dari frame kerja
+    sel = order[:topn]
+    cand = cand.take(sel).reset_index(drop=True)
+    # 12) Alasan singkat (hanya untuk baris top-n)
+    cand["spk_reason"] = cand.apply(lambda r: reason_text(r, budget, needs), axis=1) if len(cand) else pd.Series(dtype=object)
+    cand["rank"] = np.arange(1, len(cand) + 1, dtype=int)
+    cand["points"] = points_all[: len(cand)]
+    return cand
+
+
+def reason_text(r: pd.Series, budget: float, needs: List[str]) -> str:
+    """Alasan singkat satu baris hasil (budget + kebutuhan utama)."""
+    why = []
+    if r.get("price", np.nan) <= budget:
+        why.append("sesuai budget")
+    elif r.get("price", np.nan) <= budget * PRICE_CAP_FRAC:
+        why.append("sedikit di atas budget")
+
+    if needs:
+        main = needs[0]
+        if main == "keluarga":
+            s = int(r.get("seats", 0) or 0)
+            why.append(f"{s}-seater")
+        elif main == "perkotaan":
+            why.append("dimensi ringkas")
+        elif main == "fun":
+            if has_turbo_model(str(r.get("model", ""))):
+                why.append("mesin turbo")
+            else:
+                why.append("mesin responsif")
+        elif main == "offroad":
+            if float(r.get("awd_flag", 0)) >= 0.5:
+                why.append("penggerak AWD/4x4")
+        elif main == "perjalanan_jauh":
+            if str(r.get("fuel_code", "")) == "d":
+                why.append("mesin diesel tangguh")
+            elif str(r.get("fuel_code", "")) in ["h", "p"]:
+                why.append("hybrid efisien")
+            else:
+                why.append("nyaman jarak jauh")
+        elif main == "niaga":
+            why.append("kapasitas/utility sesuai niaga")
+
+    prev = r.get("alasan", "")
+    res = ", ".join(why)
+    if prev and isinstance(prev, str):
+        if res:
+            return prev + "; " + res
+        return prev
+    return res
+
+
 def rank_candidates(
     df_master: pd.DataFrame,
     budget: float,
     spec_filters: Dict[str, Any],
     needs: List[str],
     topn: int = 15,
+    score_mode: Optional[str] = None,
+    deadline_ms: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    started_at: Optional[float] = None,
 ) -> pd.DataFrame:
+    """
+    score_mode:
+      - "relative" (default): skor atribut dinormalisasi terhadap kandidat saat ini.
+      - "catalog": skor atribut diambil dari matriks N x 6 yang dinormalisasi
+        terhadap seluruh katalog (get_need_score_matrix), biaya tetap per request.
+      None -> config.SPK_SCORE_MODE.
+    deadline_ms: bila diset dan ranking mulai telat, tahap mahal dilewati /
+      didekati (lihat DEADLINE_*_FRAC). Tahap yang terdegradasi dicatat di
+      `hasil.attrs["spk_degraded"]` (list kosong = hasil penuh).
+    started_at: time.perf_counter() saat request tiba; deadline dihitung dari
+      titik ini (antrean threadpool / tunggu single-flight ikut terhitung).
+      None -> saat fungsi ini mulai.
+    cancel: token pembatalan (client putus); dicek di antara tahap, bila
+      dibatalkan raise RankCancelled (tidak ditelan seperti error lain).
+    """
     try:
         t0 = time.perf_counter()
+        deadline = Deadline(deadline_ms, t0 if started_at is None else started_at)
+        degraded: List[str] = []
+        check = cancel.check if cancel is not None else (lambda stage: None)
+        score_mode = (score_mode or SPK_SCORE_MODE).lower()
+        if score_mode not in SCORE_MODES:
+            score_mode = "relative"
 
         # --- DEBUG INPUT ---
         print("\n" + "=" * 50)
@@ -49,358 +540,96 @@ def rank_candidates(
         needs_set = set(needs)
         print(f" [PROCESS] Needs Sanitized: {needs}")
 
-        # 1) Filter harga (<= 115% budget)  & filter TOO-CHEAP (>= budget - 100jt)
-        cap = budget * 1.15
-        cand = df_master[df_master["price"] <= cap].copy()
-        print(f" [FILTER] Harga <= {cap:,.0f} -> Sisa {len(cand)} mobil")
+        # Bagian query yang tidak bergantung budget (mask filter, memo style)
+        prep = get_rank_prep(df_master, needs, spec_filters, score_mode)
+        if prep.hits:
+            print(f" [PREP] Query siap-pakai dipakai ulang (hit #{prep.hits})")
 
-        if cand.empty:
-            print(" [STOP] Tidak ada mobil masuk range harga.")
-            return _ensure_df(cand)
+        check("filter")
 
-        MAX_DOWN = 100_000_000.0
-        lower_limit = max(0.0, budget - MAX_DOWN)
+        # 1) Filter harga (<= 115% budget)  & filter TOO-CHEAP (>= budget - 100jt)
+        # Pipeline membawa array posisi `idx` ke df_master (immutable). Tiap filter
+        # hanya mempersempit idx; frame kandidat baru dibuat saat fitur dibutuhkan.
+        lower_limit, cap = price_window(budget)
+        price_all = pd.to_numeric(df_master["price"], errors="coerce").to_numpy(dtype=float)
+        idx = np.flatnonzero(price_all <= cap)
+        print(f" [FILTER] Harga <= {cap:,.0f} -> Sisa {len(idx)} mobil")
+
+        if idx.size == 0:
+            print(" [STOP] Tidak ada mobil masuk range harga.")
+            return _ensure_df(df_master.iloc[idx])
 
-        n_before_price_lower = len(cand)
-        cand = cand[cand["price"].notna() & (cand["price"] >= lower_limit)].copy()
-        n_after_price_lower = len(cand)
+        n_before_price_lower = len(idx)
+        idx = idx[price_all[idx] >= lower_limit]
+        n_after_price_lower = len(idx)
         print(f" [FILTER] Hapus mobil harga < {lower_limit:,.0f} (max down {MAX_DOWN:,.0f}) -> Membuang {n_before_price_lower - n_after_price_lower}. Sisa {n_after_price_lower}.")
 
-        if cand.empty:
+        if idx.size == 0:
             print(" [STOP] Tidak ada mobil setelah filter batas bawah harga.")
-            return _ensure_df(cand)
+            return _ensure_df(df_master.iloc[idx])
 
         # 2) Filter brand (opsional)
-        if spec_filters.get("brand"):
-            cand = cand[brand_match_mask(cand["brand"], spec_filters["brand"])]
-            print(f" [FILTER] Brand '{spec_filters['brand']}' -> Sisa {len(cand)} mobil")
-            if cand.empty:
-                return _ensure_df(cand)
+        if prep.brand_mask is not None:
+            idx = idx[prep.brand_mask[idx]]
+            print(f" [FILTER] Brand '{spec_filters['brand']}' -> Sisa {len(idx)} mobil")
+            if idx.size == 0:
+                return _ensure_df(df_master.iloc[idx])
 
         # 3) Filter transmisi
         trans_choice = spec_filters.get("trans_choice")
-        cand = cand[vector_match_trans(cand["trans"], trans_choice)]
-        print(f" [FILTER] Transmisi '{trans_choice}' -> Sisa {len(cand)} mobil")
-        if cand.empty:
-            return _ensure_df(cand)
+        idx = idx[prep.trans_mask[idx]]
+        print(f" [FILTER] Transmisi '{trans_choice}' -> Sisa {len(idx)} mobil")
+        if idx.size == 0:
+            return _ensure_df(df_master.iloc[idx])
 
         # 4) Filter fuel
-        fuels = spec_filters.get("fuels", None)
-        if fuels is not None:
-            if isinstance(fuels, (str, bytes)):
-                fuels_list = [fuels]
-            else:
-                try:
-                    fuels_list = list(fuels)
-                except TypeError:
-                    fuels_list = [fuels]
-
-            want_codes = set()
-            for x in fuels_list:
-                if x is None:
-                    continue
-                raw = x.get("code") if isinstance(x, dict) else x
-                code = fuel_to_code(str(raw))
-                if code and code != "o":
-                    want_codes.add(code)
-
-            if 0 < len(want_codes) < 5:
-                cand = cand[cand["fuel_code"].astype(str).str.lower().isin(want_codes)]
-                print(f" [FILTER] Fuel Codes {want_codes} -> Sisa {len(cand)} mobil")
-                if cand.empty:
-                    return _ensure_df(cand)
+        if prep.fuel_mask is not None:
+            idx = idx[prep.fuel_mask[idx]]
+            print(f" [FILTER] Fuel Codes {set(prep.fuel_codes)} -> Sisa {len(idx)} mobil")
+            if idx.size == 0:
+                return _ensure_df(df_master.iloc[idx])
+
+        check("hard_constraints")
 
         # 5) Tambah fitur kebutuhan + hard constraints
-        cand_feat = add_need_features(cand)
-        # hard_constraints_filter sudah menangani parsing dimensi secara internal
-        hard_ok = hard_constraints_filter(cand_feat, needs or [])
-        
-        if not isinstance(hard_ok, pd.Series):
-            hard_ok = pd.Series(bool(hard_ok), index=cand_feat.index)
-        else:
-            hard_ok = hard_ok.reindex(cand_feat.index)
-        hard_ok = hard_ok.fillna(False).astype(bool)
+        idx, cand_feat = hard_stage(df_master, idx, needs)
+        if idx.size == 0:
+            return _ensure_df(cand_feat)
 
-        n_before = len(cand)
-        cand = cand[hard_ok]
-        cand_feat = cand_feat[hard_ok]
-        n_after = len(cand)
-        print(f" [FILTER] Hard Constraints (Kebutuhan) -> Membuang {n_before - n_after} mobil. Sisa {n_after}.")
-        if cand.empty:
-            return _ensure_df(cand)
+        check("cluster")
 
         # 6) Klaster (Machine Learning Similarity)
-        try:
-            cand_feat2, cluster_to_label, C_scaled, feat_cols, scaler, _ = cluster_and_label(cand_feat, k=6)
-            X_for_need = cand_feat2[feat_cols].apply(lambda col: col.fillna(col.median()), axis=0).values
-            X_scaled = scaler.transform(X_for_need)
-            cluster_ids = cand_feat2.get("cluster_id", np.zeros(len(cand_feat2), dtype=int))
+        cand = cluster_stage(df_master, idx, cand_feat, needs, deadline, degraded)
 
-            need_score = need_similarity_scores(X_scaled, C_scaled, np.asarray(cluster_ids), cluster_to_label, needs or [])
-            cand = cand_feat2.copy()
-        except Exception as e:
-            print(f" [WARN] Clustering Error: {e}")
-            need_score = 0.0
-            cand = cand_feat.copy()
+        # Statistik persentil kandidat final: dipakai bersama tahap scoring & soft
+        stats = PercentileStats(cand)
 
-        assign_array_safe(cand, "need_score", need_score, fallback=0.0)
+        check("score")
 
         # 7) Harga: price_fit
-        p = pd.to_numeric(cand["price"], errors="coerce")
-        if p.notna().any():
-            p10 = float(np.nanpercentile(p.dropna(), 10))
-            p90 = float(np.nanpercentile(p.dropna(), 90))
-        else:
-            p10, p90 = 0.0, 1.0
-        p10 = max(p10, lower_limit)
-        span = max(1.0, p90 - p10)
-        price_rank = ((p - p10) / span).clip(0, 1)
-        pmax_cand = float(p.max() if p.notna().any() else budget)
-        price_anchor = p.apply(lambda x: price_fit_anchor(x, budget, pmax_cand))
-        cand["price_fit"] = 0.5 * price_rank + 0.5 * price_anchor
-
-        # 8) Skor atribut detail (Raw Scoring - Baseline)
-        def _scale_01(series: pd.Series) -> pd.Series:
-            s = pd.to_numeric(series, errors="coerce")
-            s_valid = s.dropna()
-            if s_valid.empty:
-                return pd.Series(0.5, index=series.index, dtype=float)
-            lo = float(np.nanpercentile(s_valid, 5))
-            hi = float(np.nanpercentile(s_valid, 95))
-            span = max(1e-6, hi - lo)
-            return ((s - lo) / span).clip(0, 1)
-
-        length = _series_num(cand.get("length_mm"))
-        width = _series_num(cand.get("width_mm"))
-        wb = _series_num(cand.get("wheelbase_mm"))
-        weight = _series_num(cand.get("vehicle_weight_kg"))
-        cc = _series_num(cand.get("cc_kwh_num"))
-        rim = _series_num(cand.get("rim_inch"))
-        tyr = _series_num(cand.get("tyre_w_mm"))
-        awd = _series_num(cand.get("awd_flag")).fillna(0.0)
-        seats = _series_num(cand.get("seats"))
-        doors = _series_num(cand.get("doors_num"))
-
-        fuel_c = cand.get("fuel_code", pd.Series(["o"] * len(cand), index=cand.index)).astype(str).str.lower()
-        seg = cand.get("segmentasi", pd.Series([""] * len(cand), index=cand.index)).astype(str).str.lower()
-        model = cand.get("model", pd.Series([""] * len(cand), index=cand.index)).astype(str)
-
-        if weight.notna().any():
-            weight_filled = weight.fillna(weight.median())
-        else:
-            weight_filled = weight.fillna(0.0)
-
-        len_norm = _scale_01(length)
-        wid_norm = _scale_01(width)
-        wgt_norm = _scale_01(weight_filled)
-        wb_norm = _scale_01(wb)
-        cc_norm = _scale_01(cc)
-        rim_norm = _scale_01(rim)
-        tyr_norm = _scale_01(tyr)
-
-        pw_raw = cc / weight_filled.replace(0, np.nan)
-        pw_norm = _scale_01(pw_raw)
-
-        turbo_flag = model.apply(has_turbo_model).astype(float)
-        is_elec_hybrid = fuel_c.isin({"h", "p", "e"}).astype(float)
-        is_diesel = (fuel_c == "d").astype(float)
-
-        # Baseline Scores (Angka kasar sebelum Soft Multiplier)
-        small_size = (0.45 * (1 - len_norm) + 0.45 * (1 - wid_norm) + 0.10 * (1 - wgt_norm))
-        cc_small = 1 - cc_norm
-        efficiency_score = (0.30 * cc_small + 0.20 * (1 - wgt_norm) + 0.50 * is_elec_hybrid).clip(0, 1)
-
-        is_ev = (fuel_c == "e")
-        dim_comp_non_ev = 0.40 * (1 - wid_norm) + 0.30 * (1 - len_norm) + 0.30 * (1 - wgt_norm)
-        dim_comp_ev = 0.30 * (1 - wid_norm) + 0.20 * (1 - len_norm) + 0.50 * (1 - wgt_norm)
-        dim_comp = dim_comp_non_ev.where(~is_ev, dim_comp_ev)
-        efficiency_boost = efficiency_score * (1.05 * is_ev + 1.0 * (~is_ev))
-        city_score = (0.40 * dim_comp + 0.60 * efficiency_boost).clip(0, 1)
-
-        sedan_mask = seg.str.contains(r"\bsedan\b", flags=re.I, regex=True)
-        sedan_allow = sedan_mask & (width >= 1650)
-        city_score = city_score + (0.02 * sedan_allow.astype(float))
-        city_score = city_score.clip(0, 1)
-
-        perf_score = (0.50 * pw_norm + 0.15 * rim_norm + 0.10 * turbo_flag + 0.10 * tyr_norm + 0.15 * (awd > 0.5).astype(float)).clip(0, 1)
-
-        seats_capped = seats.clip(upper=9)
-        seats_norm = _scale_01(seats_capped)
-        doors_good = (doors >= 5).astype(float)
-        mpv_like = seg.str.contains(r"\b(?:mpv|van|minibus)\b", flags=re.I, regex=True).astype(float)
-
-        family_score = (0.50 * seats_norm + 0.30 * doors_good + 0.20 * mpv_like).clip(0, 1)
-        seats_ge6 = (seats >= 6)
-        family_score = family_score + (0.08 * seats_ge6.astype(float)) 
-        seats_eq5 = (seats == 5)
-        seats_eq5_ok = seats_eq5 & ((width >= 1700) | (wb >= 2500) | (mpv_like == 1.0))
-        family_score = family_score + (0.03 * seats_eq5_ok.astype(float))
-        family_score = family_score.clip(0, 1)
-
-        if length.notna().any():
-            len_p80 = float(np.nanpercentile(length.dropna(), 80))
-            too_long = length > len_p80
-            family_score[too_long & (seats >= 9)] *= 0.95
-
-        comfort_score = (0.40 * wb_norm + 0.20 * wgt_norm + 0.20 * len_norm + 0.20 * (is_diesel * 0.8 + efficiency_score * 0.2)).clip(0, 1)
-        suv_pickup = seg.str.contains(r"\b(?:suv|crossover|pick|truck|pickup)\b", flags=re.I, regex=True).astype(float)
-        offroad_score = (0.45 * (awd.clip(0, 1)) + 0.25 * tyr_norm + 0.15 * rim_norm + 0.15 * suv_pickup).clip(0, 1)
-        utility_score = (0.5 * len_norm + 0.5 * wgt_norm).clip(0, 1)
-
-        # 9) PEMBOBOTAN DINAMIS
-        score_map = {
-            "fun": perf_score,
-            "keluarga": family_score,
-            "perjalanan_jauh": comfort_score,
-            "perkotaan": city_score,
-            "niaga": utility_score,
-            "offroad": offroad_score,
-        }
-
-        n_needs = len(needs)
-        if n_needs == 0:
-            weights = []
-        elif n_needs == 1:
-            weights = [1.0]
-        elif n_needs == 2:
-            weights = [0.65, 0.35]
-        else:
-            weights = [0.55, 0.30, 0.15]
-
-        attr_weighted = pd.Series(0.0, index=cand.index, dtype=float)
-        w_total = 0.0
-        print(f" [SCORE] Bobot Kebutuhan: {list(zip(needs[:3], weights))}")
+        cand["price_fit"] = price_fit_scores(cand["price"], budget, stats)
 
-        for i, need_key in enumerate(needs[:3]):
-            if need_key in score_map:
-                s_val = score_map[need_key]
-                w_val = weights[i]
-                attr_weighted += s_val * w_val
-                w_total += w_val
-
-        if w_total > 0:
-            attr_score = (attr_weighted / w_total).clip(0, 1)
-        else:
-            attr_score = pd.to_numeric(cand.get("need_score", 0.5), errors="coerce").fillna(0.5)
-
-        if needs:
-            need_s = pd.to_numeric(cand.get("need_score", 0.5), errors="coerce").fillna(0.5)
-            pref_score = (0.7 * attr_score + 0.3 * need_s).clip(0, 1)
-        else:
-            pref_score = attr_score
+        # 8) Skor atribut detail + 9) pembobotan dinamis
+        pref_score = pref_scores(cand, idx, needs, prep, score_mode, stats)
 
         # 10) Gabungkan dengan Price Fit
-        # REVISI: Tetapkan bobot harga 30% untuk menjaga "Worth It" logic
-        # alpha_price = 0.20 if ({"fun", "offroad"} & needs_set) else 0.30 --> DIHAPUS
-        alpha_price = 0.30 # FIXED 30% agar harga tetap sensitif untuk orang awam
-        
-        cand["fit_score"] = ((1.0 - alpha_price) * pref_score + alpha_price * cand["price_fit"]).clip(0, 1)
+        cand["fit_score"] = ((1.0 - ALPHA_PRICE) * pref_score + ALPHA_PRICE * cand["price_fit"]).clip(0, 1)
+
+        check("soft")
 
         # 11) SOFT & STYLE LAYER (THE JUDGE)
-        P = compute_percentiles(cand)
-        cand["soft_mult"] = cand.apply(lambda r: soft_multiplier(r, needs or [], P), axis=1)
-        cand["style_mult"] = cand.apply(lambda r: style_adjust_multiplier(r, needs or []), axis=1)
+        soft_stage(cand, idx, needs, prep, stats, deadline, degraded)
 
         cand["raw_score"] = cand["fit_score"]
         cand["fit_score"] = (cand["fit_score"] * cand["soft_mult"] * cand["style_mult"]).clip(0, 1.0)
 
-        # 12) Alasan singkat (Generating Reason Text)
-        def mk_reason(r):
-            why = []
-            if r.get("price", np.nan) <= budget:
-                why.append("sesuai budget")
-            elif r.get("price", np.nan) <= budget * 1.15:
-                why.append("sedikit di atas budget")
-
-            if needs:
-                main = needs[0]
-                if main == "keluarga":
-                    s = int(r.get("seats", 0) or 0)
-                    why.append(f"{s}-seater")
-                elif main == "perkotaan":
-                    why.append("dimensi ringkas")
-                elif main == "fun":
-                    if has_turbo_model(str(r.get("model", ""))):
-                        why.append("mesin turbo")
-                    else:
-                        why.append("mesin responsif")
-                elif main == "offroad":
-                    if float(r.get("awd_flag", 0)) >= 0.5:
-                        why.append("penggerak AWD/4x4")
-                elif main == "perjalanan_jauh":
-                    if str(r.get("fuel_code", "")) == "d":
-                        why.append("mesin diesel tangguh")
-                    elif str(r.get("fuel_code", "")) in ["h", "p"]:
-                        why.append("hybrid efisien")
-                    else:
-                        why.append("nyaman jarak jauh")
-                elif main == "niaga":
-                    why.append("kapasitas/utility sesuai niaga")
-            
-            prev = r.get("alasan", "")
-            res = ", ".join(why)
-            if prev and isinstance(prev, str):
-                if res:
-                    return prev + "; " + res
-                return prev
-            return res
-
-        cand["spk_reason"] = cand.apply(mk_reason, axis=1)
+        check("dedup")
 
         # 13) Sortir, dedup, rank FINAL
-        cand["model_norm"] = cand["model"].astype(str).str.replace(r"\s+", " ", regex=True).str.strip().str.lower()
-        cand["price_int"] = pd.to_numeric(cand["price"], errors="coerce").fillna(-1).astype(int)
-
-        cand = cand.sort_values(["fit_score"], ascending=[False])
-
-        variant_tokens = [
-            "prime", "signature", "extended", "extended range", "extended-range", "extendedrange",
-            "premium", "performance", "dynamic", "deluxe", "sport", "long range", "longrange", "lr",
-            "standard", "base", "ultimate", "plus", "pro", "elite", "comfort", "tech", "advanced",
-            "limited", "reguler", "reg", "two tone", "twotone", "two-tone", "premium extended range",
-            "premiumextended", "premiumextendedrange"
-        ]
-        var_pat = r"\b(?:" + "|".join(re.escape(t) for t in variant_tokens) + r")\b"
-
-        def infer_model_base(s: str) -> str:
-            if not isinstance(s, str):
-                s = str(s or "")
-            s0 = s.lower()
-            s0 = re.sub(r"\b(ev|bev|phev|phev|hev|hybrid|plugin|plug-in|plugin-hybrid|electric)\b", " ", s0, flags=re.I)
-            s0 = re.sub(var_pat, " ", s0, flags=re.I)
-            s0 = re.sub(r"\b(v\d+|mk\d+|gen\d+|g\d+)\b", " ", s0, flags=re.I)
-            s0 = re.sub(r"\b(reguler|series|type|edition|line|limited|model)\b", " ", s0, flags=re.I)
-            s0 = re.sub(r"[\/\,\-\(\)]", " ", s0)
-            s0 = re.sub(r"\s+", " ", s0).strip()
-            if not s0:
-                s0 = " ".join((s or "").split()[:2]).strip().lower()
-            return s0
-
-        cand["model_norm_full"] = cand.get("model", pd.Series([""] * len(cand), index=cand.index)).astype(str).str.strip()
-        cand["model_norm_lc"] = cand["model_norm_full"].str.lower()
-        cand["model_base"] = cand["model_norm_lc"].apply(infer_model_base)
-        cand["brand_key_lc"] = cand.get("brand", pd.Series([""] * len(cand), index=cand.index)).astype(str).str.strip().str.lower()
-
-        max_trims_per_model = 2
-        cand = cand.groupby(["brand_key_lc", "model_base"], sort=False).head(max_trims_per_model).reset_index(drop=True)
-
-        cand = (
-            cand.sort_values(["fit_score"], ascending=[False])
-            .drop_duplicates(subset=["model_norm", "price_int"], keep="first")
-            .drop(columns=["model_norm", "price_int", "model_norm_full", "model_norm_lc", "model_base", "brand_key_lc"], errors="ignore")
-            .reset_index(drop=True)
-        )
-
-        n_out = len(cand)
-        cand["rank"] = np.arange(1, n_out + 1, dtype=int)
-        if n_out > 1:
-            cand["points"] = np.round(np.linspace(99, 60, num=n_out)).astype(int)
-        elif n_out == 1:
-            cand["points"] = [99]
-        else:
-            cand["points"] = []
-
-        topn = 15 if (topn is None or topn <= 0) else int(topn)
+        # Dikerjakan pada frame kunci kecil (posisi + kunci dedup); frame hasil
+        # hanya dimaterialisasi untuk top-n di akhir.
+        order = dedup_order(dedup_keys(cand), cand["fit_score"].to_numpy())
+        cand = top_frame(cand, order, topn, budget, needs)
 
         # DEBUG TOP
         print("\n [SPK DEBUG] TOP 5 KANDIDAT:")
@@ -411,9 +640,14 @@ def rank_candidates(
         print("=" * 50 + "\n")
 
         t1 = time.perf_counter()
-        print(f" [TIMING] rank_candidates done in {t1 - t0:.2f}s")
-        return _ensure_df(cand.head(topn))
-
+        print(f" [TIMING] rank_candidates done in {t1 - t0:.2f}s" + (f" degraded={degraded}" if degraded else ""))
+        out = _ensure_df(cand)
+        out.attrs["spk_degraded"] = degraded
+        return out
+
+    except RankCancelled as e:
+        print(f" [CANCEL] rank_candidates {e}")
+        raise
     except Exception as e:
         print(f"[rank] error: {type(e).__name__}: {e}")
         import traceback
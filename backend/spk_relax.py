@@ -0,0 +1,298 @@
+# file: backend/spk_relax.py
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import RELAX_VERIFY_MAX, SPK_SCORE_MODE
+from .spk_features import get_master_features
+from .spk_hard import hard_constraints_filter
+from .spk_needs import sanitize_needs
+from .spk_rank import MAX_DOWN, PRICE_CAP_FRAC, get_rank_prep, price_window
+from .spk_scores import SCORE_MODES, need_weights
+from .spk_stats import PercentileStats, get_catalog_stats
+
+# ============================================================
+# Relaksasi minimal saat hasil kosong
+# ============================================================
+# Dicari perubahan TERMURAH yang membuat ranking kembali berisi:
+#   naik/turun budget ke X, hapus brand, hapus transmisi, hapus BBM, lepas need Y.
+# Per master disimpan (RelaxIndex):
+#   - harga + urutan harga (argsort) -> harga terurut untuk mask apa pun O(n)
+#     tanpa sort, hitung jendela budget dengan searchsorted
+#   - mask hard constraints per HIMPUNAN needs atas seluruh katalog
+#     (persentil katalog, LRU)
+# Mask brand/transmisi/BBM diambil dari RankPrep (sama dengan ranking).
+# Hard constraints memakai persentil jendela kandidat, jadi mask katalog
+# hanya PERKIRAAN: dipakai untuk menyaring & mengurutkan calon, lalu maksimal
+# RELAX_VERIFY_MAX calon termurah diverifikasi persis (hard constraints atas
+# jendela kandidat, sama dengan rank_candidates).
+
+BUDGET_ROUND = 5_000_000.0
+BUDGET_TRIES = 3            # calon budget per arah yang dipertimbangkan
+NEED_MASK_CACHE = 32
+
+# Biaya relatif tiap jenis perubahan (makin kecil makin disarankan).
+# Budget: COST_BUDGET_PER_10PCT per 10% perubahan budget.
+COST_BUDGET_PER_10PCT = 1.0
+COST_DROP = {"trans": 1.0, "fuels": 1.0, "brand": 1.5}
+COST_NEED_BASE = 1.0        # + 2 x bobot need (need prioritas utama paling mahal)
+
+_LABEL_NEED = {
+    "perkotaan": "Perkotaan",
+    "keluarga": "Keluarga",
+    "fun": "Fun to Drive",
+    "offroad": "Offroad",
+    "perjalanan_jauh": "Perjalanan Jauh",
+    "niaga": "Niaga",
+}
+
+
+def _fmt_rp(amount: float) -> str:
+    if amount >= 1_000_000_000:
+        return f"Rp {amount / 1_000_000_000:.2f}".rstrip("0").rstrip(".").replace(".", ",") + " Miliar"
+    return f"Rp {amount / 1_000_000:,.0f} Juta".replace(",", ".")
+
+
+class RelaxIndex:
+    def __init__(self, df_master: pd.DataFrame):
+        self.df_master = df_master
+        self.price = pd.to_numeric(df_master["price"], errors="coerce").to_numpy(dtype=float)
+        self.valid = np.isfinite(self.price)
+        order = np.argsort(self.price, kind="stable")
+        self.order = order[self.valid[order]]          # posisi berharga valid, harga menaik
+        self.sorted_price = self.price[self.order]
+        self._need_masks: "OrderedDict[frozenset, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def need_mask(self, needs: List[str]) -> np.ndarray:
+        """Perkiraan hard constraints (persentil katalog) untuk himpunan needs."""
+        key = frozenset(needs)
+        with self._lock:
+            mask = self._need_masks.get(key)
+            if mask is not None:
+                self._need_masks.move_to_end(key)
+                return mask
+        feat = get_master_features(self.df_master)
+        ok = hard_constraints_filter(feat, sorted(key), stats=get_catalog_stats(self.df_master))
+        mask = np.asarray(ok.reindex(feat.index).fillna(False), dtype=bool)
+        with self._lock:
+            self._need_masks[key] = mask
+            while len(self._need_masks) > NEED_MASK_CACHE:
+                self._need_masks.popitem(last=False)
+        return mask
+
+    def prices_of(self, mask: np.ndarray) -> np.ndarray:
+        """Harga terurut menaik dari baris mask (tanpa sort ulang)."""
+        return self.sorted_price[mask[self.order]]
+
+    def window_idx(self, budget: float, mask: np.ndarray) -> np.ndarray:
+        lo, cap = price_window(budget)
+        a = np.searchsorted(self.sorted_price, lo, side="left")
+        b = np.searchsorted(self.sorted_price, cap, side="right")
+        idx = self.order[a:b]
+        return idx[mask[idx]]
+
+    def exact_count(self, budget: float, mask: np.ndarray, needs: List[str]) -> int:
+        """Jumlah kandidat lolos hard constraints persis seperti rank_candidates."""
+        idx = self.window_idx(budget, mask)
+        if idx.size == 0:
+            return 0
+        feat = get_master_features(self.df_master).take(idx)
+        ok = hard_constraints_filter(feat, needs, stats=PercentileStats(feat))
+        return int(np.asarray(ok.reindex(feat.index).fillna(False), dtype=bool).sum())
+
+
+_INDEX_SRC: pd.DataFrame | None = None
+_INDEX: RelaxIndex | None = None
+
+
+def get_relax_index(df_master: pd.DataFrame) -> RelaxIndex:
+    """RelaxIndex per objek master (reload master -> dibangun ulang)."""
+    global _INDEX_SRC, _INDEX
+    if _INDEX_SRC is df_master and _INDEX is not None:
+        return _INDEX
+    index = RelaxIndex(df_master)
+    _INDEX_SRC, _INDEX = df_master, index
+    return index
+
+
+def _window_count(prices: np.ndarray, budget: float) -> int:
+    lo, cap = price_window(budget)
+    return int(np.searchsorted(prices, cap, side="right") - np.searchsorted(prices, lo, side="left"))
+
+
+def _budget_candidates(prices: np.ndarray, budget: float) -> List[float]:
+    """
+    Budget terdekat (kelipatan BUDGET_ROUND) yang jendelanya memuat harga di
+    `prices`: naik -> harga > batas atas, turun -> harga < batas bawah.
+    """
+    lo, cap = price_window(budget)
+    out: List[float] = []
+    up = prices[prices > cap]
+    for b in np.unique(np.ceil(up / PRICE_CAP_FRAC / BUDGET_ROUND) * BUDGET_ROUND)[:BUDGET_TRIES]:
+        out.append(float(b))
+    down = prices[prices < lo]
+    for b in np.unique(np.floor((down + MAX_DOWN) / BUDGET_ROUND) * BUDGET_ROUND)[::-1][:BUDGET_TRIES]:
+        if b > 0:
+            out.append(float(b))
+    return out
+
+
+def relax_search(
+    df_master: pd.DataFrame,
+    budget: float,
+    spec_filters: Dict[str, Any],
+    needs: List[str],
+    verify_max: int = RELAX_VERIFY_MAX,
+) -> Dict[str, Any]:
+    """
+    Diagnosa hasil kosong + daftar relaksasi satu langkah, termurah dulu.
+    Return dict:
+      min_price_overall, min_price_filtered, max_price_filtered,
+      n_filtered, n_filtered_window   (brand/transmisi/BBM, tanpa needs)
+      relaxations: [{"kind", "label", "patch", "count", "exact", "cost", ...}]
+        kind: budget | drop_brand | drop_trans | drop_fuels | drop_need
+        patch: perubahan parsial (format pesan /ws/recommendations)
+        count: kandidat lolos hard constraints (exact=False -> perkiraan katalog)
+      needs_diag: per need (lihat _needs_diag)
+      ms: waktu pencarian
+    """
+    t0 = time.perf_counter()
+    needs = sanitize_needs(needs or [])
+    index = get_relax_index(df_master)
+    # mode skor sama dengan ranking -> RankPrep yang baru dipakai ranking kena cache
+    score_mode = SPK_SCORE_MODE.lower() if SPK_SCORE_MODE.lower() in SCORE_MODES else "relative"
+    prep = get_rank_prep(df_master, needs, spec_filters, score_mode)
+    n = len(df_master)
+    all_rows = np.ones(n, dtype=bool)
+
+    parts: Dict[str, np.ndarray] = {}
+    if prep.brand_mask is not None:
+        parts["brand"] = prep.brand_mask
+    if not prep.trans_mask.all():
+        parts["trans"] = prep.trans_mask
+    if prep.fuel_mask is not None:
+        parts["fuels"] = prep.fuel_mask
+
+    def filter_mask(skip: Optional[str] = None) -> np.ndarray:
+        m = all_rows
+        for k, v in parts.items():
+            if k != skip:
+                m = m & v
+        return m
+
+    f_mask = filter_mask()
+    f_prices = index.prices_of(f_mask)
+    out: Dict[str, Any] = {
+        "min_price_overall": float(index.sorted_price[0]) if index.sorted_price.size else None,
+        "min_price_filtered": float(f_prices[0]) if f_prices.size else None,
+        "max_price_filtered": float(f_prices[-1]) if f_prices.size else None,
+        "n_filtered": int(f_prices.size),
+        "n_filtered_window": _window_count(f_prices, budget),
+        "relaxations": [],
+        "needs_diag": [],
+    }
+
+    # --- calon relaksasi (perkiraan katalog, murah) ---
+    need_mask = index.need_mask(needs)
+    cands: List[Dict[str, Any]] = []
+
+    def add(kind: str, label: str, patch: Dict[str, Any], cost: float, b: float,
+            mask: np.ndarray, c_needs: List[str], nm: np.ndarray, **extra: Any) -> None:
+        approx = _window_count(index.prices_of(mask & nm), b)
+        cands.append({
+            "kind": kind, "label": label, "patch": patch, "cost": round(cost, 3),
+            "count": approx, "exact": False, **extra,
+            "_args": (b, mask, c_needs),
+        })
+
+    # budget: dari mobil yang lolos filter + needs (perkiraan), fallback tanpa needs
+    targets = index.prices_of(f_mask & need_mask)
+    budgets = _budget_candidates(targets, budget) or _budget_candidates(f_prices, budget)
+    for b in budgets:
+        cost = abs(b - budget) / budget * 10.0 * COST_BUDGET_PER_10PCT
+        verb = "Naikkan" if b > budget else "Turunkan"
+        add("budget", f"{verb} budget ke {_fmt_rp(b)}", {"budget": b}, cost, b, f_mask, needs,
+            need_mask, budget=b)
+
+    labels = {
+        "brand": f"Hapus filter brand '{spec_filters.get('brand')}'",
+        "trans": f"Izinkan semua transmisi (bukan hanya '{spec_filters.get('trans_choice')}')",
+        "fuels": "Izinkan semua jenis bahan bakar",
+    }
+    patch_key = {"brand": "brand", "trans": "trans_choice", "fuels": "fuels"}
+    for k in parts:
+        add(f"drop_{k}", labels[k], {"filters": {patch_key[k]: None}}, COST_DROP[k],
+            budget, filter_mask(skip=k), needs, need_mask)
+
+    for need, w in zip(needs, need_weights(needs)):
+        rest = [x for x in needs if x != need]
+        add("drop_need", f"Lepas kebutuhan {_LABEL_NEED.get(need, need)}", {"needs": rest},
+            COST_NEED_BASE + 2.0 * w, budget, f_mask, rest, index.need_mask(rest), need=need)
+
+    # --- verifikasi persis, termurah dulu ---
+    cands.sort(key=lambda c: c["cost"])
+    verified = 0
+    for c in cands:
+        if c["count"] <= 0 or verified >= max(0, int(verify_max)):
+            continue
+        b, mask, c_needs = c["_args"]
+        c["count"] = index.exact_count(b, mask, c_needs)
+        c["exact"] = True
+        verified += 1
+
+    # belum ada yang lolos: budget yang perkiraannya 0 dicoba persis juga
+    # (persentil jendela bisa lebih longgar dari persentil katalog)
+    if not any(c["exact"] and c["count"] > 0 for c in cands):
+        for c in cands:
+            if c["kind"] == "budget" and not c["exact"] and verified < max(0, int(verify_max)):
+                b, mask, c_needs = c["_args"]
+                c["count"] = index.exact_count(b, mask, c_needs)
+                c["exact"] = True
+                verified += 1
+
+    kept = [c for c in cands if c["count"] > 0]
+    # yang sudah terverifikasi di depan, lalu biaya
+    kept.sort(key=lambda c: (not c["exact"], c["cost"]))
+    for c in kept:
+        c.pop("_args", None)
+    out["relaxations"] = kept
+    out["needs_diag"] = _needs_diag(index, budget, needs, f_mask)
+    out["ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+    print(
+        f" [RELAX] budget={budget:,.0f} needs={needs} filter={list(parts)} -> "
+        f"{len(kept)} relaksasi ({verified} diverifikasi) dalam {out['ms']}ms"
+    )
+    return out
+
+
+def _needs_diag(index: RelaxIndex, budget: float, needs: List[str], f_mask: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Per need (perkiraan katalog, need sendirian):
+      total / min_price_all      : lolos filter + need
+      under_cap / min_price_under_cap : ... dan harga <= 115% budget
+      total_loose / min_price_loose   : need saja, tanpa filter brand/transmisi/BBM
+    """
+    _, cap = price_window(budget)
+    diag: List[Dict[str, Any]] = []
+    for need in needs:
+        nm = index.need_mask([need])
+        p = index.prices_of(f_mask & nm)
+        p_cap = p[p <= cap]
+        p_loose = index.prices_of(nm)
+        diag.append({
+            "need": need,
+            "total": int(p.size),
+            "under_cap": int(p_cap.size),
+            "min_price_all": float(p[0]) if p.size else None,
+            "min_price_under_cap": float(p_cap[0]) if p_cap.size else None,
+            "total_loose": int(p_loose.size),
+            "min_price_loose": float(p_loose[0]) if p_loose.size else None,
+        })
+    return diag
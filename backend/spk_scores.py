@@ -0,0 +1,164 @@
+# file: backend/spk_scores.py
+from __future__ import annotations
+from typing import List, Optional
+import re
+
+import numpy as np
+import pandas as pd
+
+from .spk_utils import NEED_LABELS, _series_num
+from .spk_hard import has_turbo_model
+from .spk_features import get_master_features
+from .spk_stats import PercentileStats, get_catalog_stats
+
+# Kolom skor atribut -> urutan NEED_LABELS
+#   perjalanan_jauh=comfort, keluarga=family, fun=perf,
+#   perkotaan=city, niaga=utility, offroad=offroad
+SCORE_MODES = ("relative", "catalog")
+
+
+def need_weights(needs: List[str]) -> List[float]:
+    """Bobot per urutan kebutuhan (maks 3)."""
+    n_needs = len(needs)
+    if n_needs == 0:
+        return []
+    if n_needs == 1:
+        return [1.0]
+    if n_needs == 2:
+        return [0.65, 0.35]
+    return [0.55, 0.30, 0.15]
+
+
+def need_weight_vector(needs: List[str]) -> np.ndarray:
+    """Vektor bobot sepanjang NEED_LABELS (float32) untuk perkalian matriks."""
+    w = np.zeros(len(NEED_LABELS), dtype=np.float32)
+    for need_key, w_val in zip(needs[:3], need_weights(needs)):
+        if need_key in NEED_LABELS:
+            w[NEED_LABELS.index(need_key)] += w_val
+    return w
+
+
+def need_attribute_scores(cand: pd.DataFrame, stats: Optional[PercentileStats] = None) -> pd.DataFrame:
+    """
+    Skor atribut detail per kebutuhan (0..1), dinormalisasi terhadap persentil
+    di `stats` (default: persentil `cand` sendiri = mode relatif kandidat).
+    Kolom mengikuti NEED_LABELS.
+    """
+    if stats is None:
+        stats = PercentileStats(cand)
+
+    def _scale_01(name: str, series: pd.Series) -> pd.Series:
+        s = pd.to_numeric(series, errors="coerce")
+        if stats.values(name, s).size == 0:
+            return pd.Series(0.5, index=series.index, dtype=float)
+        lo = stats.get(name, 5, 0.0, series=s)
+        hi = stats.get(name, 95, 1.0, series=s)
+        span = max(1e-6, hi - lo)
+        return ((s - lo) / span).clip(0, 1)
+
+    length = _series_num(cand.get("length_mm"))
+    width = _series_num(cand.get("width_mm"))
+    wb = _series_num(cand.get("wheelbase_mm"))
+    weight = _series_num(cand.get("vehicle_weight_kg"))
+    cc = _series_num(cand.get("cc_kwh_num"))
+    rim = _series_num(cand.get("rim_inch"))
+    tyr = _series_num(cand.get("tyre_w_mm"))
+    awd = _series_num(cand.get("awd_flag")).fillna(0.0)
+    seats = _series_num(cand.get("seats"))
+    doors = _series_num(cand.get("doors_num"))
+
+    fuel_c = cand.get("fuel_code", pd.Series(["o"] * len(cand), index=cand.index)).astype(str).str.lower()
+    seg = cand.get("segmentasi", pd.Series([""] * len(cand), index=cand.index)).astype(str).str.lower()
+    model = cand.get("model", pd.Series([""] * len(cand), index=cand.index)).astype(str)
+
+    if weight.notna().any():
+        weight_filled = weight.fillna(weight.median())
+    else:
+        weight_filled = weight.fillna(0.0)
+
+    len_norm = _scale_01("length_mm", length)
+    wid_norm = _scale_01("width_mm", width)
+    wgt_norm = _scale_01("weight_filled", weight_filled)
+    wb_norm = _scale_01("wheelbase_mm", wb)
+    cc_norm = _scale_01("cc_kwh_num", cc)
+    rim_norm = _scale_01("rim_inch", rim)
+    tyr_norm = _scale_01("tyre_w_mm", tyr)
+
+    pw_raw = cc / weight_filled.replace(0, np.nan)
+    pw_norm = _scale_01("pw_filled", pw_raw)
+
+    turbo_flag = model.apply(has_turbo_model).astype(float)
+    is_elec_hybrid = fuel_c.isin({"h", "p", "e"}).astype(float)
+    is_diesel = (fuel_c == "d").astype(float)
+
+    # Baseline Scores (Angka kasar sebelum Soft Multiplier)
+    small_size = (0.45 * (1 - len_norm) + 0.45 * (1 - wid_norm) + 0.10 * (1 - wgt_norm))
+    cc_small = 1 - cc_norm
+    efficiency_score = (0.30 * cc_small + 0.20 * (1 - wgt_norm) + 0.50 * is_elec_hybrid).clip(0, 1)
+
+    is_ev = (fuel_c == "e")
+    dim_comp_non_ev = 0.40 * (1 - wid_norm) + 0.30 * (1 - len_norm) + 0.30 * (1 - wgt_norm)
+    dim_comp_ev = 0.30 * (1 - wid_norm) + 0.20 * (1 - len_norm) + 0.50 * (1 - wgt_norm)
+    dim_comp = dim_comp_non_ev.where(~is_ev, dim_comp_ev)
+    efficiency_boost = efficiency_score * (1.05 * is_ev + 1.0 * (~is_ev))
+    city_score = (0.40 * dim_comp + 0.60 * efficiency_boost).clip(0, 1)
+
+    sedan_mask = seg.str.contains(r"\bsedan\b", flags=re.I, regex=True)
+    sedan_allow = sedan_mask & (width >= 1650)
+    city_score = city_score + (0.02 * sedan_allow.astype(float))
+    city_score = city_score.clip(0, 1)
+
+    perf_score = (0.50 * pw_norm + 0.15 * rim_norm + 0.10 * turbo_flag + 0.10 * tyr_norm + 0.15 * (awd > 0.5).astype(float)).clip(0, 1)
+
+    seats_capped = seats.clip(upper=9)
+    seats_norm = _scale_01("seats_capped", seats_capped)
+    doors_good = (doors >= 5).astype(float)
+    mpv_like = seg.str.contains(r"\b(?:mpv|van|minibus)\b", flags=re.I, regex=True).astype(float)
+
+    family_score = (0.50 * seats_norm + 0.30 * doors_good + 0.20 * mpv_like).clip(0, 1)
+    seats_ge6 = (seats >= 6)
+    family_score = family_score + (0.08 * seats_ge6.astype(float)) 
+    seats_eq5 = (seats == 5)
+    seats_eq5_ok = seats_eq5 & ((width >= 1700) | (wb >= 2500) | (mpv_like == 1.0))
+    family_score = family_score + (0.03 * seats_eq5_ok.astype(float))
+    family_score = family_score.clip(0, 1)
+
+    if length.notna().any():
+        len_p80 = stats.get("length_mm", 80, -np.inf)
+        too_long = length > len_p80
+        family_score[too_long & (seats >= 9)] *= 0.95
+
+    comfort_score = (0.40 * wb_norm + 0.20 * wgt_norm + 0.20 * len_norm + 0.20 * (is_diesel * 0.8 + efficiency_score * 0.2)).clip(0, 1)
+    suv_pickup = seg.str.contains(r"\b(?:suv|crossover|pick|truck|pickup)\b", flags=re.I, regex=True).astype(float)
+    offroad_score = (0.45 * (awd.clip(0, 1)) + 0.25 * tyr_norm + 0.15 * rim_norm + 0.15 * suv_pickup).clip(0, 1)
+    utility_score = (0.5 * len_norm + 0.5 * wgt_norm).clip(0, 1)
+
+    return pd.DataFrame({
+        "perjalanan_jauh": comfort_score,
+        "keluarga": family_score,
+        "fun": perf_score,
+        "perkotaan": city_score,
+        "niaga": utility_score,
+        "offroad": offroad_score,
+    }, index=cand.index)[NEED_LABELS]
+
+
+# ============================================================
+# Matriks skor atribut seluruh katalog (mode "catalog")
+# ============================================================
+# Dihitung sekali per objek master terhadap persentil seluruh katalog;
+# request cukup gather baris kandidat + perkalian matriks-vektor.
+_MATRIX_SRC: pd.DataFrame | None = None
+_MATRIX: np.ndarray | None = None
+
+
+def get_need_score_matrix(df_master: pd.DataFrame) -> np.ndarray:
+    """Matriks N x 6 (float32), baris sejajar posisi df_master, kolom NEED_LABELS."""
+    global _MATRIX_SRC, _MATRIX
+    if _MATRIX_SRC is df_master and _MATRIX is not None:
+        return _MATRIX
+    feat = get_master_features(df_master)
+    scores = need_attribute_scores(feat, get_catalog_stats(df_master))
+    M = np.ascontiguousarray(scores.fillna(0.0).to_numpy(dtype=np.float32))
+    _MATRIX_SRC, _MATRIX = df_master, M
+    return M
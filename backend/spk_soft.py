@@ -8,6 +8,7 @@ import pandas as pd
 
 from .spk_utils import SEG_SEDAN, SEG_HATCH, SEG_COUPE, SEG_MPV, SEG_SUV, SEG_PICKUP
 from .spk_hard import has_turbo_model
+from .spk_stats import PercentileStats
 
 
 def _safe_to_float(x) -> float:
@@ -25,40 +26,32 @@ def _safe_to_float(x) -> float:
         return np.nan
 
 
-def compute_percentiles(df: pd.DataFrame) -> Dict[str, float]:
-    def P(series: Optional[pd.Series], q: float, default: float) -> float:
-        if series is None: return float(default)
-        s = pd.to_numeric(series, errors="coerce").dropna()
-        if s.empty: return float(default)
-        try: return float(np.nanpercentile(s.values, q))
-        except Exception: return float(default)
-
-    cc_s = df.get("cc_kwh_num")
-    wgt_s = df.get("vehicle_weight_kg")
-    pw_series = None
-    if cc_s is not None and wgt_s is not None:
-        wgt_safe = pd.to_numeric(wgt_s, errors="coerce").replace({0: np.nan})
-        cc_num = pd.to_numeric(cc_s, errors="coerce")
-        with np.errstate(divide="ignore", invalid="ignore"):
-            pw_series = (cc_num / wgt_safe).replace([np.inf, -np.inf], np.nan)
+def compute_percentiles(df: pd.DataFrame, stats: Optional[PercentileStats] = None) -> Dict[str, float]:
+    """
+    Persentil untuk soft_multiplier. Bila `stats` (PercentileStats atas df yang
+    sama) diberikan, nilai diambil dari sana sehingga tidak dihitung ulang.
+    """
+    if stats is None:
+        stats = PercentileStats(df)
+    P = stats.get
 
     return {
-        "len_p40": P(df.get("length_mm"), 40, np.inf),
-        "len_p50": P(df.get("length_mm"), 50, np.inf),
-        "len_p60": P(df.get("length_mm"), 60, -np.inf),
-        "len_p70": P(df.get("length_mm"), 70, -np.inf),
-        "len_p80": P(df.get("length_mm"), 80, -np.inf),
-        "len_p90": P(df.get("length_mm"), 90, np.inf),
-        "wid_p40": P(df.get("width_mm"), 40, np.inf),
-        "wid_p50": P(df.get("width_mm"), 50, np.inf),
-        "wid_p60": P(df.get("width_mm"), 60, -np.inf),
-        "wgt_p50": P(df.get("vehicle_weight_kg"), 50, np.inf),
-        "wgt_p60": P(df.get("vehicle_weight_kg"), 60, -np.inf),
-        "wb_p60":  P(df.get("wheelbase_mm"), 60, -np.inf),
-        "wb_p70":  P(df.get("wheelbase_mm"), 70, -np.inf),
-        "rim_p60": P(df.get("rim_inch"), 60, -np.inf),
-        "tyr_p60": P(df.get("tyre_w_mm"), 60, -np.inf),
-        "pw_p60":  P(pw_series, 60, -np.inf),
+        "len_p40": P("length_mm", 40, np.inf),
+        "len_p50": P("length_mm", 50, np.inf),
+        "len_p60": P("length_mm", 60, -np.inf),
+        "len_p70": P("length_mm", 70, -np.inf),
+        "len_p80": P("length_mm", 80, -np.inf),
+        "len_p90": P("length_mm", 90, np.inf),
+        "wid_p40": P("width_mm", 40, np.inf),
+        "wid_p50": P("width_mm", 50, np.inf),
+        "wid_p60": P("width_mm", 60, -np.inf),
+        "wgt_p50": P("vehicle_weight_kg", 50, np.inf),
+        "wgt_p60": P("vehicle_weight_kg", 60, -np.inf),
+        "wb_p60":  P("wheelbase_mm", 60, -np.inf),
+        "wb_p70":  P("wheelbase_mm", 70, -np.inf),
+        "rim_p60": P("rim_inch", 60, -np.inf),
+        "tyr_p60": P("tyre_w_mm", 60, -np.inf),
+        "pw_p60":  P("pw", 60, -np.inf),
     }
 
 
@@ -0,0 +1,120 @@
+# file: backend/spk_stats.py
+from __future__ import annotations
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .spk_features import get_master_features
+
+# ============================================================
+# Rencana persentil per kolom
+# ============================================================
+# Gabungan semua persentil yang dipakai tahap hard (spk_hard), scoring
+# (rank_candidates: _scale_01, len p80, price p10/p90) dan soft (spk_soft).
+# Satu kolom -> satu panggilan np.nanpercentile untuk seluruh q di sini.
+QUANTILE_PLAN: Dict[str, Tuple[float, ...]] = {
+    "length_mm":         (5, 10, 40, 50, 60, 70, 80, 90, 95),
+    "width_mm":          (5, 10, 40, 50, 60, 95),
+    "vehicle_weight_kg": (50, 60, 90),
+    "wheelbase_mm":      (5, 60, 70, 95),
+    "cc_kwh_num":        (5, 95),
+    "rim_inch":          (5, 60, 95),
+    "tyre_w_mm":         (5, 60, 95),
+    "price":             (10, 90),
+    "pw":                (55, 60),
+    # turunan khusus scoring (series dikirim oleh pemanggil)
+    "weight_filled":     (5, 95),
+    "pw_filled":         (5, 95),
+    "seats_capped":      (5, 95),
+}
+
+
+def _pw_raw(df: pd.DataFrame) -> Optional[pd.Series]:
+    """Power-to-weight kasar cc / berat (berat 0 -> NaN), sama seperti spk_hard/spk_soft."""
+    cc = df.get("cc_kwh_num")
+    wgt = df.get("vehicle_weight_kg")
+    if cc is None or wgt is None:
+        return None
+    w = pd.to_numeric(wgt, errors="coerce").replace(0, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pw = pd.to_numeric(cc, errors="coerce") / w
+    return pw.replace([np.inf, -np.inf], np.nan)
+
+
+DERIVED: Dict[str, Callable[[pd.DataFrame], Optional[pd.Series]]] = {
+    "pw": _pw_raw,
+}
+
+
+class PercentileStats:
+    """
+    Statistik persentil untuk satu set kandidat (satu frame).
+
+    - Kolom dibaca lazy saat pertama diminta, lalu semua q di QUANTILE_PLAN
+      untuk kolom itu dihitung sekaligus dalam satu np.nanpercentile.
+    - Kolom turunan: lihat DERIVED, atau kirim `series` langsung (nama dipakai
+      sebagai kunci cache; pemanggil pertama yang menentukan nilainya).
+    - Bila kolom tidak punya nilai valid, get() mengembalikan `default`.
+    """
+
+    def __init__(self, df: pd.DataFrame, plan: Optional[Dict[str, Tuple[float, ...]]] = None):
+        self.df = df
+        self.plan = plan or QUANTILE_PLAN
+        self._values: Dict[str, np.ndarray] = {}
+        self._q: Dict[str, Dict[float, float]] = {}
+
+    def values(self, name: str, series: Optional[pd.Series] = None) -> np.ndarray:
+        """Nilai numerik valid (NaN dibuang) untuk kolom/turunan `name`."""
+        if name in self._values:
+            return self._values[name]
+        if series is None:
+            builder = DERIVED.get(name)
+            series = builder(self.df) if builder is not None else self.df.get(name)
+        if series is None:
+            a = np.array([], dtype=float)
+        else:
+            a = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+            a = a[~np.isnan(a)]
+        self._values[name] = a
+        return a
+
+    def quantiles(self, name: str, series: Optional[pd.Series] = None) -> Dict[float, float]:
+        """Semua persentil terencana untuk `name` (dict kosong bila tidak ada data)."""
+        if name in self._q:
+            return self._q[name]
+        a = self.values(name, series)
+        qs = self.plan.get(name, ())
+        out: Dict[float, float] = {}
+        if a.size and qs:
+            out = dict(zip(qs, (float(v) for v in np.nanpercentile(a, qs))))
+        self._q[name] = out
+        return out
+
+    def get(self, name: str, q: float, default: float, series: Optional[pd.Series] = None) -> float:
+        qs = self.quantiles(name, series)
+        a = self.values(name, series)
+        if a.size == 0:
+            return float(default)
+        if q not in qs:
+            # q di luar rencana -> hitung sekali lalu simpan
+            qs[q] = float(np.nanpercentile(a, q))
+        return qs[q]
+
+
+# ============================================================
+# Statistik seluruh katalog (di-cache per objek master)
+# ============================================================
+# Objek master baru (reload_master_data) = versi baru -> statistik dihitung ulang.
+_CATALOG_SRC: pd.DataFrame | None = None
+_CATALOG_STATS: PercentileStats | None = None
+
+
+def get_catalog_stats(df_master: pd.DataFrame) -> PercentileStats:
+    """PercentileStats atas fitur seluruh master; dipakai ulang antar request."""
+    global _CATALOG_SRC, _CATALOG_STATS
+    if _CATALOG_SRC is df_master and _CATALOG_STATS is not None:
+        return _CATALOG_STATS
+    stats = PercentileStats(get_master_features(df_master))
+    _CATALOG_SRC, _CATALOG_STATS = df_master, stats
+    return stats
@@ -0,0 +1,150 @@
+# file: backend/spk_sweep.py
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cancellation import CancelToken
+from .config import SPK_SCORE_MODE, SWEEP_MAX_POINTS
+from .spk_needs import sanitize_needs
+from .spk_rank import (
+    ALPHA_PRICE,
+    Deadline,
+    cluster_stage,
+    dedup_keys,
+    dedup_order,
+    get_rank_prep,
+    hard_stage,
+    pref_scores,
+    price_fit_scores,
+    price_window,
+    reason_text,
+    soft_stage,
+)
+from .spk_scores import SCORE_MODES
+from .spk_stats import PercentileStats
+
+# ============================================================
+# Sapuan budget (prefetch slider)
+# ============================================================
+# Satu pass untuk sekumpulan budget dengan needs + filter tetap:
+#   - mask brand/transmisi/fuel, hard constraints, klaster, skor atribut dan
+#     soft/style dihitung SEKALI atas jendela harga gabungan semua budget;
+#   - per budget hanya jendela harga, price_fit, dedup dan alasan.
+# Statistik persentil (hard constraints, klaster, skor relatif) diambil dari
+# jendela gabungan, jadi hasil per budget adalah pratinjau yang bisa sedikit
+# berbeda dari rank_candidates pada budget yang sama.
+
+
+def budget_grid(center: float, span_frac: float = 0.2, step: float = 10_000_000.0,
+                max_points: int = SWEEP_MAX_POINTS) -> List[float]:
+    """Budget center ± span_frac dalam kelipatan step (center selalu ikut)."""
+    if center <= 0:
+        return []
+    step = max(1.0, float(step))
+    span = max(0.0, float(span_frac)) * center
+    # jumlah langkah tiap sisi dibatasi supaya total titik <= max_points
+    k = min(int(span // step), max(0, (int(max_points) - 1) // 2))
+    return [center + i * step for i in range(-k, k + 1) if center + i * step > 0]
+
+
+def sweep_budgets(
+    df_master: pd.DataFrame,
+    budgets: List[float],
+    spec_filters: Dict[str, Any],
+    needs: List[str],
+    topn: int = 6,
+    score_mode: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Return (cars, grid):
+      cars: frame baris kandidat yang muncul di top-n salah satu budget
+            (posisi baris = "i" di grid).
+      grid: per budget menaik {"budget", "count", "rows": [{"i", "rank",
+            "fit_score", "points", "spk_reason"}]}.
+    """
+    t0 = time.perf_counter()
+    check = cancel.check if cancel is not None else (lambda stage: None)
+    score_mode = (score_mode or SPK_SCORE_MODE).lower()
+    if score_mode not in SCORE_MODES:
+        score_mode = "relative"
+    needs = sanitize_needs(needs or [])
+    budgets = sorted({float(b) for b in budgets if b and b > 0})
+    topn = 15 if (topn is None or topn <= 0) else int(topn)
+    empty = [{"budget": b, "count": 0, "rows": []} for b in budgets]
+    if not budgets:
+        return df_master.iloc[0:0], empty
+
+    prep = get_rank_prep(df_master, needs, spec_filters, score_mode)
+
+    check("filter")
+    lo_all, _ = price_window(budgets[0])
+    _, cap_all = price_window(budgets[-1])
+    price_all = pd.to_numeric(df_master["price"], errors="coerce").to_numpy(dtype=float)
+    idx = np.flatnonzero((price_all <= cap_all) & (price_all >= lo_all))
+    if prep.brand_mask is not None:
+        idx = idx[prep.brand_mask[idx]]
+    idx = idx[prep.trans_mask[idx]]
+    if prep.fuel_mask is not None:
+        idx = idx[prep.fuel_mask[idx]]
+    print(f" [SWEEP] {len(budgets)} budget {budgets[0]:,.0f}..{budgets[-1]:,.0f} -> jendela gabungan {len(idx)} mobil")
+    if idx.size == 0:
+        return df_master.iloc[0:0], empty
+
+    # --- tahap yang tidak bergantung budget (sekali) ---
+    check("hard_constraints")
+    idx, cand_feat = hard_stage(df_master, idx, needs)
+    if idx.size == 0:
+        return df_master.iloc[0:0], empty
+
+    check("cluster")
+    no_deadline = Deadline(None)
+    cand = cluster_stage(df_master, idx, cand_feat, needs, no_deadline, [])
+    stats = PercentileStats(cand)
+
+    check("score")
+    pref = pref_scores(cand, idx, needs, prep, score_mode, stats).to_numpy(dtype=float)
+
+    check("soft")
+    soft_stage(cand, idx, needs, prep, stats, no_deadline, [])
+    mult = (cand["soft_mult"] * cand["style_mult"]).to_numpy(dtype=float)
+
+    keys = dedup_keys(cand)
+    price = pd.to_numeric(cand["price"], errors="coerce").to_numpy(dtype=float)
+
+    # --- per budget: jendela harga + price_fit + dedup ---
+    used: Dict[int, int] = {}
+    grid: List[Dict[str, Any]] = []
+    for b in budgets:
+        check("sweep")
+        lo, cap = price_window(b)
+        w = np.flatnonzero((price <= cap) & (price >= lo))
+        if w.size == 0:
+            grid.append({"budget": b, "count": 0, "rows": []})
+            continue
+        p_w = pd.Series(price[w])
+        price_fit = price_fit_scores(p_w, b, PercentileStats(pd.DataFrame({"price": p_w}))).to_numpy()
+        fit = np.clip(np.clip((1.0 - ALPHA_PRICE) * pref[w] + ALPHA_PRICE * price_fit, 0, 1) * mult[w], 0, 1.0)
+
+        order = dedup_order(keys.iloc[w], fit)
+        n_out = len(order)
+        points = np.round(np.linspace(99, 60, num=n_out)).astype(int) if n_out > 1 else np.full(n_out, 99, dtype=int)
+        fit_at = dict(zip(w.tolist(), fit.tolist()))
+        rows = []
+        for r, pos in enumerate(order[:topn].tolist()):
+            rows.append({
+                "i": used.setdefault(pos, len(used)),
+                "rank": r + 1,
+                "fit_score": round(fit_at[pos], 4),
+                "points": int(points[r]),
+                "spk_reason": reason_text(cand.iloc[pos], b, needs),
+            })
+        grid.append({"budget": b, "count": len(rows), "rows": rows})
+
+    cars = cand.take(list(used)).reset_index(drop=True)
+    print(f" [SWEEP] selesai dalam {time.perf_counter() - t0:.2f}s ({len(cars)} mobil unik)")
+    return cars, grid
@@ -285,3 +285,20 @@ def price_fit_anchor(price: float, budget: float, pmax_cand: float) -> float:
 
     # Fallback
     return 0.0
+
+
+def price_fit_anchor_array(price: np.ndarray, budget: float) -> np.ndarray:
+    """price_fit_anchor untuk satu array harga sekaligus (hasil identik per elemen)."""
+    p = np.asarray(price, dtype=float)
+    out = np.zeros(p.shape, dtype=float)
+    if not np.isfinite(budget) or budget <= 0:
+        return out
+    cap_hi = 1.15 * budget
+    lower_limit = budget - 100_000_000.0
+    denom = (budget - lower_limit) if (budget - lower_limit) > 0 else 1.0
+    with np.errstate(invalid="ignore"):
+        above = np.isfinite(p) & (p > budget) & (p < cap_hi)
+        inside = np.isfinite(p) & (p >= lower_limit) & (p <= budget)
+    out[above] = np.maximum(0.0, 1.0 - (p[above] - budget) / (cap_hi - budget))
+    out[inside] = 0.5 + 0.5 * ((p[inside] - lower_limit) / denom)
+    return out
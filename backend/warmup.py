@@ -0,0 +1,203 @@
+# file: backend/warmup.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from .config import WARMUP_WORKERS
+
+# ============================================================
+# Warmup saat startup + status kesiapan (/ready)
+# ============================================================
+# Urutan:
+#   tahap 1 (paralel): master, images, sklearn (+ local_nlu bila AI_MODE=CLASSIFIER)
+#   tahap 2 (butuh master): features
+#   tahap 3 (paralel, butuh features): stats, score_matrix, cluster_model
+#   tahap 4: rank_probe (satu ranking contoh -> semua jalur panas)
+# Hanya kegagalan langkah wajib (master, features) yang membuat worker tidak ready.
+
+REQUIRED_STEPS = {"master", "features"}
+
+
+class WarmupStatus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "idle"          # idle | running | ready | failed | off
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def _set(self, name: str, **kw) -> None:
+        with self._lock:
+            self.steps.setdefault(name, {}).update(kw)
+
+    def mark_off(self) -> None:
+        """WARMUP_MODE=off: tidak ada warmup; /ready hanya mengecek master."""
+        with self._lock:
+            if self.state == "idle":
+                self.state = "off"
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = None
+            if self.started_at is not None:
+                total = round((self.finished_at or time.time()) - self.started_at, 3)
+            return {
+                "ready": self.state == "ready",
+                "state": self.state,
+                "seconds": total,
+                "steps": {k: dict(v) for k, v in self.steps.items()},
+            }
+
+
+WARMUP = WarmupStatus()
+
+
+def _run_step(name: str, fn: Callable[[], Any]) -> bool:
+    WARMUP._set(name, status="running")
+    t0 = time.perf_counter()
+    try:
+        info = fn()
+        WARMUP._set(name, status="ok", seconds=round(time.perf_counter() - t0, 3), info=info)
+        return True
+    except Exception as e:
+        WARMUP._set(name, status="error", seconds=round(time.perf_counter() - t0, 3), error=str(e))
+        print(f"[WARMUP] langkah '{name}' gagal: {e}")
+        return False
+
+
+def _run_parallel(steps: Dict[str, Callable[[], Any]]) -> Dict[str, bool]:
+    if len(steps) == 1 or WARMUP_WORKERS <= 1:
+        return {name: _run_step(name, fn) for name, fn in steps.items()}
+    with ThreadPoolExecutor(max_workers=min(WARMUP_WORKERS, len(steps)), thread_name_prefix="warmup") as ex:
+        futs = {name: ex.submit(_run_step, name, fn) for name, fn in steps.items()}
+        return {name: f.result() for name, f in futs.items()}
+
+
+# ------------------------- langkah-langkah -------------------------
+def _step_master() -> Dict[str, Any]:
+    from .data_loader import get_master_data
+    df = get_master_data()
+    if df is None or df.empty:
+        raise RuntimeError("master kosong")
+    return {"rows": int(len(df))}
+
+
+def _step_images() -> Dict[str, Any]:
+    from .images import _index_fs_lower, _manual_map_canon, reload_images
+    n = reload_images()
+    idx = _index_fs_lower()
+    manual = _manual_map_canon()
+    print(f"[images] reindexed: {n}")
+    return {"files": int(n), "indexed": len(idx), "manual_map": len(manual)}
+
+
+def _step_sklearn() -> Dict[str, Any]:
+    # impor berat (scipy/threadpool) dibayar di sini, bukan di request pertama
+    import sklearn.cluster  # noqa: F401
+    import sklearn.metrics  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+    return {}
+
+
+def _step_local_nlu() -> Dict[str, Any]:
+    # AI_MODE="CLASSIFIER": muat model NLU lokal (joblib + sklearn) sebelum chat pertama
+    from .nlu_model import get_local_nlu
+    model = get_local_nlu()
+    if model is None:
+        raise RuntimeError("model NLU lokal tidak ada / gagal dimuat")
+    model.predict_labels(["cari mobil keluarga matic"])
+    return {"n_train": model.meta.get("n_train")}
+
+
+def _step_features() -> Dict[str, Any]:
+    from .data_loader import get_master_data
+    from .spk_features import get_master_features
+    feat = get_master_features(get_master_data())
+    return {"cols": int(feat.shape[1])}
+
+
+def _step_stats() -> Dict[str, Any]:
+    from .data_loader import get_master_data
+    from .spk_stats import QUANTILE_PLAN, get_catalog_stats
+    stats = get_catalog_stats(get_master_data())
+    for name in QUANTILE_PLAN:
+        stats.quantiles(name)
+    return {}
+
+
+def _step_score_matrix() -> Dict[str, Any]:
+    from .data_loader import get_master_data
+    from .spk_scores import get_need_score_matrix
+    M = get_need_score_matrix(get_master_data())
+    return {"shape": list(M.shape)}
+
+
+def _step_cluster_model() -> Dict[str, Any]:
+    from .data_loader import get_master_data
+    from .klastering import get_catalog_cluster_model, get_catalog_projection
+    master = get_master_data()
+    report = get_catalog_cluster_model(master).report()
+    # proyeksi katalog untuk jalur deadline (rank_candidates deadline_ms)
+    get_catalog_projection(master)
+    return report
+
+
+def _step_rank_probe() -> Dict[str, Any]:
+    import numpy as np
+    from .data_loader import get_master_data
+    from .spk_rank import rank_candidates
+    master = get_master_data()
+    price = np.asarray(master["price"], dtype=float) if "price" in master.columns else np.array([])
+    price = price[np.isfinite(price)]
+    budget = float(np.median(price)) if price.size else 300_000_000.0
+    out = rank_candidates(master, budget, {}, ["keluarga"], 6)
+    return {"budget": budget, "rows": int(len(out))}
+
+
+def run_warmup() -> bool:
+    """Jalankan seluruh warmup (blocking). Return True bila worker siap."""
+    with WARMUP._lock:
+        if WARMUP.state == "running":
+            return False
+        WARMUP.state = "running"
+        WARMUP.started_at = time.time()
+        WARMUP.finished_at = None
+        WARMUP.steps = {}
+
+    results: Dict[str, bool] = {}
+    stage1: Dict[str, Callable[[], Any]] = {"master": _step_master, "images": _step_images, "sklearn": _step_sklearn}
+    if os.getenv("AI_MODE", "CLOUD").strip().upper() == "CLASSIFIER":
+        stage1["local_nlu"] = _step_local_nlu
+    plan: List[Dict[str, Callable[[], Any]]] = [
+        stage1,
+        {"features": _step_features},
+        {"stats": _step_stats, "score_matrix": _step_score_matrix, "cluster_model": _step_cluster_model},
+        {"rank_probe": _step_rank_probe},
+    ]
+    for stage in plan:
+        if not all(results.get(s, True) for s in REQUIRED_STEPS):
+            for name in stage:
+                WARMUP._set(name, status="skipped")
+            continue
+        results.update(_run_parallel(stage))
+
+    ok = all(results.get(s, False) for s in REQUIRED_STEPS)
+    with WARMUP._lock:
+        WARMUP.finished_at = time.time()
+        WARMUP.state = "ready" if ok else "failed"
+    print(f"[WARMUP] selesai state={WARMUP.state} dalam {WARMUP.finished_at - WARMUP.started_at:.2f}s")
+    return ok
+
+
+def start_warmup_background() -> threading.Thread:
+    t = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    t.start()
+    return t
@@ -1,9 +1,10 @@
 "use client";
 
-import React, { useEffect, useMemo, useState } from "react";
+import React, { useEffect, useMemo, useRef, useState } from "react";
 import { motion } from "framer-motion";
-import { Theme, RecommendResponse, MetaResponse } from "@/types/index";
+import { Theme, RecommendResponse, MetaResponse, BudgetSweepResponse } from "@/types/index";
 import { API_BASE, BUDGET_MIN } from "@/constants";
+import { getSessionId } from "@/utils";
 import { BudgetField } from "./BudgetField";
 import { NeedsPicker } from "./NeedsPicker";
 import { FuelPicker } from "./FuelPicker";
@@ -45,6 +46,31 @@ type FormState = {
   filters: FiltersState | Record<string, never>;
 };
 
+type SweepCache = {
+  key: string;
+  budget: number;               // budget submit terakhir -> pakai hasil persis
+  res: BudgetSweepResponse;
+  exact: RecommendResponse;
+};
+
+// titik grid terdekat -> bentuk respons /recommendations (item = mobil statis + skor per budget)
+const sweepToResponse = (s: BudgetSweepResponse, budget: number): RecommendResponse | null => {
+  if (!s.grid.length) return null;
+  const lo = s.grid[0].budget;
+  const hi = s.grid[s.grid.length - 1].budget;
+  if (budget < lo || budget > hi) return null;
+  const point = s.grid.reduce((a, b) =>
+    Math.abs(b.budget - budget) < Math.abs(a.budget - budget) ? b : a,
+  );
+  return {
+    count: point.count,
+    items: point.rows.map(({ i, ...r }) => ({ ...s.cars[i], ...r })),
+    needs: s.needs,
+    budget: point.budget,
+    approx: true,
+  };
+};
+
 export function RecommendationForm({
   theme,
   loading,
@@ -73,6 +99,18 @@ export function RecommendationForm({
   const [selectedNeeds, setSelectedNeeds] = useState<string[]>([]);
   const [fuelError, setFuelError] = useState<string | null>(null);
   const [needsError, setNeedsError] = useState<string | null>(null);
+  const inflightRef = useRef<AbortController | null>(null);
+  const sweepRef = useRef<SweepCache | null>(null);
+  const sweepCtrlRef = useRef<AbortController | null>(null);
+
+  // input selain budget; sweep hanya berlaku selama ini tidak berubah
+  const sweepKey = JSON.stringify({
+    needs: selectedNeeds,
+    trans: (form.filters as FiltersState).trans_choice || "",
+    brand,
+    fuels: (form.filters as FiltersState).fuels || [],
+    topn: form.topn,
+  });
 
   // ---------------- Fuel Options ----------------
   const fuelOptions: FuelOption[] = useMemo(() => {
@@ -186,6 +224,41 @@ export function RecommendationForm({
     });
   };
 
+  // Setelah submit: ambil top-n untuk grid budget di sekitar budget submit,
+  // lalu gerakan slider dijawab lokal dari grid tanpa request baru.
+  async function prefetchSweep(body: Record<string, unknown>, key: string, exact: RecommendResponse) {
+    sweepCtrlRef.current?.abort();
+    const ctrl = new AbortController();
+    sweepCtrlRef.current = ctrl;
+    sweepRef.current = null;
+    try {
+      const res = await fetch(`${API_BASE}/recommendations/sweep`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body),
+        signal: ctrl.signal,
+      });
+      if (!res.ok || sweepCtrlRef.current !== ctrl) return;
+      const s = (await res.json()) as BudgetSweepResponse;
+      if (sweepCtrlRef.current === ctrl) {
+        sweepRef.current = { key, budget: body.budget as number, res: s, exact };
+      }
+    } catch {
+      // prefetch opsional: gagal -> slider kembali perlu submit
+    }
+  }
+
+  useEffect(() => {
+    const sw = sweepRef.current;
+    if (!sw || sw.key !== sweepKey) return;
+    if (form.budget === sw.budget) {
+      setData(sw.exact);
+      return;
+    }
+    const preview = sweepToResponse(sw.res, form.budget);
+    if (preview) setData(preview);
+  }, [form.budget, sweepKey]); // eslint-disable-line react-hooks/exhaustive-deps
+
   async function handleSubmit(e: React.FormEvent) {
     e.preventDefault();
     setError(null);
@@ -201,6 +274,14 @@ export function RecommendationForm({
 
     setLoading(true);
 
+    // submit baru membatalkan request sebelumnya -> server berhenti ranking;
+    // grid sweep lama tidak dipakai lagi
+    inflightRef.current?.abort();
+    sweepCtrlRef.current?.abort();
+    sweepRef.current = null;
+    const ctrl = new AbortController();
+    inflightRef.current = ctrl;
+
     try {
       const body = {
         budget: form.budget,
@@ -212,9 +293,11 @@ export function RecommendationForm({
           brand: brand || undefined,
           fuels: selectedFuels,
         },
+        // payload lengkap hanya untuk DevPanel
+        debug: process.env.NEXT_PUBLIC_DEBUG === "1",
+        session_id: getSessionId(),
       };
 
-      const ctrl = new AbortController();
       const t = setTimeout(() => ctrl.abort(), 20000);
 
       const res = await fetch(`${API_BASE}/recommendations`, {
@@ -229,24 +312,36 @@ export function RecommendationForm({
       });
 
       clearTimeout(t);
+      if (inflightRef.current !== ctrl) return;
 
       if (!res.ok) throw new Error((await res.text()) || `HTTP ${res.status}`);
 
       const j = (await res.json()) as RecommendResponse;
       setData(j);
       setIsSearched(true);
+      if (j.count > 0) {
+        const { debug: _debug, session_id: _sid, ...sweepBody } = body;
+        void prefetchSweep(sweepBody, sweepKey, j);
+      }
     } catch (err: any) {
+      // digantikan submit yang lebih baru: bukan error bagi user
+      if (inflightRef.current !== ctrl) return;
       if (err?.name === "AbortError") {
         setError("Permintaan timeout. Coba lagi atau perkecil filter.");
       } else {
         setError(err?.message || "Terjadi kesalahan");
       }
     } finally {
-      setLoading(false);
+      if (inflightRef.current === ctrl) {
+        inflightRef.current = null;
+        setLoading(false);
+      }
     }
   }
 
   const handleReset = () => {
+    sweepCtrlRef.current?.abort();
+    sweepRef.current = null;
     setForm({
       budget: pickBudget(meta),
       topn: DEFAULT_TOPN,
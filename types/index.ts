@@ -33,6 +33,9 @@ export interface RecommendItem {
   seats?: number | null;
   cc_kwh?: number | string | null; // <- aman kalau backend kirim string
   alasan?: string | null;
+  spk_reason?: string | null;
+  fuel_label?: string | null;
+  rank?: number | null;
 }
 
 export interface RecommendResponse {
@@ -42,6 +45,27 @@ export interface RecommendResponse {
   message?: string;
   budget?: number;     // dipakai untuk CarCard
   needs?: string[];
+  degraded?: boolean;          // true = ranking dipangkas karena deadline_ms
+  degraded_stages?: string[];  // tahap yang dilewati/didekati
+  approx?: boolean;            // true = pratinjau dari /recommendations/sweep
+}
+
+// ====== Sweep budget (prefetch slider) ======
+export interface SweepRow {
+  i: number;                   // indeks ke BudgetSweepResponse.cars
+  rank: number;
+  fit_score: number;
+  points: number;
+  spk_reason?: string | null;
+}
+
+export interface BudgetSweepResponse {
+  budgets: number[];
+  needs: string[];
+  topn: number;
+  approx: boolean;
+  cars: RecommendItem[];       // kolom statis per mobil
+  grid: { budget: number; count: number; rows: SweepRow[] }[];
 }
 
 // ====== UI Types ======
@@ -96,4 +120,8 @@ export interface RecommendRequest {
     brand?: string;
     fuels?: FuelCode[];   // <- multi-select fuel yang dikirim ke API
   };
+  fields?: string[];      // <- proyeksi kolom item (default: set ringkas)
+  debug?: boolean;        // <- true = semua kolom (DevPanel)
+  session_id?: string;    // <- kunci hasil per sesi (mode analyst chat)
+  deadline_ms?: number;   // <- batas waktu ranking (hasil boleh terdegradasi)
 }
@@ -83,4 +83,24 @@ export const storage = {
       console.warn('Local storage remove failed:', error);
     }
   }
-};
\ No newline at end of file
+};
+// Session id per tab (dikirim ke /recommendations & /chat agar mode analyst
+// memakai hasil rekomendasi milik sesi ini sendiri)
+const SESSION_KEY = "vroom_session_id";
+
+export function getSessionId(): string {
+  if (typeof window === "undefined") return "";
+  try {
+    let sid = sessionStorage.getItem(SESSION_KEY);
+    if (!sid) {
+      sid =
+        typeof crypto !== "undefined" && "randomUUID" in crypto
+          ? crypto.randomUUID()
+          : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+      sessionStorage.setItem(SESSION_KEY, sid);
+    }
+    return sid;
+  } catch {
+    return "";
+  }
+}